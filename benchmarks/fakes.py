@@ -0,0 +1,333 @@
+"""
+Offline stand-ins for Yahoo Finance and BigQuery, used by the benchmarks.
+
+- SyntheticYahoo generates daily or intraday price histories on the exchange calendar and sector info,
+  with configurable latency, error rate, rate of bad rows (missing closes, inconsistent OHLC, price
+  spikes) and rate of dividends. Intraday requests older than the Yahoo Finance lookback of the interval are rejected.
+- RecordingYahoo wraps the real yfinance module and stores every response on disk,
+  and ReplayYahoo serves those recorded responses back without network access.
+- FakeBigQueryClient implements the subset of bigquery.Client used by the ETL. It only keeps
+  per-ticker watermarks and row counts, so it doesn't add the warehouse to the measured memory.
+"""
+import hashlib
+import io
+import json
+import os
+import random
+import re
+import threading
+import time
+import types
+from datetime import date, timedelta
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+from google.api_core.exceptions import NotFound
+from utils.intervals import INTERVAL_MINUTES, INTRADAY_LIMITS, get_earliest_start, is_intraday
+from utils.trading_calendar import is_trading_day
+
+FIELDS = ['Open', 'High', 'Low', 'Close', 'Volume']
+SECTORS = ['Technology', 'Health Care', 'Finance', 'Consumer Discretionary', 'Industrials', 'Energy']
+
+def _to_date(value) -> date | None:
+    if value is None:
+        return None
+    return pd.Timestamp(value).date()
+
+def _to_naive_utc(value) -> pd.Timestamp | None:
+    if value is None:
+        return None
+    value = pd.Timestamp(value)
+    return value.tz_convert('UTC').tz_localize(None) if value.tzinfo else value
+
+class SyntheticYahoo:
+    """ Drop-in replacement for the yfinance module generating deterministic synthetic data. """
+
+    def __init__(self, history_days: int = 2520, latency: float = 0.0, error_rate: float = 0.0, seed: int = 0, today: date = None, bad_row_rate: float = 0.0, dividend_rate: float = 0.0):
+        self.history_days = history_days
+        self.bad_row_rate = bad_row_rate
+        self.dividend_rate = dividend_rate
+        self.latency = latency
+        self.error_rate = error_rate
+        self.seed = seed
+        self.today = today or date.today()
+        self.shared = types.SimpleNamespace(_ERRORS={})
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = {'download': 0, 'info': 0}
+
+    def _ticker_seed(self, ticker: str) -> int:
+        return int(hashlib.md5(f"{self.seed}:{ticker}".encode()).hexdigest()[:8], 16)
+
+    def _maybe_fail(self, kind: str) -> None:
+        with self._lock:
+            self.calls[kind] += 1
+            fail = self._random.random() < self.error_rate
+        if self.latency:
+            time.sleep(self.latency)
+        if fail:
+            raise ConnectionError("Synthetic connection timed out")
+
+    def download(self, tickers, start=None, end=None, period=None, interval='1d', actions=False, **kwargs) -> pd.DataFrame:
+        self._maybe_fail('download')
+        # Like yfinance, errors are reported per ticker for the last download only
+        self.shared._ERRORS = {}
+        tickers = [tickers] if isinstance(tickers, str) else list(tickers)
+        end_date = _to_date(end) or self.today + timedelta(days=1)
+        start_date = _to_date(start) or end_date - timedelta(days=int(self.history_days * 7 / 5))
+        days = pd.bdate_range(start_date, end_date - timedelta(days=1))
+        days = days[[is_trading_day(d) for d in days.date]]
+        # Days since a fixed epoch, so that overlapping requests return the same prices
+        epoch = pd.Timestamp('1990-01-01')
+        day_numbers = (days - epoch).days.to_numpy()
+        today_number = (pd.Timestamp(self.today) - epoch).days
+
+        if is_intraday(interval):
+            # Yahoo Finance rejects intraday requests older than the interval's lookback
+            # (one day more than the lookback the ETL requests)
+            if start_date < get_earliest_start(interval, self.today) - timedelta(days=1):
+                self.shared._ERRORS.update({t: f"{interval} data not available, the requested range must be within the last {INTRADAY_LIMITS[interval][0] + 1} days." for t in tickers})
+                return pd.DataFrame()
+            minutes = INTERVAL_MINUTES[interval]
+            bars = np.arange(0, 390, minutes)
+            index = pd.DatetimeIndex(
+                (days.values[:, None] + np.timedelta64(570, 'm') + bars[None, :].astype('timedelta64[m]')).ravel(), name='Datetime'
+            ).tz_localize('America/New_York')
+            ticks = (day_numbers[:, None] * 1000 + bars[None, :]).ravel()
+            day_numbers = np.repeat(day_numbers, len(bars)) + np.tile(bars / 390, len(days))
+        else:
+            index = days.rename('Date')
+            ticks = day_numbers
+        if len(index) == 0:
+            return pd.DataFrame()
+
+        fields = FIELDS + (['Dividends', 'Stock Splits'] if actions else [])
+        values = np.full((len(index), len(tickers), len(fields)), np.nan)
+        for i, ticker in enumerate(tickers):
+            ticker_seed = self._ticker_seed(ticker)
+            rng = np.random.default_rng(ticker_seed)
+            base, drift, listed_days = rng.uniform(5, 500), rng.normal(0, 2e-4), rng.integers(max(1, self.history_days // 10), self.history_days * 2 + 1)
+            close = base * np.exp(drift * day_numbers + 0.02 * np.sin(day_numbers * rng.uniform(0.01, 0.1)))
+            # Some tickers listed after the start of the requested range
+            listed = day_numbers >= today_number - listed_days * 7 / 5
+            values[listed, i, 0] = close[listed] * 0.995
+            values[listed, i, 1] = close[listed] * 1.01
+            values[listed, i, 2] = close[listed] * 0.99
+            values[listed, i, 3] = close[listed]
+            values[listed, i, 4] = (ticks[listed] * 7919 + ticker_seed) % 10**7
+            if actions:
+                values[listed, i, 5:] = 0.0
+                # Dividends only depend on the ticker and day, like bad rows
+                paid = listed & ((ticks * 40503 + ticker_seed) % 10**6 < self.dividend_rate * 10**6)
+                values[paid, i, 5] = np.round(close[paid] * 0.005, 2)
+            if self.bad_row_rate:
+                # Bad rows only depend on the ticker and bar, so overlapping requests return the same ones
+                bad = listed & ((ticks * 2654435761 + ticker_seed) % 10**6 < self.bad_row_rate * 10**6)
+                kind = ticks % 3
+                values[bad & (kind == 0), i, 3] = np.nan
+                values[bad & (kind == 1), i, 1] = values[bad & (kind == 1), i, 2] * 0.9
+                values[bad & (kind == 2), i, :4] *= 3
+        columns = pd.MultiIndex.from_product([tickers, fields])
+        return pd.DataFrame(values.reshape(len(index), -1), index=index, columns=columns)
+
+    def Ticker(self, ticker: str):
+        yahoo = self
+
+        class _Ticker:
+            @property
+            def info(self):
+                yahoo._maybe_fail('info')
+                return {'sector': SECTORS[yahoo._ticker_seed(ticker) % len(SECTORS)]}
+
+            @property
+            def actions(self):
+                yahoo._maybe_fail('info')
+                return pd.DataFrame(columns=['Dividends', 'Stock Splits'])
+
+        return _Ticker()
+
+def _request_key(kind: str, args: tuple, kwargs: dict) -> str:
+    payload = json.dumps([kind, [str(a) for a in args], {k: str(v) for k, v in sorted(kwargs.items())}])
+    return hashlib.sha1(payload.encode()).hexdigest()
+
+class RecordingYahoo:
+    """ Wraps the yfinance module and stores every download and info response in a directory. """
+
+    def __init__(self, directory: str, yf_module=None):
+        import yfinance
+        self.yf = yf_module or yfinance
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    @property
+    def shared(self):
+        return self.yf.shared
+
+    def download(self, *args, **kwargs) -> pd.DataFrame:
+        df = self.yf.download(*args, **kwargs)
+        df.to_pickle(os.path.join(self.directory, f"{_request_key('download', args, kwargs)}.pkl"))
+        return df
+
+    def Ticker(self, ticker: str):
+        real = self.yf.Ticker(ticker)
+        path = os.path.join(self.directory, f"{_request_key('info', (ticker,), {})}.json")
+
+        class _Ticker:
+            @property
+            def info(self):
+                info = real.info
+                with open(path, 'w') as f:
+                    json.dump({'sector': info.get('sector')}, f)
+                return info
+
+        return _Ticker()
+
+class ReplayYahoo:
+    """ Serves the responses stored by RecordingYahoo. Requests that were not recorded return no data. """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.shared = types.SimpleNamespace(_ERRORS={})
+
+    def download(self, *args, **kwargs) -> pd.DataFrame:
+        path = os.path.join(self.directory, f"{_request_key('download', args, kwargs)}.pkl")
+        return pd.read_pickle(path) if os.path.exists(path) else pd.DataFrame()
+
+    def Ticker(self, ticker: str):
+        path = os.path.join(self.directory, f"{_request_key('info', (ticker,), {})}.json")
+
+        class _Ticker:
+            @property
+            def info(self):
+                if not os.path.exists(path):
+                    return {}
+                with open(path) as f:
+                    return json.load(f)
+
+        return _Ticker()
+
+class _Job:
+    def __init__(self, rows=None, latency: float = 0.0):
+        self._rows = rows or []
+        self._latency = latency
+
+    def result(self):
+        if self._latency:
+            time.sleep(self._latency)
+        return self._rows
+
+class FakeBigQueryClient:
+    """
+    In-memory stand-in for bigquery.Client. Tables only keep per-ticker watermarks and row
+    counts (the information the ETL reads back), staged loads are kept until MERGEd.
+    """
+
+    def __init__(self, project: str = 'benchmark', job_latency: float = 0.0):
+        self.project = project
+        self.job_latency = job_latency
+        self.datasets = set()
+        self.tables = {}
+        self._lock = threading.Lock()
+        self.bytes_loaded = 0
+
+    def seed_table(self, table_id: str, watermarks: dict, rows_per_ticker: int = 0, schema: list = None) -> None:
+        """ Pre-populates a table with the given per-ticker latest dates (and optionally its schema). """
+        self.tables[table_id] = {
+            'watermarks': {t: _to_naive_utc(d) for t, d in watermarks.items()},
+            'rows': {t: rows_per_ticker for t in watermarks},
+            'staged': None,
+            'schema': schema or [],
+        }
+
+    def get_dataset(self, dataset_id):
+        if dataset_id not in self.datasets:
+            raise NotFound(f"Dataset {dataset_id} not found")
+        return dataset_id
+
+    def create_dataset(self, dataset_id, exists_ok=False):
+        self.datasets.add(dataset_id)
+
+    def get_table(self, table_id):
+        if table_id not in self.tables:
+            raise NotFound(f"Table {table_id} not found")
+        return types.SimpleNamespace(
+            table_id=table_id, time_partitioning=True, schema=self.tables[table_id].get('schema', [])
+        )
+
+    def create_table(self, table, exists_ok=False):
+        with self._lock:
+            table_id = table if isinstance(table, str) else f"{table.project}.{table.dataset_id}.{table.table_id}"
+            self.tables.setdefault(table_id, {'watermarks': {}, 'rows': {}, 'staged': None, 'schema': getattr(table, 'schema', [])})
+
+    def delete_table(self, table_id, not_found_ok=False):
+        with self._lock:
+            self.tables.pop(table_id, None)
+
+    def load_table_from_file(self, file_obj, table_id, job_config=None):
+        payload = file_obj.read()
+        parquet_file = pq.ParquetFile(io.BytesIO(payload))
+        # Only the columns read back by the ETL are kept
+        columns = [c for c in ('ticker', 'date') if c in parquet_file.schema_arrow.names]
+        df = parquet_file.read(columns=columns).to_pandas()
+        with self._lock:
+            self.bytes_loaded += len(payload)
+            table = self.tables.setdefault(table_id, {'watermarks': {}, 'rows': {}, 'staged': None})
+            if '_staging_' in table_id:
+                table['staged'] = df
+            else:
+                self._apply(table, df)
+        return _Job(latency=self.job_latency)
+
+    def _apply(self, table: dict, df: pd.DataFrame) -> None:
+        if 'ticker' not in df.columns:
+            return
+        if 'date' in df.columns:
+            latest = df.groupby('ticker', observed=True)['date'].max()
+            counts = df.groupby('ticker', observed=True).size()
+            for ticker, max_date in latest.items():
+                max_date = _to_naive_utc(max_date)
+                current = table['watermarks'].get(ticker)
+                table['watermarks'][ticker] = max(current, max_date) if current is not None else max_date
+                table['rows'][ticker] = table['rows'].get(ticker, 0) + int(counts[ticker])
+        else:
+            for ticker in df['ticker']:
+                table['watermarks'].setdefault(ticker, None)
+                table['rows'][ticker] = 1
+
+    def query(self, query: str, job_config=None):
+        tables = re.findall(r"`([^`]+)`", query)
+        params = {p.name: p.values for p in getattr(job_config, 'query_parameters', None) or [] if hasattr(p, 'values')}
+        with self._lock:
+            if query.lstrip().upper().startswith('MERGE'):
+                target, staging = tables[0], tables[1]
+                staged = self.tables.get(staging, {}).get('staged')
+                if staged is not None and target in self.tables:
+                    if 'NOT MATCHED BY SOURCE' in query.upper():
+                        # Replace of the history of some tickers
+                        for ticker in params.get('tickers') or []:
+                            self.tables[target]['rows'].pop(ticker, None)
+                    self._apply(self.tables[target], staged)
+                return _Job(latency=self.job_latency)
+
+            table = self.tables.get(tables[0]) if tables else None
+            if table is None:
+                raise NotFound(f"Table {tables[0] if tables else '?'} not found")
+            if 'QUALIFY' in query.upper():
+                # Row-level queries (e.g. trailing closes): no rows are kept
+                return _Job(latency=self.job_latency)
+            tickers = params.get('tickers')
+            selected = [t for t in table['rows'] if tickers is None or t in tickers]
+            if 'MAX(' in query.upper():
+                rows = [{'ticker': t, 'max_date': table['watermarks'].get(t)} for t in selected]
+            else:
+                rows = [{'ticker': t} for t in selected]
+        return _Job([_Row(row) for row in rows], latency=self.job_latency)
+
+class _Row(dict):
+    """ Query result row supporting both attribute and dict access, like bigquery.Row. """
+
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
@@ -0,0 +1,272 @@
+"""
+End-to-end offline benchmark of the ETL pipeline. Yahoo Finance and BigQuery are replaced by
+the stand-ins of benchmarks.fakes, so runs are reproducible and need no network or credentials.
+
+Every scenario (universe size x mode) runs in a fresh process, so that its peak RSS is not
+inflated by the previous ones. Modes:
+    max          nothing stored yet, the full history of every ticker is extracted
+    incremental  every ticker stored up to a few trading days ago, only the tail is extracted
+
+Usage:
+    python -m benchmarks.pipeline_benchmark [--tickers 100 1000 7000] [--modes max incremental]
+        [--backend bigquery|local] [--interval 1d|5m|1h] [--latency 0.05] [--error-rate 0.01] [--dividend-rate 0.001] [--replay DIR] [--json results.json]
+        [--baseline results.json --tolerance 0.2]
+
+With --baseline, the process exits with status 1 when the rows/sec of any scenario drops by
+more than the tolerance, so it can be used to gate regressions.
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import resource
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+from pathlib import Path
+from unittest import mock
+import pandas as pd
+
+PROJECT_ID = 'benchmark'
+DATASET_ID = 'benchmark'
+STOCKS_TABLE_ID = 'stocks'
+SECTORS_TABLE_ID = 'sectors'
+DERIVED_TABLE_ID = 'stock_metrics'
+QUARANTINE_TABLE_ID = 'stock_quarantine'
+SECTOR_AGGREGATES_TABLE_ID = 'sector_daily'
+
+def get_universe(n_tickers: int) -> list[str]:
+    """ Returns the n largest tickers of the universe index, padded with synthetic tickers. """
+    try:
+        from config.build_universe import load_index
+        symbols = load_index()['symbols'][:n_tickers]
+    except Exception:
+        symbols = []
+    return symbols + [f"SYN{i:05d}" for i in range(n_tickers - len(symbols))]
+
+def get_market_caps() -> dict:
+    """ Returns the market caps of the universe index, the synthetic tickers have none. """
+    try:
+        from config.build_universe import load_index
+        from config.universe import get_market_caps as get_index_market_caps
+        return get_index_market_caps(load_index())
+    except Exception:
+        return {}
+
+def peak_rss_bytes() -> int:
+    """ Returns the peak resident set size of the current process. """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+def stored_size(directory: str) -> int:
+    """ Returns the total size of the files in a directory. """
+    return sum(f.stat().st_size for f in Path(directory).rglob('*') if f.is_file())
+
+class StageTimer:
+    """ Accumulates the time spent in each wrapped function, across all threads. """
+
+    def __init__(self):
+        self.seconds = {}
+        self._lock = threading.Lock()
+
+    def wrap(self, name: str, fn):
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self.seconds[name] = self.seconds.get(name, 0.0) + time.perf_counter() - start
+        return timed
+
+def run_scenario(options: dict) -> dict:
+    """ Runs one scenario in the current process and returns its measurements. """
+    logging.basicConfig(level=options['log_level'], format='%(asctime)s - %(levelname)s - %(message)s')
+    from benchmarks.fakes import FakeBigQueryClient, ReplayYahoo, SyntheticYahoo
+    from etl import pipeline
+    from etl.sinks import BigQuerySink, ParquetSink
+    from utils.extract_helpers import get_ticker_buckets
+    from utils.intervals import is_intraday, get_interval_table_id
+    from utils.rate_limit import configure_scheduler
+    from utils.time import get_last_market_close_date
+    from utils.trading_calendar import previous_trading_day
+
+    tickers = get_universe(options['tickers'])
+    interval = options['interval']
+    stocks_table_id = get_interval_table_id(STOCKS_TABLE_ID, interval)
+    quarantine_table_id = get_interval_table_id(QUARANTINE_TABLE_ID, interval)
+    derived_table_id = None if is_intraday(interval) else DERIVED_TABLE_ID
+    aggregates_table_id = SECTOR_AGGREGATES_TABLE_ID if derived_table_id and not options['skip_derived'] else None
+    stocks_table = f"{PROJECT_ID}.{DATASET_ID}.{stocks_table_id}"
+    sectors_table = f"{PROJECT_ID}.{DATASET_ID}.{SECTORS_TABLE_ID}"
+
+    if options['replay']:
+        yahoo = ReplayYahoo(options['replay'])
+    else:
+        yahoo = SyntheticYahoo(
+            history_days=options['history_days'],
+            latency=options['latency'],
+            error_rate=options['error_rate'],
+            seed=options['seed'],
+            bad_row_rate=options['bad_row_rate'],
+            dividend_rate=options['dividend_rate'],
+        )
+    client = FakeBigQueryClient(PROJECT_ID, job_latency=options['job_latency'])
+    storage_dir = tempfile.TemporaryDirectory()
+    if options['backend'] == 'local':
+        sink = ParquetSink(
+            storage_dir.name, stocks_table_id, SECTORS_TABLE_ID, derived_table_id,
+            quarantine_table_id=quarantine_table_id, aggregates_table_id=aggregates_table_id
+        )
+    else:
+        sink = BigQuerySink(
+            None, PROJECT_ID, DATASET_ID, stocks_table_id, SECTORS_TABLE_ID, derived_table_id,
+            client=client, quarantine_table_id=quarantine_table_id, aggregates_table_id=aggregates_table_id
+        )
+
+    if options['mode'] == 'incremental':
+        latest = get_last_market_close_date()
+        for _ in range(options['incremental_days']):
+            latest = previous_trading_day(latest)
+        if options['backend'] == 'local':
+            # Store the history up to the watermark first, outside of the measured run
+            history_start = latest - timedelta(days=int(options['history_days'] * 7 / 5))
+            with mock.patch('etl.extract.yf', yahoo):
+                pipeline.run_batches(
+                    pipeline.split_into_batches({history_start: tickers}, tickers, options['batch_size']),
+                    sink=sink, interval=interval, extract_kwargs={'end': (latest + timedelta(days=1)).isoformat()}
+                )
+        else:
+            # Intraday tables are seeded up to the last bar of the session
+            watermark = pd.Timestamp(f"{latest} 15:59", tz='America/New_York') if is_intraday(interval) else latest
+            client.seed_table(stocks_table, {ticker: watermark for ticker in tickers}, rows_per_ticker=options['history_days'])
+            client.seed_table(sectors_table, {ticker: None for ticker in tickers}, rows_per_ticker=1)
+
+    configure_scheduler(
+        rate_per_second=options['rate'],
+        burst=options['rate'],
+        max_concurrency=options['max_concurrency'],
+        max_retries=options['max_retries'],
+    )
+    timer = StageTimer()
+    seeded_bytes = stored_size(storage_dir.name)
+    start = time.perf_counter()
+
+    with mock.patch('etl.extract.yf', yahoo), \
+            mock.patch.object(pipeline, 'extract_data', timer.wrap('extract', pipeline.extract_data)), \
+            mock.patch.object(pipeline, 'transform_data', timer.wrap('transform', pipeline.transform_data)), \
+            mock.patch.object(pipeline, 'validate_data', timer.wrap('validate', pipeline.validate_data)), \
+            mock.patch.object(pipeline, 'derive_data', timer.wrap('derive', pipeline.derive_data)), \
+            mock.patch.object(pipeline, 'aggregate_data', timer.wrap('aggregate', pipeline.aggregate_data)), \
+            mock.patch.object(sink, 'load_batch', timer.wrap('load', sink.load_batch)):
+        plan_start = time.perf_counter()
+        known_tickers = set(sink.get_known_tickers(tickers))
+        missing_tickers = [t for t in tickers if t not in known_tickers]
+        ticker_buckets = get_ticker_buckets(tickers, sink.get_watermarks(tickers), interval=interval)
+        batches = pipeline.split_into_batches(ticker_buckets, missing_tickers, options['batch_size'])
+        timer.seconds['plan'] = time.perf_counter() - plan_start
+
+        totals = pipeline.run_batches(
+            batches,
+            interval=interval,
+            extract_workers=options['workers'],
+            transform_workers=options['workers'],
+            load_workers=options['workers'],
+            queue_size=options['workers'],
+            sink=sink,
+            derive_metrics=bool(derived_table_id) and not options['skip_derived'],
+            validate=not options['skip_validation'],
+            corporate_actions=not is_intraday(interval),
+            aggregate_sectors=bool(aggregates_table_id),
+            market_caps=get_market_caps(),
+        )
+
+    wall = time.perf_counter() - start
+    stored_bytes = stored_size(storage_dir.name) - seeded_bytes
+    storage_dir.cleanup()
+    return {
+        'tickers': len(tickers),
+        'mode': options['mode'],
+        'interval': interval,
+        'backend': options['backend'],
+        'batches': totals['batches'],
+        'failed': totals['failed_batches'],
+        'rows': totals['rows'],
+        'wall_s': round(wall, 2),
+        **{f"{stage}_s": round(timer.seconds.get(stage, 0.0), 2) for stage in ('plan', 'extract', 'transform', 'validate', 'derive', 'aggregate', 'load')},
+        'rows_per_sec': int(totals['rows'] / wall) if wall else 0,
+        'loaded_mb': round((client.bytes_loaded or stored_bytes) / 1e6, 1),
+        'peak_rss_mb': round(peak_rss_bytes() / 1e6, 1),
+    }
+
+def check_regressions(results: list[dict], baseline_path: str, tolerance: float) -> list[str]:
+    """ Returns a description of every scenario whose rows/sec dropped by more than the tolerance. """
+    with open(baseline_path) as f:
+        baseline = {(r['tickers'], r['mode'], r.get('backend', 'bigquery'), r.get('interval', '1d')): r for r in json.load(f)}
+    regressions = []
+    for result in results:
+        previous = baseline.get((result['tickers'], result['mode'], result['backend'], result['interval']))
+        if previous and result['rows_per_sec'] < previous['rows_per_sec'] * (1 - tolerance):
+            regressions.append(
+                f"{result['tickers']} tickers ({result['mode']}): "
+                f"{result['rows_per_sec']} rows/s vs {previous['rows_per_sec']} rows/s in the baseline"
+            )
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tickers', type=int, nargs='+', default=[100, 1000, 7000])
+    parser.add_argument('--modes', nargs='+', choices=['max', 'incremental'], default=['max', 'incremental'])
+    parser.add_argument('--backend', choices=['bigquery', 'local'], default='bigquery',
+                        help="Storage sink: the fake BigQuery client or a local Parquet dataset (default: bigquery).")
+    parser.add_argument('--interval', default='1d', help="Price interval, '1d' or intraday (e.g. '5m', '1h').")
+    parser.add_argument('--history-days', type=int, default=2520, help='Trading days of full history (default: 10 years).')
+    parser.add_argument('--incremental-days', type=int, default=5, help='Trading days behind in incremental mode.')
+    parser.add_argument('--skip-derived', action='store_true', help='Skip the derived metrics and sector aggregates stages.')
+    parser.add_argument('--skip-validation', action='store_true', help='Skip the data-quality validation stage.')
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds per Yahoo Finance request.')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Probability of a Yahoo Finance request failing.')
+    parser.add_argument('--bad-row-rate', type=float, default=0.0, help='Fraction of synthetic rows failing validation.')
+    parser.add_argument('--dividend-rate', type=float, default=0.0,
+                        help='Fraction of synthetic trading days with a dividend, refreshing the history of the ticker.')
+    parser.add_argument('--job-latency', type=float, default=0.0, help='Seconds per BigQuery job.')
+    parser.add_argument('--replay', help='Directory of responses recorded with benchmarks.fakes.RecordingYahoo.')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--batch-size', type=int, default=100)
+    parser.add_argument('--workers', type=int, default=1, help='Workers per pipeline stage.')
+    parser.add_argument('--rate', type=float, default=1000.0, help='Yahoo Finance requests per second.')
+    parser.add_argument('--max-concurrency', type=int, default=8)
+    parser.add_argument('--max-retries', type=int, default=4)
+    parser.add_argument('--json', help='Write the results to this JSON file.')
+    parser.add_argument('--baseline', help='JSON results of a previous run to compare against.')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed relative drop of rows/sec (default: 0.2).')
+    parser.add_argument('--log-level', default='WARNING')
+    args = parser.parse_args()
+
+    base_options = {k: v for k, v in vars(args).items() if k not in ('tickers', 'modes', 'json', 'baseline', 'tolerance')}
+    results = []
+    context = multiprocessing.get_context('spawn')
+    for n_tickers in args.tickers:
+        for mode in args.modes:
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                results.append(executor.submit(run_scenario, {**base_options, 'tickers': n_tickers, 'mode': mode}).result())
+            print(f"{n_tickers} tickers ({mode}): {results[-1]['wall_s']}s", file=sys.stderr, flush=True)
+    print(pd.DataFrame(results).to_string(index=False))
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        regressions = check_regressions(results, args.baseline, args.tolerance)
+        for regression in regressions:
+            print(f"Regression: {regression}")
+        if regressions:
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
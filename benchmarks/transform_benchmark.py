@@ -0,0 +1,90 @@
+"""
+Benchmarks the reshape and transform of raw Yahoo Finance downloads against the
+previous implementation (DataFrame.stack + column-wise pd.to_numeric).
+
+Usage:
+    python -m benchmarks.transform_benchmark [--tickers 100 1000 7000] [--days 252]
+"""
+import argparse
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+from etl.extract import reshape_stock_data
+from etl.transform import transform_data
+
+FIELDS = ['Open', 'High', 'Low', 'Close', 'Volume']
+
+def make_download(n_tickers: int, n_days: int, seed: int = 0) -> pd.DataFrame:
+    """ Builds a synthetic wide frame shaped like yf.download(..., group_by='ticker'). """
+    rng = np.random.default_rng(seed)
+    tickers = [f"T{i:05d}" for i in range(n_tickers)]
+    index = pd.bdate_range(end='2024-12-31', periods=n_days, name='Date')
+    columns = pd.MultiIndex.from_product([tickers, FIELDS])
+    values = rng.uniform(1, 500, size=(n_days, len(columns)))
+    values[:, 4::5] = rng.integers(0, 10**7, size=(n_days, n_tickers))
+    # Younger tickers have no data at the start of the range
+    listed_at = rng.integers(0, n_days, size=n_tickers) * (rng.random(n_tickers) < 0.2)
+    for i, start in enumerate(listed_at):
+        values[:start, i * 5:(i + 1) * 5] = np.nan
+    return pd.DataFrame(values, index=index, columns=columns)
+
+def legacy_reshape(df: pd.DataFrame) -> pd.DataFrame:
+    """ Previous reshape implementation of fetch_stock_data. """
+    df = df.stack(level=0, future_stack=True)
+    df.index.names = ['Date', 'Ticker']
+    df.reset_index(inplace=True)
+    df.rename(columns={'Date': 'date'}, inplace=True)
+    return df
+
+def legacy_transform(raw_df: pd.DataFrame) -> pd.DataFrame:
+    """ Previous implementation of transform_data. """
+    transformed_df = raw_df.rename(columns=str.lower)
+    transformed_df['date'] = pd.to_datetime(transformed_df['date'])
+    num_cols = ['open', 'high', 'low', 'close', 'volume']
+    transformed_df[num_cols] = transformed_df[num_cols].apply(pd.to_numeric, errors='coerce')
+    return transformed_df
+
+def measure(fn, *args) -> tuple:
+    """ Runs fn and returns its result, wall time in seconds and peak traced memory in bytes. """
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = fn(*args)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+def run(n_tickers: int, n_days: int) -> list[dict]:
+    wide_df = make_download(n_tickers, n_days)
+    tickers = wide_df.columns.get_level_values(0).unique().to_list()
+    implementations = {
+        'legacy': lambda df: legacy_transform(legacy_reshape(df)),
+        'vectorized': lambda df: transform_data(reshape_stock_data(df, tickers)),
+    }
+    results = []
+    for name, fn in implementations.items():
+        out_df, elapsed, peak = measure(fn, wide_df)
+        results.append({
+            'tickers': n_tickers,
+            'implementation': name,
+            'rows': len(out_df),
+            'seconds': round(elapsed, 3),
+            'rows_per_sec': int(len(out_df) / elapsed) if elapsed else None,
+            'peak_mb': round(peak / 1e6, 1),
+            'output_mb': round(out_df.memory_usage(deep=True).sum() / 1e6, 1),
+        })
+        del out_df
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tickers', type=int, nargs='+', default=[100, 1000, 7000])
+    parser.add_argument('--days', type=int, default=252, help='Trading days per ticker (default: 1 year).')
+    args = parser.parse_args()
+
+    results = [row for n in args.tickers for row in run(n, args.days)]
+    print(pd.DataFrame(results).to_string(index=False))
+
+if __name__ == '__main__':
+    main()
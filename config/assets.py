@@ -1,12 +1,8 @@
-import pandas as pd
+from config.build_universe import load_index
+from config.settings import UNIVERSE
+from config.universe import resolve_universe
 
-# Get tickers for top NASDAQ companies from csv file
-csv_filepath = 'config/nasdaq_symbols.csv'
-df = pd.read_csv(csv_filepath)
-
-# Handle special characters
-df['Symbol'] = df['Symbol'].replace({'BRK/A': 'BRK-A', 'BRK/B': 'BRK-B'})
-
-# Sort by Market Cap and select top tickers
-df = df.sort_values(by='Market Cap', ascending=False)
-TICKERS = df['Symbol'].head(100).to_list()
+# Get tickers to track by resolving the universe spec against the precompiled
+# universe index (see config/build_universe.py) or the csv file
+UNIVERSE_INDEX = load_index()
+TICKERS = resolve_universe(UNIVERSE, UNIVERSE_INDEX)
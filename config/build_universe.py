@@ -0,0 +1,112 @@
+"""
+Precompiles the ticker universe from the NASDAQ symbols file into a small JSON
+index, so that startup doesn't need pandas to parse and sort the CSV.
+Run at image build time:
+
+    python -m config.build_universe
+"""
+import csv
+import json
+import os
+
+CSV_PATH = 'config/nasdaq_symbols.csv'
+UNIVERSE_PATH = 'config/universe.json'
+INDEX_VERSION = 2
+BUCKET_FIELDS = ['sector', 'country', 'ipo_year']
+
+def normalize_symbol(symbol: str) -> str:
+    """ Converts a NASDAQ symbol into its Yahoo Finance ticker (e.g. 'BRK/A' -> 'BRK-A'). """
+    return symbol.strip().replace('/', '-')
+
+def read_symbols(csv_path: str = CSV_PATH) -> list[dict]:
+    """
+    Reads the NASDAQ symbols file and sorts it by market cap, largest first.
+    Symbols without a market cap go last.
+
+    Args:
+        csv_path (str): Path to the NASDAQ symbols CSV file.
+
+    Returns:
+        list[dict]: List of {'symbol', 'market_cap', 'sector', 'country', 'ipo_year'} dictionaries.
+    """
+    records = []
+    with open(csv_path, newline='') as f:
+        for row in csv.DictReader(f):
+            if not row.get('Symbol'):
+                continue
+            try:
+                market_cap = float(row['Market Cap'])
+            except (TypeError, ValueError):
+                market_cap = None
+            try:
+                ipo_year = int(float(row['IPO Year']))
+            except (TypeError, ValueError):
+                ipo_year = None
+            records.append({
+                'symbol': normalize_symbol(row['Symbol']),
+                'market_cap': market_cap,
+                'sector': (row.get('Sector') or '').strip() or None,
+                'country': (row.get('Country') or '').strip() or None,
+                'ipo_year': ipo_year,
+            })
+    records.sort(key=lambda r: (r['market_cap'] is None, -(r['market_cap'] or 0)))
+    return records
+
+def build_index(records: list[dict], source_mtime: float = None) -> dict:
+    """
+    Builds the universe index: columns sorted by market cap, plus the positions of the
+    symbols of each sector, country and IPO year (in market cap order).
+
+    Args:
+        records (list[dict]): Records as returned by read_symbols.
+        source_mtime (float): Modification time of the symbols file the records come from.
+
+    Returns:
+        dict: The index.
+    """
+    index = {
+        'version': INDEX_VERSION,
+        'source_mtime': source_mtime,
+        'symbols': [r['symbol'] for r in records],
+        'market_cap': [r['market_cap'] for r in records],
+        'buckets': {field: {} for field in BUCKET_FIELDS},
+    }
+    for position, record in enumerate(records):
+        for field in BUCKET_FIELDS:
+            if record[field] is not None:
+                index['buckets'][field].setdefault(str(record[field]), []).append(position)
+    return index
+
+def build_universe(csv_path: str = CSV_PATH, output_path: str = UNIVERSE_PATH) -> dict:
+    """
+    Builds the universe index from the symbols file and writes it as JSON.
+
+    Returns:
+        dict: The index, see build_index.
+    """
+    index = build_index(read_symbols(csv_path), os.path.getmtime(csv_path))
+    with open(output_path, 'w') as f:
+        json.dump(index, f, separators=(',', ':'))
+    return index
+
+def load_index(csv_path: str = CSV_PATH, universe_path: str = UNIVERSE_PATH) -> dict:
+    """
+    Returns the universe index, from the precompiled artifact when it is up to date
+    with the symbols file, or by reading the symbols file otherwise.
+    """
+    try:
+        with open(universe_path) as f:
+            index = json.load(f)
+        if index.get('version') == INDEX_VERSION and index['source_mtime'] >= os.path.getmtime(csv_path):
+            return index
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+    return build_index(read_symbols(csv_path), os.path.getmtime(csv_path))
+
+def load_universe(csv_path: str = CSV_PATH, universe_path: str = UNIVERSE_PATH) -> list[str]:
+    """ Returns all symbols sorted by market cap. """
+    return load_index(csv_path, universe_path)['symbols']
+
+if __name__ == '__main__':
+    index = build_universe()
+    print(f"Wrote {len(index['symbols'])} symbols to {UNIVERSE_PATH}")
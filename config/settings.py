@@ -42,3 +42,63 @@ PROJECT_ID = os.getenv("PROJECT_ID")
 DATASET_ID = os.getenv("DATASET_ID")
 STOCKS_TABLE_ID = os.getenv("STOCKS_TABLE_ID")
 SECTORS_TABLE_ID = os.getenv("SECTORS_TABLE_ID")
+# Table of derived metrics (returns, moving averages, volatility), not computed when empty
+DERIVED_TABLE_ID = os.getenv("DERIVED_TABLE_ID", "stock_metrics")
+# Table of the rows failing the data-quality checks, only counted when empty
+QUARANTINE_TABLE_ID = os.getenv("QUARANTINE_TABLE_ID", "stock_quarantine")
+# Table of per-sector daily aggregates (weighted returns, volume, advancers/decliners), not computed when empty
+SECTOR_AGGREGATES_TABLE_ID = os.getenv("SECTOR_AGGREGATES_TABLE_ID", "sector_daily")
+
+# Storage backend: 'bigquery', or 'local' for a partitioned Parquet dataset in LOCAL_STORAGE_DIR
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "bigquery").lower()
+LOCAL_STORAGE_DIR = os.getenv("LOCAL_STORAGE_DIR", ".cache/warehouse")
+
+# ETL execution
+# Interval of the extracted prices: '1d', or an intraday interval ('1m', '5m', '15m', '1h', ...)
+# loaded into its own tables (e.g. 'stocks_5m')
+INTERVAL = os.getenv("INTERVAL", "1d")
+# Number of top NASDAQ tickers (by market cap) to track, 0 tracks the whole symbol file
+UNIVERSE_SIZE = int(os.getenv("UNIVERSE_SIZE", 100))
+# Universe spec (see config/universe.py), defaults to the top UNIVERSE_SIZE tickers
+UNIVERSE = os.getenv("UNIVERSE") or (f"top:{UNIVERSE_SIZE}" if UNIVERSE_SIZE > 0 else "all")
+# Universe of the previous run, used to report added and removed tickers
+UNIVERSE_STATE_PATH = os.getenv("UNIVERSE_STATE_PATH", ".cache/universe_state.json")
+# Sharded execution across the tasks of a Cloud Run job: each task processes its own share of the
+# universe, task 0 also tracks the universe state and evicts the price cache
+TASK_INDEX = int(os.getenv("CLOUD_RUN_TASK_INDEX", 0))
+TASK_COUNT = int(os.getenv("CLOUD_RUN_TASK_COUNT", 1))
+# Number of tickers processed per extract -> transform -> load batch
+BATCH_SIZE = int(os.getenv("BATCH_SIZE", 100))
+# Data-quality checks between transform and load, and daily move of a reverting close considered a bad print
+VALIDATE_DATA = os.getenv("VALIDATE_DATA", "true").lower() in ("1", "true", "yes")
+VALIDATION_MAX_JUMP = float(os.getenv("VALIDATION_MAX_JUMP", 0.5))
+# Detect dividends and splits in the incremental downloads of daily prices, and replace the stored
+# (adjusted) history of the affected tickers with the re-adjusted one
+REFRESH_CORPORATE_ACTIONS = os.getenv("REFRESH_CORPORATE_ACTIONS", "true").lower() in ("1", "true", "yes")
+# Number of batches extracted, transformed and loaded concurrently by the pipeline stages
+EXTRACT_WORKERS = int(os.getenv("EXTRACT_WORKERS", 1))
+TRANSFORM_WORKERS = int(os.getenv("TRANSFORM_WORKERS", 1))
+LOAD_WORKERS = int(os.getenv("LOAD_WORKERS", 1))
+# Maximum number of batches waiting between two pipeline stages
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", 1))
+# Local Parquet cache of raw Yahoo downloads, disabled when no directory is set
+PRICE_CACHE_DIR = os.getenv("PRICE_CACHE_DIR")
+PRICE_CACHE_MAX_BYTES = int(os.getenv("PRICE_CACHE_MAX_BYTES", 2 * 1024**3))
+# Persistent cache of sectors not found in the NASDAQ symbols file
+SECTOR_CACHE_PATH = os.getenv("SECTOR_CACHE_PATH", ".cache/sectors.json")
+SECTOR_CACHE_TTL_DAYS = float(os.getenv("SECTOR_CACHE_TTL_DAYS", 30))
+# Yahoo Finance fetch scheduler: rate limit, retries and adaptive concurrency
+FETCH_RATE_PER_SECOND = float(os.getenv("FETCH_RATE_PER_SECOND", 2))
+FETCH_BURST = int(os.getenv("FETCH_BURST", 5))
+FETCH_MAX_CONCURRENCY = int(os.getenv("FETCH_MAX_CONCURRENCY", 8))
+FETCH_MAX_RETRIES = int(os.getenv("FETCH_MAX_RETRIES", 4))
+# Maximum number of BigQuery load jobs running at the same time
+LOAD_MAX_JOBS_IN_FLIGHT = int(os.getenv("LOAD_MAX_JOBS_IN_FLIGHT", 4))
+# JSON report with per-stage timings, rows, bytes, memory and failures of each run (empty disables it)
+RUN_REPORT_PATH = os.getenv("RUN_REPORT_PATH", ".cache/run_report.json")
+# Comma-separated metrics sinks receiving the run report: 'log' or 'package.module:function'
+METRICS_SINKS = os.getenv("METRICS_SINKS", "")
+# Manifest of the batches of a run, an interrupted run is resumed from its unfinished batches (empty disables it)
+RUN_MANIFEST_PATH = os.getenv("RUN_MANIFEST_PATH", ".cache/run_manifest.json")
+# Extracted data of the batches not loaded yet, reused when resuming (empty disables it)
+RUN_CHECKPOINT_DIR = os.getenv("RUN_CHECKPOINT_DIR", ".cache/checkpoints")
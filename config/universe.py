@@ -0,0 +1,168 @@
+"""
+Resolves ticker universe specs against the prebuilt universe index.
+
+A spec is a union of clauses separated by '+'. Each clause is a list of filters
+separated by ';', all of which must match:
+
+    top:N               the N largest symbols (by market cap) matching the other filters
+    all                 every symbol
+    tickers:A,B,C       an explicit list of tickers, kept in the given order
+    sector:S1,S2        symbols in any of the sectors
+    country:C1,C2       symbols in any of the countries
+    ipo_year:2010-2020  symbols with an IPO year in the range (also 2015, >=2010, <=2000)
+    min_cap:1e9         symbols with a market cap of at least the value
+    max_cap:1e11        symbols with a market cap of at most the value
+
+Examples: 'top:500', 'sector:Technology,Health Care;min_cap:1e9', 'tickers:AAPL,MSFT+top:50'.
+"""
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+def _parse_year_range(value: str) -> tuple[int, int]:
+    if value.startswith('>='):
+        return int(value[2:]), 9999
+    if value.startswith('<='):
+        return 0, int(value[2:])
+    if '-' in value:
+        low, high = value.split('-', 1)
+        return int(low), int(high)
+    return int(value), int(value)
+
+def _cap_positions(index: dict, min_cap: float = None, max_cap: float = None) -> set:
+    """ Returns the positions with a market cap in range, using binary search on the sorted caps. """
+    caps = index['market_cap']
+    # Caps are sorted in descending order, with missing caps at the end
+    n_known = next((i for i, cap in enumerate(caps) if cap is None), len(caps))
+
+    def first_position(predicate):
+        """ First position in [0, n_known) where predicate holds, predicate being monotonic. """
+        low, high = 0, n_known
+        while low < high:
+            mid = (low + high) // 2
+            if predicate(caps[mid]):
+                high = mid
+            else:
+                low = mid + 1
+        return low
+
+    start = first_position(lambda cap: cap <= max_cap) if max_cap is not None else 0
+    end = first_position(lambda cap: cap < min_cap) if min_cap is not None else n_known
+    return set(range(start, end))
+
+def _resolve_clause(clause: str, index: dict) -> list[str]:
+    symbols = index['symbols']
+    buckets = index['buckets']
+    positions = None
+    limit = None
+    explicit = []
+
+    for item in filter(None, (part.strip() for part in clause.split(';'))):
+        key, _, value = item.partition(':')
+        key, value = key.strip().lower(), value.strip()
+        if key == 'all':
+            continue
+        if key == 'top':
+            limit = int(value)
+            continue
+        if key == 'tickers':
+            explicit = [t.strip().upper() for t in value.split(',') if t.strip()]
+            continue
+
+        if key in ('sector', 'country'):
+            names = {v.strip().lower() for v in value.split(',')}
+            matched = set()
+            for name, bucket in buckets[key].items():
+                if name.lower() in names:
+                    matched.update(bucket)
+        elif key == 'ipo_year':
+            low, high = _parse_year_range(value)
+            matched = set()
+            for year, bucket in buckets['ipo_year'].items():
+                if low <= int(year) <= high:
+                    matched.update(bucket)
+        elif key == 'min_cap':
+            matched = _cap_positions(index, min_cap=float(value))
+        elif key == 'max_cap':
+            matched = _cap_positions(index, max_cap=float(value))
+        else:
+            raise ValueError(f"Unknown universe filter '{key}' in '{clause}'")
+        positions = matched if positions is None else positions & matched
+
+    if explicit:
+        if positions is not None:
+            allowed = {symbols[p] for p in positions}
+            explicit = [t for t in explicit if t in allowed]
+        return explicit[:limit] if limit is not None else explicit
+
+    ordered = sorted(positions) if positions is not None else range(len(symbols))
+    if limit is not None:
+        ordered = ordered[:limit]
+    return [symbols[p] for p in ordered]
+
+def resolve_universe(spec: str, index: dict) -> list[str]:
+    """
+    Resolves a universe spec (see module docstring) against the universe index.
+
+    Args:
+        spec (str): Universe spec, e.g. 'tickers:AAPL,MSFT+top:50'.
+        index (dict): Universe index, as returned by config.build_universe.load_index.
+
+    Returns:
+        list[str]: Tickers of the universe, without duplicates.
+
+    Raises:
+        ValueError: If the spec contains an unknown filter.
+    """
+    tickers = []
+    seen = set()
+    for clause in spec.split('+'):
+        for ticker in _resolve_clause(clause, index):
+            if ticker not in seen:
+                seen.add(ticker)
+                tickers.append(ticker)
+    return tickers
+
+def get_ipo_years(index: dict) -> dict:
+    """ Returns the IPO year of every symbol of the universe index that has one. """
+    symbols = index['symbols']
+    return {symbols[p]: int(year) for year, positions in index['buckets']['ipo_year'].items() for p in positions}
+
+def get_market_caps(index: dict) -> dict:
+    """ Returns the market cap of every symbol of the universe index that has one. """
+    return {symbol: cap for symbol, cap in zip(index['symbols'], index['market_cap']) if cap}
+
+def diff_universe(tickers: list, state_path: str) -> tuple[list, list]:
+    """
+    Compares the universe with the one of the previous run, stored in state_path.
+
+    Args:
+        tickers (list): Tickers of the current universe.
+        state_path (str): Path to the JSON file with the previous run's universe.
+
+    Returns:
+        tuple[list, list]: Tickers added and removed since the previous run.
+            Every ticker counts as added when there is no previous universe.
+    """
+    try:
+        with open(state_path) as f:
+            previous = json.load(f)
+    except (OSError, ValueError):
+        previous = []
+    current_set, previous_set = set(tickers), set(previous)
+    added = [t for t in tickers if t not in previous_set]
+    removed = [t for t in previous if t not in current_set]
+    logger.info(f"Universe of {len(tickers)} tickers: {len(added)} added, {len(removed)} removed since the previous run.")
+    if previous and added:
+        logger.info(f"Tickers added to the universe: {added}")
+    if removed:
+        logger.info(f"Tickers removed from the universe: {removed}")
+    return added, removed
+
+def save_universe(tickers: list, state_path: str) -> None:
+    """ Stores the universe of this run, to be diffed against by the next run. """
+    os.makedirs(os.path.dirname(state_path) or '.', exist_ok=True)
+    with open(state_path, 'w') as f:
+        json.dump(list(tickers), f)
@@ -0,0 +1,136 @@
+import logging
+import numpy as np
+import pandas as pd
+from utils.metrics import track
+
+logger = logging.getLogger(__name__)
+
+# Sector of the tickers without a known one, as stored in the sectors table
+UNKNOWN_SECTOR = 'N/A'
+
+# Sums the returns are computed from, stored along with them
+AGGREGATE_SUMS = [
+    'tickers', 'advancers', 'decliners', 'volume',
+    'return_count', 'return_sum', 'cap_weight_sum', 'cap_return_sum',
+]
+# Returns computed from the sums, as (numerator, denominator)
+AGGREGATE_RATIOS = {
+    'equal_weighted_return': ('return_sum', 'return_count'),
+    'cap_weighted_return': ('cap_return_sum', 'cap_weight_sum'),
+}
+# Sums of counts and volumes, stored as integers
+INTEGER_SUMS = ['tickers', 'advancers', 'decliners', 'volume', 'return_count']
+AGGREGATE_COLUMNS = ['date', 'sector'] + AGGREGATE_SUMS[:4] + list(AGGREGATE_RATIOS) + AGGREGATE_SUMS[4:]
+
+def add_ratios(aggregates_df: pd.DataFrame) -> pd.DataFrame:
+    """ Computes the AGGREGATE_RATIOS columns from the sums (NaN without a denominator), in AGGREGATE_COLUMNS order. """
+    for column, (numerator, denominator) in AGGREGATE_RATIOS.items():
+        values = aggregates_df[numerator].to_numpy(dtype='float64')
+        counts = aggregates_df[denominator].to_numpy(dtype='float64')
+        with np.errstate(divide='ignore', invalid='ignore'):
+            aggregates_df[column] = np.where(counts > 0, values / counts, np.nan)
+    return aggregates_df[AGGREGATE_COLUMNS]
+
+def _align_volume(stock_df: pd.DataFrame, categories: pd.Index, codes: np.ndarray, dates: np.ndarray) -> np.ndarray:
+    """
+    Returns the volume of the stock_df rows with the given (ticker code in categories, date) keys,
+    NaN for missing keys and the last occurrence of duplicated ones (as kept by the derived metrics).
+    Keys are matched as integers (ticker code, date code) through a hash index.
+    """
+    ticker = stock_df['ticker']
+    if isinstance(ticker.dtype, pd.CategoricalDtype):
+        stock_codes = np.r_[categories.get_indexer(ticker.cat.categories.astype(str)), -1][ticker.cat.codes.to_numpy()]
+    else:
+        stock_codes = categories.get_indexer(ticker.astype(str))
+    stock_dates = stock_df['date'].to_numpy(dtype='datetime64[ns]')
+    stock_volume = stock_df['volume'].to_numpy(dtype='float64', na_value=np.nan)
+
+    date_codes, unique_dates = pd.factorize(np.concatenate([dates, stock_dates]))
+    keys = codes.astype('int64') * len(unique_dates) + date_codes[:len(dates)]
+    stock_keys = pd.Index(stock_codes.astype('int64') * len(unique_dates) + date_codes[len(dates):])
+    last = ~stock_keys.duplicated(keep='last') & (stock_codes >= 0)
+    position = stock_keys[last].get_indexer(keys)
+    return np.where(position >= 0, stock_volume[last][position], np.nan)
+
+def compute_sector_aggregates(
+    stock_df: pd.DataFrame,
+    derived_df: pd.DataFrame,
+    sectors: dict,
+    market_caps: dict = None
+) -> pd.DataFrame:
+    """
+    Computes the per-sector daily aggregates of the rows of every ticker on some dates: number of
+    tickers, advancers and decliners, total volume, and equal-weighted and market-cap-weighted
+    average of the daily returns. Rows are joined to their sector in-process and grouped by
+    (date, sector) at once. The aggregates of a date only depend on the rows of that date, so
+    computing them again after a reload gives the same result.
+
+    Args:
+        stock_df (pd.DataFrame): Stock data with 'date', 'ticker' and 'volume'.
+        derived_df (pd.DataFrame): Derived metrics of the same dates, with 'daily_return'.
+        sectors (dict): Mapping of ticker to sector, UNKNOWN_SECTOR for the missing ones.
+        market_caps (dict): Mapping of ticker to market cap, the weights of the cap-weighted
+            return. Tickers without a cap are left out of it. Default is None (not computed).
+
+    Returns:
+        pd.DataFrame: One row per (date, sector) with AGGREGATE_COLUMNS.
+    """
+    if derived_df.empty:
+        return pd.DataFrame(columns=AGGREGATE_COLUMNS)
+
+    ticker = derived_df['ticker']
+    codes, categories = (ticker.cat.codes.to_numpy(), ticker.cat.categories) \
+        if isinstance(ticker.dtype, pd.CategoricalDtype) else pd.factorize(ticker)
+    categories = pd.Index(categories).astype(str)
+    dates = derived_df['date'].to_numpy(dtype='datetime64[ns]')
+
+    # Per-ticker lookups, mapped to rows through the ticker codes
+    ticker_sector = pd.Categorical([sectors.get(t) or UNKNOWN_SECTOR for t in categories])
+    ticker_cap = np.array([(market_caps or {}).get(t) or np.nan for t in categories], dtype='float64')
+
+    volume = _align_volume(stock_df, categories, codes, dates)
+
+    daily_return = derived_df['daily_return'].to_numpy(dtype='float64', na_value=np.nan)
+    has_return = ~np.isnan(daily_return)
+    cap = ticker_cap[codes]
+    is_weighted = has_return & (cap > 0)
+    parts = {
+        'tickers': None,
+        'advancers': daily_return > 0,
+        'decliners': daily_return < 0,
+        'volume': np.nan_to_num(volume),
+        'return_count': has_return,
+        'return_sum': np.where(has_return, daily_return, 0.0),
+        'cap_weight_sum': np.where(is_weighted, cap, 0.0),
+        'cap_return_sum': np.where(is_weighted, cap * daily_return, 0.0),
+    }
+
+    # Sums per (date, sector) with one bincount per column over the integer group keys
+    date_codes, unique_dates = pd.factorize(dates, sort=True)
+    sector_codes = ticker_sector.codes[codes]
+    n_sectors = len(ticker_sector.categories)
+    groups = date_codes.astype('int64') * n_sectors + sector_codes
+    size = len(unique_dates) * n_sectors
+    sums = {name: np.bincount(groups, weights=values, minlength=size) for name, values in parts.items()}
+    present = np.flatnonzero(sums['tickers'])
+    aggregates_df = pd.DataFrame({
+        'date': unique_dates[present // n_sectors],
+        'sector': ticker_sector.categories.astype(str)[present % n_sectors],
+        **{name: values[present].round().astype('int64') if name in INTEGER_SUMS else values[present] for name, values in sums.items()},
+    })
+    return add_ratios(aggregates_df)
+
+def aggregate_data(sink, start, end, market_caps: dict = None) -> None:
+    """
+    Aggregation stage: recomputes the stored per-sector daily aggregates of the dates between start
+    and end (both included) from the stored metrics, prices and sectors of every ticker, replacing the
+    stored ones (see the sinks' refresh_aggregates).
+
+    Args:
+        sink (BigQuerySink | ParquetSink): Storage sink holding the loaded data and the aggregates table.
+        start (pd.Timestamp): First date to recompute.
+        end (pd.Timestamp): Last date to recompute.
+        market_caps (dict): Mapping of ticker to market cap. Default is None.
+    """
+    with track('aggregate') as m:
+        m['rows_out'] = sink.refresh_aggregates(start, end, market_caps)
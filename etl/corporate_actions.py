@@ -0,0 +1,97 @@
+import logging
+import numpy as np
+import pandas as pd
+from etl.extract import ACTION_COLUMNS, fetch_stock_data
+from utils.metrics import track, add_counts, record_failure
+from utils.price_cache import update_cache
+
+logger = logging.getLogger(__name__)
+
+ACTIONS_COLUMNS = ['date', 'ticker', 'dividends', 'stock_splits']
+
+def split_actions(raw_df: pd.DataFrame) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Separates the corporate actions from raw stock data downloaded with actions=True.
+
+    Args:
+        raw_df (pd.DataFrame): Raw stock data, with or without ACTION_COLUMNS.
+
+    Returns:
+        tuple[pd.DataFrame, pd.DataFrame]: Tuple containing:
+            - raw_df: The stock data without ACTION_COLUMNS.
+            - actions_df: One row per dividend or split, with ACTIONS_COLUMNS.
+    """
+    present = [c for c in ACTION_COLUMNS if c in raw_df.columns]
+    if not present:
+        return raw_df, pd.DataFrame(columns=ACTIONS_COLUMNS)
+
+    def column(name):
+        if name not in raw_df.columns:
+            return np.zeros(len(raw_df))
+        return np.nan_to_num(raw_df[name].to_numpy(dtype='float64', na_value=np.nan))
+
+    dividends, splits = column('Dividends'), column('Stock Splits')
+    # yfinance reports a 0 split ratio on days without a split, 1 is not a split either
+    has_action = (dividends > 0) | ((splits > 0) & (splits != 1))
+    actions_df = pd.DataFrame({
+        'date': raw_df['date'].to_numpy()[has_action],
+        'ticker': raw_df['Ticker'].astype(str).to_numpy()[has_action],
+        'dividends': dividends[has_action],
+        'stock_splits': splits[has_action],
+    })
+    return raw_df.drop(columns=present), actions_df
+
+def get_replaced_tickers(actions_df: pd.DataFrame | None) -> list:
+    """ Returns the tickers whose stored history is replaced because of a corporate action. """
+    if actions_df is None or actions_df.empty:
+        return []
+    return sorted(actions_df['ticker'].unique())
+
+def refresh_adjusted_history(raw_df: pd.DataFrame, interval: str = '1d', cache_dir: str = None) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Corporate-action stage: prices are downloaded adjusted, so a dividend or split rescales
+    every earlier price of the ticker. When the incrementally extracted rows of a ticker include
+    one, its whole history is downloaded again, to replace the stored rows on the old basis.
+    Tickers without actions keep their incremental rows.
+
+    Tickers whose history can't be downloaded again are dropped from the batch. Their watermark
+    doesn't move, so the next run detects the action again.
+
+    Args:
+        raw_df (pd.DataFrame): Raw stock data of a batch, with ACTION_COLUMNS on the incremental rows.
+        interval (str): Interval of the stock data. Default is '1d'.
+        cache_dir (str): Directory of the raw price cache, updated with the new history. Default is None.
+
+    Returns:
+        tuple[pd.DataFrame, pd.DataFrame]: Tuple containing:
+            - raw_df: Stock data without ACTION_COLUMNS, with the full history of the refreshed tickers.
+            - actions_df: Corporate actions of the refreshed tickers, see get_replaced_tickers.
+    """
+    raw_df, actions_df = split_actions(raw_df)
+    if actions_df.empty:
+        return raw_df, actions_df
+
+    tickers = get_replaced_tickers(actions_df)
+    logger.info(f"{len(actions_df)} corporate action(s) since the last run, downloading the adjusted history of {len(tickers)} ticker(s) again.")
+    with track('extract.refresh', rows_in=len(tickers)) as m:
+        history_df = fetch_stock_data(tickers, period='max', interval=interval)
+        m['rows_out'] = len(history_df)
+
+    refreshed = set(history_df['Ticker'].astype(str).unique()) if not history_df.empty else set()
+    failed = [t for t in tickers if t not in refreshed]
+    for ticker in failed:
+        record_failure(ticker, 'extract.refresh', 'adjusted history not downloaded, retried by the next run')
+    if cache_dir and not history_df.empty:
+        update_cache(history_df, interval, cache_dir)
+
+    add_counts('corporate_actions', {
+        'dividends': int((actions_df['dividends'] > 0).sum()),
+        'splits': int((actions_df['stock_splits'] > 0).sum()),
+        'refreshed_tickers': len(refreshed),
+        'failed_tickers': len(failed),
+    })
+    frames = [raw_df[~raw_df['Ticker'].astype(str).isin(tickers)]]
+    if not history_df.empty:
+        frames.append(history_df)
+    raw_df = pd.concat(frames, ignore_index=True)
+    return raw_df, actions_df[actions_df['ticker'].isin(refreshed)].reset_index(drop=True)
@@ -0,0 +1,123 @@
+import logging
+from datetime import date, timedelta
+import numpy as np
+import pandas as pd
+from utils.metrics import track
+
+logger = logging.getLogger(__name__)
+
+MOVING_AVERAGE_WINDOWS = (20, 50, 200)
+VOLATILITY_WINDOW = 20
+TRADING_DAYS_PER_YEAR = 252
+# Closes of the previous rows needed to compute the metrics of a new row
+STATE_ROWS = max(*MOVING_AVERAGE_WINDOWS, VOLATILITY_WINDOW + 1)
+
+DERIVED_COLUMNS = ['daily_return'] + [f'ma_{w}' for w in MOVING_AVERAGE_WINDOWS] + [f'volatility_{VOLATILITY_WINDOW}']
+
+def get_state_start(before: date, rows: int = STATE_ROWS) -> date:
+    """ Returns a date far enough before `before` to include `rows` trading days (holidays included). """
+    return before - timedelta(days=int(rows * 7 / 5) + 15)
+
+def _rolling_window_sums(values: np.ndarray, group_start: np.ndarray, window: int) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Sums, sums of squares and counts of the non-NaN values over the last `window` rows of each
+    row's group, computed from cumulative sums. Rows must be sorted by group.
+    """
+    valid = ~np.isnan(values)
+    filled = np.where(valid, values, 0.0)
+    sums = np.concatenate(([0.0], np.cumsum(filled)))
+    squares = np.concatenate(([0.0], np.cumsum(filled * filled)))
+    counts = np.concatenate(([0], np.cumsum(valid)))
+    end = np.arange(1, len(values) + 1)
+    start = np.maximum(end - window, group_start)
+    return sums[end] - sums[start], squares[end] - squares[start], counts[end] - counts[start]
+
+def compute_derived_metrics(stock_df: pd.DataFrame, state_df: pd.DataFrame = None) -> pd.DataFrame:
+    """
+    Computes the daily return, moving averages and annualized rolling volatility of the close price
+    for every row of stock_df. All tickers are processed at once with cumulative sums over the rows
+    sorted by ticker and date, instead of per-ticker rolling windows.
+
+    Args:
+        stock_df (pd.DataFrame): Transformed stock data with 'date', 'ticker' and 'close' columns.
+        state_df (pd.DataFrame): Stored rows preceding stock_df for each ticker (at least the last
+            STATE_ROWS rows), so that incremental runs don't need the full history. Default is None.
+
+    Returns:
+        pd.DataFrame: One row per row of stock_df with 'date', 'ticker' and DERIVED_COLUMNS.
+            Metrics without a full window of data are NaN.
+    """
+    if stock_df.empty or 'close' not in stock_df.columns:
+        return pd.DataFrame(columns=['date', 'ticker'] + DERIVED_COLUMNS)
+
+    frames = [stock_df[['date', 'ticker', 'close']]]
+    if state_df is not None and not state_df.empty:
+        state_df = state_df[['date', 'ticker', 'close']]
+        if getattr(state_df['date'].dt, 'tz', None) is not None:
+            state_df = state_df.assign(date=state_df['date'].dt.tz_convert(None))
+        frames.insert(0, state_df)
+    df = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+    is_new = np.r_[np.zeros(len(df) - len(stock_df), dtype=bool), np.ones(len(stock_df), dtype=bool)]
+
+    # Sort by ticker code and date (stable, so new rows stay after state rows of the same date)
+    codes, categories = pd.factorize(df['ticker'], sort=True)
+    dates = df['date'].to_numpy(dtype='datetime64[ns]').view('int64')
+    order = np.lexsort((dates, codes))
+    codes, dates, is_new = codes[order], dates[order], is_new[order]
+    close = df['close'].to_numpy(dtype='float64')[order]
+
+    # Keep the last row of duplicated (ticker, date) keys
+    keep = np.r_[(codes[1:] != codes[:-1]) | (dates[1:] != dates[:-1]), True]
+    codes, dates, is_new, close = codes[keep], dates[keep], is_new[keep], close[keep]
+
+    n_rows = len(codes)
+    is_group_start = np.r_[True, codes[1:] != codes[:-1]]
+    group_start = np.maximum.accumulate(np.where(is_group_start, np.arange(n_rows), 0))
+
+    previous_close = np.r_[np.nan, close[:-1]]
+    previous_close[is_group_start] = np.nan
+    daily_return = close / previous_close - 1
+
+    metrics = {'daily_return': daily_return}
+    for window in MOVING_AVERAGE_WINDOWS:
+        sums, _, counts = _rolling_window_sums(close, group_start, window)
+        metrics[f'ma_{window}'] = np.where(counts == window, sums / window, np.nan)
+
+    sums, squares, counts = _rolling_window_sums(daily_return, group_start, VOLATILITY_WINDOW)
+    variance = np.maximum(squares - sums * sums / VOLATILITY_WINDOW, 0.0) / (VOLATILITY_WINDOW - 1)
+    metrics[f'volatility_{VOLATILITY_WINDOW}'] = np.where(
+        counts == VOLATILITY_WINDOW, np.sqrt(variance * TRADING_DAYS_PER_YEAR), np.nan
+    )
+
+    derived_df = pd.DataFrame({name: values[is_new].astype('float32') for name, values in metrics.items()})
+    derived_df.insert(0, 'ticker', pd.Categorical.from_codes(codes[is_new], categories=pd.Index(categories).astype(str)))
+    derived_df.insert(0, 'date', dates[is_new].view('datetime64[ns]'))
+    return derived_df
+
+def derive_data(stock_df: pd.DataFrame, ticker_buckets: dict, sink) -> pd.DataFrame:
+    """
+    Derived-metrics stage: loads the trailing window of stored closes of the incrementally
+    extracted tickers from the sink and computes the metrics of the new rows only.
+
+    Args:
+        stock_df (pd.DataFrame): Transformed stock data of a batch.
+        ticker_buckets (dict): Mapping of start date to tickers of the batch (None for full history).
+        sink (BigQuerySink | ParquetSink): Storage sink holding the previously loaded prices.
+
+    Returns:
+        pd.DataFrame: Derived metrics of the rows of stock_df.
+    """
+    with track('derive', rows_in=len(stock_df)) as m:
+        state_frames = []
+        for start, tickers in ticker_buckets.items():
+            if start is None or not tickers:
+                continue
+            with track('derive.state', rows_in=len(tickers)) as state_m:
+                state_df = sink.get_trailing_closes(tickers, start, STATE_ROWS)
+                state_m['rows_out'] = len(state_df)
+            if not state_df.empty:
+                state_frames.append(state_df)
+        state_df = pd.concat(state_frames, ignore_index=True) if state_frames else None
+        derived_df = compute_derived_metrics(stock_df, state_df)
+        m['rows_out'] = len(derived_df)
+    return derived_df
@@ -1,29 +1,63 @@
 import logging
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import threading
+import numpy as np
 import pandas as pd
 import yfinance as yf
+from utils.extract_helpers import to_date
+from utils.intervals import is_intraday, get_download_windows
+from utils.metrics import record_failure, track
+from utils.price_cache import split_cached_buckets, update_cache
+from utils.rate_limit import get_scheduler
+from utils.sector_cache import resolve_sectors, refresh_stale_sectors, wait_for_sector_refresh, pop_refreshed_sectors
 
 logger = logging.getLogger(__name__)
 
+# Columns of the corporate actions returned by yf.download(actions=True)
+ACTION_COLUMNS = ['Dividends', 'Stock Splits']
+
+# Downloads of the tickers missing from a multi-ticker result (the first one included)
+MISSING_TICKER_ATTEMPTS = 2
+
+# yfinance (0.2.x) collects the results of yf.download in module globals, so two downloads running
+# at once can mix or lose bars without any error. Every download holds this lock, taken before the
+# fetch scheduler so that waiting threads don't hold its slots and tokens.
+_download_lock = threading.Lock()
+
 def extract_data(
     existing_tickers: list = None,
     missing_tickers: list = None,
     period: str = 'max',
     interval: str = '1d',
     start_date: str = None,
-    end: str = None
+    end: str = None,
+    ticker_buckets: dict = None,
+    cache_dir: str = None,
+    sector_cache_path: str = None,
+    sector_cache_ttl_days: float = 30,
+    actions: bool = False
 ) -> tuple[pd.DataFrame, pd.DataFrame]:
     """
     Extracts stock and sector data for a list of tickers.
     If a ticker is not found in the sector table, it will be fetched separately.
+    When ticker_buckets is provided, one download is made per start date bucket
+    and existing_tickers/start_date are ignored.
 
     Args:
-        tickers_to_update (list): List of stock tickers to update.
+        existing_tickers (list): List of stock tickers to update from start_date.
         missing_tickers (list): List of tickers that are missing from the sector table.
         period (str): Time period for stock data (e.g., '5d', '1mo', '1y', 'max'). Default is 'max'.
         interval (str): Interval for stock data (e.g., '1d', '1h'). Default is '1d'.
         start_date (str): Start date for stock data in 'YYYY-MM-DD' format. Default is None.
         end (str): End date for stock data in 'YYYY-MM-DD' format. Default is None.
+        ticker_buckets (dict): Mapping of start date to tickers sharing it. Tickers under None
+            are fetched using period. Default is None.
+        cache_dir (str): Directory of the local raw data cache. Cached ranges are served locally and
+            only the missing ranges are downloaded. Default is None (cache disabled). Only daily
+            data is cached, and incremental ranges are not served from it with actions.
+        sector_cache_path (str): Path to the persistent sector cache. Default is None (cache disabled).
+        sector_cache_ttl_days (float): Days after which cached sectors are refreshed. Default is 30.
+        actions (bool): Whether to download the dividends and splits of the incremental ranges
+            along with their prices, in ACTION_COLUMNS (see etl.corporate_actions). Default is False.
     
     Returns:
         tuple[pd.DataFrame, pd.DataFrame]: Tuple containing two DataFrames:
@@ -37,44 +71,61 @@ def extract_data(
     all_sector_data = []
     failed_tickers = []
 
-    logger.info("Fetching stock data...")
-    try:
+    if ticker_buckets is None:
+        ticker_buckets = {}
         if existing_tickers:
-            if start_date:
-                stock_data = fetch_stock_data(existing_tickers, interval=interval, start=start_date, end=end)
-            else:
-                stock_data = fetch_stock_data(existing_tickers, period=period, interval=interval)
-            if not stock_data.empty:
-                all_stock_data.append(stock_data)
-
+            ticker_buckets[start_date] = list(existing_tickers)
         if missing_tickers:
-            stock_data = fetch_stock_data(missing_tickers, period=period, interval=interval)
+            ticker_buckets.setdefault(None, []).extend(missing_tickers)
+
+    # The cache tracks whole days, intraday bars are always downloaded
+    if is_intraday(interval):
+        cache_dir = None
+
+    if cache_dir:
+        # The cache doesn't keep the corporate actions, so incremental ranges are downloaded when they are needed
+        uncached_buckets = {start: tickers for start, tickers in ticker_buckets.items() if actions and start}
+        with track('extract.cache_read', rows_in=sum(len(t) for t in ticker_buckets.values())) as m:
+            cached_frames, ticker_buckets = split_cached_buckets(
+                {start: tickers for start, tickers in ticker_buckets.items() if start not in uncached_buckets},
+                interval, cache_dir, period=period, end=end
+            )
+            all_stock_data.extend(df for df in cached_frames if not df.empty)
+            m['rows_out'] = sum(len(df) for df in cached_frames)
+        for start, tickers in uncached_buckets.items():
+            ticker_buckets.setdefault(to_date(start), []).extend(tickers)
+
+    logger.info("Fetching stock data...")
+    for bucket_start, bucket_tickers in ticker_buckets.items():
+        if not bucket_tickers:
+            continue
+        try:
+            if bucket_start:
+                stock_data = fetch_stock_data(bucket_tickers, interval=interval, start=bucket_start, end=end, actions=actions)
+            else:
+                stock_data = fetch_stock_data(bucket_tickers, period=period, interval=interval)
             if not stock_data.empty:
                 all_stock_data.append(stock_data)
-                
-    except Exception as e:
-        logger.error(f"Error fetching bulk stock data: {e}")
+                if cache_dir and (bucket_start or period == 'max'):
+                    with track('extract.cache_write', rows_in=len(stock_data)):
+                        update_cache(stock_data.drop(columns=ACTION_COLUMNS, errors='ignore'), interval, cache_dir, requested_start=bucket_start)
+        except Exception as e:
+            logger.error(f"Error fetching bulk stock data starting {bucket_start or period}: {e}")
+            for ticker in bucket_tickers:
+                record_failure(ticker, 'extract.download', e)
 
-    # Fetch sector data only for missing tickers using parallel execution
+    # Resolve sector data only for missing tickers, fetching from Yahoo only what is unknown locally
     if missing_tickers:
-        logger.info("Fetching sector data for missing tickers...")
-        max_workers = min(15, len(missing_tickers))
-        
-        with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            future_to_ticker = {
-                executor.submit(fetch_sector_data, ticker): ticker 
-                for ticker in missing_tickers
-            }
-            
-            for future in as_completed(future_to_ticker):
-                ticker = future_to_ticker[future]
-                try:
-                    sector_data = future.result()
-                    all_sector_data.append(sector_data)
-                except Exception as e:
-                    logger.error(f"Error fetching sector data for {ticker}: {e}")
-                    failed_tickers.append(ticker)
-                    all_sector_data.append({'ticker': ticker, 'sector': 'N/A'})
+        logger.info("Resolving sector data for missing tickers...")
+        with track('extract.sectors', rows_in=len(missing_tickers)) as m:
+            all_sector_data = resolve_sectors(
+                missing_tickers,
+                fetch_sector_info,
+                cache_path=sector_cache_path,
+                ttl_days=sector_cache_ttl_days
+            )
+            failed_tickers = [s['ticker'] for s in all_sector_data if s['sector'] == 'N/A']
+            m['rows_out'] = len(all_sector_data) - len(failed_tickers)
 
     # Combine all stock data
     stock_df = pd.concat(all_stock_data, ignore_index=True) if all_stock_data else pd.DataFrame()
@@ -84,50 +135,208 @@ def extract_data(
 
     # Log failed tickers
     if failed_tickers:
-        logger.warning(f"Failed to fetch data for the following tickers: {failed_tickers}")
+        logger.warning(f"No sector found for the following tickers: {failed_tickers}")
 
     return stock_df, sector_df
 
-def fetch_stock_data(ticker: str | list, period: str = 'max', interval: str = '1d', start: str = None, end: str = None) -> pd.DataFrame:
+def download_prices(ticker: str | list, **kwargs) -> tuple[pd.DataFrame, list]:
+    """
+    Downloads prices from Yahoo Finance in a single yf.download call (which fetches the tickers of
+    the call concurrently itself). Callers must hold _download_lock, see download_window.
+    yfinance logs per-ticker download errors (throttling, timeouts) instead of raising them and
+    leaves those tickers without data, so failed tickers are detected from the returned frame:
+    a requested ticker without columns or price rows while other tickers have some.
+    A download without any row is an empty range and is not retried.
+
+    Args:
+        ticker (str | list): Stock ticker symbol or a list of ticker symbols.
+        **kwargs: Keyword arguments for yf.download (period or start/end, interval).
+
+    Returns:
+        tuple[pd.DataFrame, list]: Tuple containing the downloaded DataFrame and the tickers
+            missing from it.
+    """
+    tickers = [ticker] if isinstance(ticker, str) else list(ticker)
+    with track('extract.download', rows_in=len(tickers)) as m:
+        df = yf.download(ticker, auto_adjust=True, group_by='ticker', **kwargs)
+        m['rows_out'] = len(df)
+
+    if df.empty or len(tickers) == 1 or not isinstance(df.columns, pd.MultiIndex):
+        return df, []
+    price_columns = [c for c in df.columns if c[1] not in ACTION_COLUMNS]
+    has_rows = df[price_columns].notna().any().groupby(level=0).any()
+    if not has_rows.any():
+        return df, []
+    return df, [t for t in tickers if not has_rows.get(t, False)]
+
+def fetch_stock_data(ticker: str | list, period: str = 'max', interval: str = '1d', start: str = None, end: str = None, actions: bool = False) -> pd.DataFrame:
     """
     Fetches historical stock data for a given ticker.
+    Downloads go through the shared fetch scheduler, and tickers missing from a download
+    (see download_prices) are downloaded once more before being left out.
+    Intraday ranges are split into windows that fit the Yahoo Finance limits of the interval,
+    downloaded one after the other (downloads can't run concurrently, see _download_lock), and
+    stitched together without duplicated bars.
 
     Args:
         ticker (str | list): Stock ticker symbol or a list of ticker symbols.
         period (str): Time period for stock data (e.g., '5d', '1mo', '1y', 'max'). Default is 'max'.
+            Intraday intervals ignore it and fetch all the available history when start is None.
         interval (str): Interval for stock data (e.g., '1d', '1h'). Default is '1d'.
         start (str): Start date for stock data in 'YYYY-MM-DD' format. Default is None.
         end (str): End date for stock data in 'YYYY-MM-DD' format. Default is None.
+        actions (bool): Whether to also download dividends and splits, in ACTION_COLUMNS. Default is False.
 
     Returns:
         pd.DataFrame: DataFrame containing the stock data. Returns an empty DataFrame if no data is found.
     """
+    if is_intraday(interval):
+        windows = get_download_windows(interval, to_date(start), to_date(end))
+        if start and windows and windows[0][0] > to_date(start):
+            logger.warning(f"Yahoo Finance only serves {interval} data since {windows[0][0]}, earlier bars are skipped.")
+        requests = [{'start': s.isoformat(), 'end': e.isoformat(), 'interval': interval} for s, e in windows]
+    elif start:
+        # Use start and end dates if provided
+        requests = [{'start': start, 'end': end, 'interval': interval}]
+    else:
+        # Use period if no start date is provided
+        requests = [{'period': period, 'interval': interval}]
+    if actions:
+        requests = [{**kwargs, 'actions': True} for kwargs in requests]
+
+    frames = [frame for kwargs in requests for frame in download_window(ticker, kwargs)]
+
+    if not frames:
+        logger.warning(f"No data found for {ticker}")
+        return pd.DataFrame()
+    df = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+    if len(requests) > 1:
+        # Bars on the boundary of two windows may be returned twice
+        df = df.drop_duplicates(subset=['Ticker', 'date'], keep='last', ignore_index=True)
+    return df
+
+def download_window(ticker: str | list, download_kwargs: dict) -> list[pd.DataFrame]:
+    """
+    Downloads one range of prices. Tickers missing from the result are downloaded once more
+    without backoff, and are then left out as missing data (delisted, halted or without new
+    bars): they don't count as throttling, which the fetch scheduler only records for errors
+    raised by the download itself.
+
+    Args:
+        ticker (str | list): Stock ticker symbol or a list of ticker symbols.
+        download_kwargs (dict): Keyword arguments for yf.download (period or start/end, interval).
+
+    Returns:
+        list[pd.DataFrame]: Reshaped stock data of each successful attempt.
+    """
+    scheduler = get_scheduler()
+    frames = []
+    pending = ticker
     try:
-        if start:
-            # Use start and end dates if provided
-            df = yf.download(ticker, start=start, end=end, interval=interval, auto_adjust=True, group_by='ticker')
-        else:
-            # Use period if no start date is provided
-            df = yf.download(ticker, period=period, interval=interval, auto_adjust=True, group_by='ticker')
-
-        if df.empty:
-            logger.warning(f"No data found for {ticker}")
-            return df
-        
-        # Reshape multi-ticker DataFrame into standard tabular format
-        if isinstance(df.columns, pd.MultiIndex):
-            df = df.stack(level=0, future_stack=True)
-            df.index.names = ['Date', 'Ticker']
-            df.reset_index(inplace=True)
-        else:
-            df.reset_index(inplace=True)
-            df['Ticker'] = ticker if isinstance(ticker, str) else ticker[0]
-
-        df.rename(columns={'Date': 'date'}, inplace=True)
-        return df
+        for attempt in range(MISSING_TICKER_ATTEMPTS):
+            with _download_lock:
+                df, missing_tickers = scheduler.call(download_prices, pending, **download_kwargs)
+            if missing_tickers and isinstance(df.columns, pd.MultiIndex):
+                df = df.drop(columns=missing_tickers, level=0, errors='ignore')
+            if not df.empty:
+                with track('extract.reshape', rows_in=len(df)) as m:
+                    frames.append(reshape_stock_data(df, pending))
+                    m['rows_out'] = len(frames[-1])
+            if not missing_tickers:
+                break
+            if attempt == MISSING_TICKER_ATTEMPTS - 1:
+                logger.warning(f"No data returned for {len(missing_tickers)} ticker(s): {missing_tickers}")
+                break
+            logger.info(f"Downloading {len(missing_tickers)} ticker(s) missing from the result again...")
+            pending = missing_tickers
     except Exception as e:
         logger.error(f"Error during data fetch for {ticker}: {e}")
-        return pd.DataFrame()
+        for t in [pending] if isinstance(pending, str) else pending:
+            record_failure(t, 'extract.download', e)
+    return frames
+
+def reshape_stock_data(df: pd.DataFrame, ticker: str | list) -> pd.DataFrame:
+    """
+    Reshapes a DataFrame returned by yf.download into standard tabular format,
+    with one row per date and ticker. Multi-ticker frames are reshaped with a single
+    NumPy reshape instead of DataFrame.stack, and rows without any price
+    (dates before a ticker was listed) are dropped. Timezone-aware (intraday)
+    timestamps are converted to UTC.
+    """
+    if not isinstance(df.columns, pd.MultiIndex):
+        df = df.reset_index()
+        df['Ticker'] = ticker if isinstance(ticker, str) else ticker[0]
+        df = df.rename(columns={'Date': 'date', 'Datetime': 'date'})
+        if getattr(df['date'].dt, 'tz', None) is not None:
+            df['date'] = df['date'].dt.tz_convert('UTC')
+        return df
+
+    tickers = df.columns.get_level_values(0).unique()
+    fields = df.columns.get_level_values(1).unique()
+    full_columns = pd.MultiIndex.from_product([tickers, fields])
+    if not df.columns.equals(full_columns):
+        df = df.reindex(columns=full_columns)
+
+    # Columns are ticker-major, so each row splits into (ticker, field) blocks
+    n_dates, n_tickers, n_fields = len(df.index), len(tickers), len(fields)
+    values = df.to_numpy(dtype='float64').reshape(n_dates * n_tickers, n_fields)
+    price_fields = [i for i, field in enumerate(fields) if field not in ACTION_COLUMNS]
+    has_data = ~np.isnan(values if len(price_fields) == n_fields else values[:, price_fields]).all(axis=1)
+
+    long_df = pd.DataFrame(values[has_data], columns=list(fields))
+    long_df.insert(0, 'Ticker', pd.Categorical.from_codes(
+        np.tile(np.arange(n_tickers), n_dates)[has_data], categories=tickers
+    ))
+    # Repeat the timestamps as naive datetime64 values, tz-aware indexes would be repeated as objects
+    index = df.index
+    tz = getattr(index, 'tz', None)
+    if tz is not None:
+        index = index.tz_convert('UTC').tz_localize(None)
+    dates = np.repeat(index.to_numpy(), n_tickers)[has_data]
+    long_df.insert(0, 'date', pd.DatetimeIndex(dates).tz_localize('UTC') if tz is not None else dates)
+    return long_df
+
+def fetch_sector_info(ticker: str) -> str:
+    """
+    Fetches the sector of a ticker from Yahoo Finance.
+
+    Args:
+        ticker (str): Stock ticker symbol.
+
+    Returns:
+        str: Sector of the ticker, 'N/A' if Yahoo has no sector for it.
+
+    Raises:
+        Exception: If the request to Yahoo Finance fails.
+    """
+    info = get_scheduler().call(lambda: yf.Ticker(ticker).info)
+    return info.get('sector', 'N/A')
+
+def schedule_sector_refresh(tickers: list, cache_path: str, ttl_days: float = 30) -> int:
+    """ Refreshes in the background the cached sectors of tickers older than ttl_days, see upsert_refreshed_sectors. """
+    if not cache_path:
+        return 0
+    return refresh_stale_sectors(tickers, fetch_sector_info, cache_path, ttl_days)
+
+def upsert_refreshed_sectors(sink) -> int:
+    """
+    Waits for the background sector refreshes and batch-writes their results into the sink's sectors
+    table. Called once every batch is loaded, so a refreshed sector replaces the stale one a batch
+    may have loaded.
+
+    Args:
+        sink (BigQuerySink | ParquetSink): Storage sink holding the sectors table.
+
+    Returns:
+        int: Number of sectors written.
+    """
+    wait_for_sector_refresh()
+    refreshed = pop_refreshed_sectors()
+    if refreshed:
+        with track('load.sector_refresh', rows_in=len(refreshed)):
+            sink.upsert_sectors(pd.DataFrame({'ticker': list(refreshed), 'sector': list(refreshed.values())}))
+        logger.info(f"Wrote {len(refreshed)} refreshed sector(s) to the sectors table.")
+    return len(refreshed)
 
 def fetch_sector_data(ticker: str) -> dict:
     """
@@ -141,12 +350,7 @@ def fetch_sector_data(ticker: str) -> dict:
               If the sector information is unavailable, 'N/A' is returned as the sector.
     """
     try:
-        info = yf.Ticker(ticker).info
-        sector_data = {
-            'ticker': ticker,
-            'sector': info.get('sector', 'N/A'),
-        }
-        return sector_data
+        return {'ticker': ticker, 'sector': fetch_sector_info(ticker)}
     except Exception as e:
         logger.error(f"Error fetching sector data for {ticker}: {e}")
-        return {'ticker': ticker, 'sector': 'N/A'}
\ No newline at end of file
+        return {'ticker': ticker, 'sector': 'N/A'}
@@ -1,14 +1,133 @@
+import io
+import random
+import threading
+import time
+import uuid
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 from typing import List
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from google.api_core.exceptions import NotFound
 from google.cloud import bigquery
+from etl.aggregate import AGGREGATE_COLUMNS, UNKNOWN_SECTOR
 from utils.google_cloud import get_bigquery_client
+from utils.metrics import track
 import logging
 
 logger = logging.getLogger(__name__)
 
-def load_data(dataframes: List[pd.DataFrame], credentials_dict: dict, project_id: str, dataset_id: str, table_ids: List[str], write_disposition: str = "WRITE_APPEND") -> str:
+STOCKS_SCHEMA = [
+    bigquery.SchemaField("date", "TIMESTAMP", mode="REQUIRED"),
+    bigquery.SchemaField("ticker", "STRING", mode="REQUIRED"),
+    bigquery.SchemaField("open", "FLOAT"),
+    bigquery.SchemaField("high", "FLOAT"),
+    bigquery.SchemaField("low", "FLOAT"),
+    bigquery.SchemaField("close", "FLOAT"),
+    bigquery.SchemaField("volume", "INTEGER"),
+]
+
+SECTORS_SCHEMA = [
+    bigquery.SchemaField("ticker", "STRING", mode="REQUIRED"),
+    bigquery.SchemaField("sector", "STRING"),
+]
+
+DERIVED_SCHEMA = [
+    bigquery.SchemaField("date", "TIMESTAMP", mode="REQUIRED"),
+    bigquery.SchemaField("ticker", "STRING", mode="REQUIRED"),
+    bigquery.SchemaField("daily_return", "FLOAT"),
+    bigquery.SchemaField("ma_20", "FLOAT"),
+    bigquery.SchemaField("ma_50", "FLOAT"),
+    bigquery.SchemaField("ma_200", "FLOAT"),
+    bigquery.SchemaField("volatility_20", "FLOAT"),
+]
+
+QUARANTINE_SCHEMA = STOCKS_SCHEMA + [
+    bigquery.SchemaField("reason", "STRING"),
+]
+
+AGGREGATES_SCHEMA = [
+    bigquery.SchemaField("date", "TIMESTAMP", mode="REQUIRED"),
+    bigquery.SchemaField("sector", "STRING", mode="REQUIRED"),
+    bigquery.SchemaField("tickers", "INTEGER"),
+    bigquery.SchemaField("advancers", "INTEGER"),
+    bigquery.SchemaField("decliners", "INTEGER"),
+    bigquery.SchemaField("volume", "INTEGER"),
+    bigquery.SchemaField("equal_weighted_return", "FLOAT"),
+    bigquery.SchemaField("cap_weighted_return", "FLOAT"),
+    bigquery.SchemaField("return_count", "INTEGER"),
+    bigquery.SchemaField("return_sum", "FLOAT"),
+    bigquery.SchemaField("cap_weight_sum", "FLOAT"),
+    bigquery.SchemaField("cap_return_sum", "FLOAT"),
+]
+
+# Table layouts used by the ETL: staged loads are MERGEd into the target on merge_keys
+STOCKS_TABLE_CONFIG = {
+    'schema': STOCKS_SCHEMA,
+    'partition_field': 'date',
+    'cluster_fields': ['ticker'],
+    'merge_keys': ['ticker', 'date'],
+}
+
+SECTORS_TABLE_CONFIG = {
+    'schema': SECTORS_SCHEMA,
+    'cluster_fields': ['ticker'],
+    'merge_keys': ['ticker'],
+}
+
+DERIVED_TABLE_CONFIG = {
+    'schema': DERIVED_SCHEMA,
+    'partition_field': 'date',
+    'cluster_fields': ['ticker'],
+    'merge_keys': ['ticker', 'date'],
+}
+
+QUARANTINE_TABLE_CONFIG = {
+    'schema': QUARANTINE_SCHEMA,
+    'partition_field': 'date',
+    'cluster_fields': ['ticker'],
+    'merge_keys': ['ticker', 'date'],
+}
+
+# A few rows per day, clustered instead of partitioned. Rows are recomputed from the stored tables
+# (see refresh_aggregates_in_bigquery) instead of loaded.
+AGGREGATES_TABLE_CONFIG = {
+    'schema': AGGREGATES_SCHEMA,
+    'cluster_fields': ['sector', 'date'],
+    'merge_keys': ['date', 'sector'],
+}
+
+BIGQUERY_TO_ARROW_TYPES = {
+    'STRING': pa.string(),
+    'INTEGER': pa.int64(),
+    'TIMESTAMP': pa.timestamp('us', tz='UTC'),
+    'DATETIME': pa.timestamp('us'),
+    'DATE': pa.date32(),
+}
+
+# Attempts of a MERGE conflicting with a concurrent one on the same partitions (e.g. from another
+# task of a sharded run), BigQuery only retries such conflicts a few times on its own
+MERGE_CONFLICT_ATTEMPTS = 5
+
+_ensured_tables = {}
+_ensured_datasets = set()
+_ensured_lock = threading.Lock()
+_job_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='bq-load')
+
+def configure_load_jobs(max_jobs_in_flight: int) -> None:
+    """ Sets the maximum number of BigQuery load jobs running at the same time across all loads. """
+    global _job_executor
+    _job_executor.shutdown(wait=True)
+    _job_executor = ThreadPoolExecutor(max_workers=max(1, max_jobs_in_flight), thread_name_prefix='bq-load')
+
+def load_data(dataframes: List[pd.DataFrame], credentials_dict: dict, project_id: str, dataset_id: str, table_ids: List[str], write_disposition: str = "WRITE_APPEND", table_configs: List[dict] = None, client: bigquery.Client = None, replace_tickers: List[str] = None) -> str:
     """
     Loads the transformed stock and sector data into BigQuery.
+    Tables with a config are provisioned with its schema, partitioning and clustering,
+    and loaded idempotently through a staging table MERGEd on the config's merge keys.
+    Each DataFrame is serialized once to zstd-compressed Parquet, and the load jobs of all
+    DataFrames are submitted at the same time and waited on together.
 
     Args:
         dataframes (List[pd.DataFrame]): List of DataFrames to load into BigQuery.
@@ -17,40 +136,107 @@ def load_data(dataframes: List[pd.DataFrame], credentials_dict: dict, project_id
         dataset_id (str): The ID of the dataset in BigQuery.
         table_ids (List[str]): List of table IDs in BigQuery corresponding to the DataFrames.
         write_disposition (str): BigQuery write disposition (e.g., 'WRITE_APPEND', 'WRITE_TRUNCATE').
+            Only used for tables without a config.
+        table_configs (List[dict]): Optional list of table configs (e.g. STOCKS_TABLE_CONFIG)
+            corresponding to the DataFrames. None entries are loaded with write_disposition.
+        client (bigquery.Client): Optional authenticated client to reuse. A new one is created
+            from credentials_dict if not provided.
+        replace_tickers (List[str]): Tickers whose stored rows are replaced by the DataFrames' rows
+            instead of merged with them (see replace_parquet_in_bigquery). Only for tables with a
+            config merged on 'ticker' and 'date'. Default is None.
 
     Returns:
-        str: 'success' if all dataframes are loaded successfully, 'failure' otherwise.
+        str: 'success' if all dataframes are loaded successfully, 'failure' if any serialization or load job fails.
     """
     if not dataframes or not table_ids:
         raise ValueError("DataFrames and table IDs cannot be empty.")
     if len(dataframes) != len(table_ids):
         raise ValueError("The number of DataFrames must match the number of table IDs.")
 
-    client = get_bigquery_client(credentials_dict, project_id)
+    table_configs = table_configs or [None] * len(table_ids)
+    client = client or get_bigquery_client(credentials_dict, project_id)
     create_dataset(client, dataset_id)
 
-    for df, table_id in zip(dataframes, table_ids):
+    status = 'success'
+    futures = {}
+    for df, table_id, config in zip(dataframes, table_ids, table_configs):
         if df.empty:
             continue
+        table_id_full = f"{project_id}.{dataset_id}.{table_id}"
+        logger.info(f"Loading data into table {table_id_full}...")
         try:
-            table_id_full = f"{project_id}.{dataset_id}.{table_id}"
-            logger.info(f"Loading data into table {table_id_full}...")
-            load_df_to_bigquery(df, table_id_full, client, write_disposition=write_disposition)
-            logger.info(f"Data loaded successfully into table {table_id_full}.")
+            # Rows are serialized with the column types of the existing table, e.g. DATETIME dates
+            schema = ensure_table(client, table_id_full, config) if config else None
+            with track('load.serialize', rows_in=len(df)) as m:
+                payload = df_to_parquet_bytes(df, schema)
+                m['bytes_out'] = len(payload)
+            if config and replace_tickers:
+                futures[table_id_full] = _job_executor.submit(
+                    replace_parquet_in_bigquery, payload, df, table_id_full, client, replace_tickers, schema
+                )
+            elif config:
+                futures[table_id_full] = _job_executor.submit(
+                    merge_parquet_into_bigquery, payload, df, table_id_full, client, config['merge_keys'], schema
+                )
+            else:
+                futures[table_id_full] = _job_executor.submit(
+                    load_parquet_to_bigquery, payload, table_id_full, client, write_disposition
+                )
         except Exception as e:
             logger.error(f"Error loading data into table {table_id}: {e}")
-            continue
-    return 'success'
+            status = 'failure'
 
-def load_df_to_bigquery(df: pd.DataFrame, table_id: str, client: bigquery.Client, write_disposition: str = "WRITE_APPEND") -> None:
+    for table_id_full, future in futures.items():
+        try:
+            future.result()
+            logger.info(f"Data loaded successfully into table {table_id_full}.")
+        except Exception as e:
+            logger.error(f"Error loading data into table {table_id_full}: {e}")
+            status = 'failure'
+    return status
+
+def df_to_parquet_bytes(df: pd.DataFrame, schema: list = None) -> bytes:
     """
-    Loads a DataFrame directly into a BigQuery table.
+    Serializes a DataFrame to zstd-compressed Parquet in memory.
+    Categorical columns are written as plain strings and timestamps with microsecond
+    precision, and columns are cast to the BigQuery schema types when provided.
 
     Args:
-        df (pd.DataFrame): DataFrame to load into BigQuery.
+        df (pd.DataFrame): DataFrame to serialize.
+        schema (list): Optional list of bigquery.SchemaField for the DataFrame columns.
+
+    Returns:
+        bytes: Parquet file contents.
+    """
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    field_types = {field.name: field.field_type for field in schema or []}
+    fields = []
+    for field in table.schema:
+        arrow_type = BIGQUERY_TO_ARROW_TYPES.get(field_types.get(field.name))
+        if arrow_type is None:
+            if pa.types.is_dictionary(field.type):
+                arrow_type = field.type.value_type
+            elif pa.types.is_timestamp(field.type):
+                arrow_type = pa.timestamp('us', tz=field.type.tz or 'UTC')
+            else:
+                arrow_type = field.type
+        fields.append(pa.field(field.name, arrow_type))
+    table = table.cast(pa.schema(fields))
+
+    buffer = io.BytesIO()
+    pq.write_table(table, buffer, compression='zstd')
+    return buffer.getvalue()
+
+def load_parquet_to_bigquery(payload: bytes, table_id: str, client: bigquery.Client, write_disposition: str = "WRITE_APPEND", schema: list = None) -> None:
+    """
+    Loads serialized Parquet data into a BigQuery table and waits for the job to complete.
+
+    Args:
+        payload (bytes): Parquet file contents, as returned by df_to_parquet_bytes.
         table_id (str): The ID of the BigQuery table to load data into.
         client (bigquery.Client): An authenticated BigQuery client instance.
         write_disposition (str): BigQuery write disposition (e.g., 'WRITE_APPEND', 'WRITE_TRUNCATE').
+        schema (list): Optional list of bigquery.SchemaField for the loaded columns.
 
     Returns:
         None
@@ -59,8 +245,310 @@ def load_df_to_bigquery(df: pd.DataFrame, table_id: str, client: bigquery.Client
         write_disposition=write_disposition,
         source_format=bigquery.SourceFormat.PARQUET,
     )
-    job = client.load_table_from_dataframe(df, table_id, job_config=job_config)
-    job.result()  # Wait for the job to complete
+    if schema:
+        job_config.schema = schema
+    with track('load.job') as m:
+        m['bytes_out'] = len(payload)
+        job = client.load_table_from_file(io.BytesIO(payload), table_id, job_config=job_config)
+        job.result()  # Wait for the job to complete
+
+def load_df_to_bigquery(df: pd.DataFrame, table_id: str, client: bigquery.Client, write_disposition: str = "WRITE_APPEND", schema: list = None) -> None:
+    """
+    Loads a DataFrame directly into a BigQuery table.
+
+    Args:
+        df (pd.DataFrame): DataFrame to load into BigQuery.
+        table_id (str): The ID of the BigQuery table to load data into.
+        client (bigquery.Client): An authenticated BigQuery client instance.
+        write_disposition (str): BigQuery write disposition (e.g., 'WRITE_APPEND', 'WRITE_TRUNCATE').
+        schema (list): Optional list of bigquery.SchemaField for the DataFrame columns.
+
+    Returns:
+        None
+    """
+    load_parquet_to_bigquery(df_to_parquet_bytes(df, schema), table_id, client, write_disposition, schema=schema)
+
+def ensure_table(client: bigquery.Client, table_id: str, config: dict) -> list:
+    """
+    Creates a BigQuery table with the schema, partitioning and clustering of a table config
+    if it does not already exist. Existing tables are left untouched, and keep the types of
+    their columns: e.g. a stocks table created by an earlier version with a DATETIME date
+    column is loaded and queried with DATETIME dates (see date_type).
+
+    Args:
+        client (bigquery.Client): An authenticated BigQuery client instance.
+        table_id (str): Full table ID in BigQuery (e.g., `project.dataset.table`).
+        config (dict): Table config with 'schema' and optional 'partition_field' and 'cluster_fields'.
+
+    Returns:
+        list: The bigquery.SchemaField of the config's columns, with the types of the existing table.
+    """
+    with _ensured_lock:
+        if table_id in _ensured_tables:
+            return _ensured_tables[table_id]
+        schema = config['schema']
+        try:
+            table = client.get_table(table_id)
+            if config.get('partition_field') and not table.time_partitioning:
+                logger.warning(
+                    f"Table {table_id} is not partitioned by {config['partition_field']}. "
+                    "Recreate it to enable partition pruning."
+                )
+            existing_types = {field.name: field.field_type for field in table.schema or []}
+            kept = {
+                field.name: existing_types[field.name] for field in schema
+                if existing_types.get(field.name, field.field_type) != field.field_type
+            }
+            if kept:
+                logger.info(f"Table {table_id} keeps its column types {kept}.")
+                schema = [
+                    bigquery.SchemaField(field.name, kept.get(field.name, field.field_type), mode=field.mode)
+                    for field in schema
+                ]
+        except NotFound:
+            table = bigquery.Table(table_id, schema=config['schema'])
+            if config.get('partition_field'):
+                table.time_partitioning = bigquery.TimePartitioning(
+                    type_=bigquery.TimePartitioningType.DAY,
+                    field=config['partition_field'],
+                )
+            table.clustering_fields = config.get('cluster_fields')
+            client.create_table(table, exists_ok=True)
+            logger.info(f"Table {table_id} created.")
+        _ensured_tables[table_id] = schema
+        return schema
+
+def date_type(schema: list) -> str:
+    """ Returns the BigQuery type of the 'date' column of a schema returned by ensure_table. """
+    return next((field.field_type for field in schema or [] if field.name == 'date'), 'TIMESTAMP')
+
+def date_param(name: str, value, field_type: str) -> bigquery.ScalarQueryParameter:
+    """ Returns a query parameter comparable with a date column of the given type (TIMESTAMP or DATETIME). """
+    value = pd.Timestamp(value)
+    if value.tzinfo is not None:
+        value = value.tz_convert('UTC')
+        # DATETIME values have no time zone: dates are stored as their UTC wall time
+        if field_type != 'TIMESTAMP':
+            value = value.tz_localize(None)
+    return bigquery.ScalarQueryParameter(name, field_type, value.to_pydatetime())
+
+def merge_parquet_into_bigquery(payload: bytes, df: pd.DataFrame, table_id: str, client: bigquery.Client, merge_keys: List[str], schema: list = None) -> None:
+    """
+    Loads a DataFrame already serialized with df_to_parquet_bytes into a temporary staging table and
+    MERGEs it into the target table on the merge keys: matching rows are updated and new rows are
+    inserted, so re-running a load never creates duplicates.
+    """
+    staging_table_id = f"{table_id}_staging_{uuid.uuid4().hex[:12]}"
+    columns = list(df.columns)
+    keys = ", ".join(merge_keys)
+    on_clause = " AND ".join(f"T.{key} = S.{key}" for key in merge_keys)
+
+    # Restrict the target to the loaded date range so BigQuery prunes partitions
+    job_config = None
+    if 'date' in merge_keys and not df.empty:
+        on_clause += " AND T.date BETWEEN @min_date AND @max_date"
+        job_config = bigquery.QueryJobConfig(query_parameters=[
+            date_param("min_date", df['date'].min(), date_type(schema)),
+            date_param("max_date", df['date'].max(), date_type(schema)),
+        ])
+
+    updates = [f"{col} = S.{col}" for col in columns if col not in merge_keys]
+
+    query = f"""
+        MERGE `{table_id}` T
+        USING (
+            SELECT * FROM `{staging_table_id}`
+            WHERE TRUE
+            QUALIFY ROW_NUMBER() OVER (PARTITION BY {keys}) = 1
+        ) S
+        ON {on_clause}
+        WHEN MATCHED THEN
+            UPDATE SET {", ".join(updates) or f"{merge_keys[0]} = S.{merge_keys[0]}"}
+        WHEN NOT MATCHED THEN
+            INSERT ({", ".join(columns)}) VALUES ({", ".join(f"S.{col}" for col in columns)})
+    """
+    staging_schema = [
+        bigquery.SchemaField(field.name, field.field_type) for field in schema if field.name in columns
+    ] if schema else None
+    try:
+        load_parquet_to_bigquery(payload, staging_table_id, client, write_disposition="WRITE_TRUNCATE", schema=staging_schema)
+        with track('load.merge', rows_in=len(df)) as m:
+            job = run_merge(client, query, table_id, job_config)
+            m['rows_out'] = getattr(job, 'num_dml_affected_rows', None)
+    finally:
+        client.delete_table(staging_table_id, not_found_ok=True)
+
+def replace_parquet_in_bigquery(payload: bytes, df: pd.DataFrame, table_id: str, client: bigquery.Client, tickers: List[str], schema: list = None) -> None:
+    """
+    Replaces the stored rows of some tickers with the rows of a DataFrame already serialized with
+    df_to_parquet_bytes, e.g. a history re-adjusted after a split. A single MERGE inserts every
+    staged row and deletes the stored rows of the tickers in the DataFrame's date range, so only
+    the partitions of that range are rewritten and the other tickers are left untouched.
+
+    Args:
+        payload (bytes): The DataFrame serialized as Parquet.
+        df (pd.DataFrame): DataFrame with 'ticker' and 'date' columns.
+        table_id (str): Full ID of the target table.
+        client (bigquery.Client): An authenticated BigQuery client instance.
+        tickers (List[str]): Tickers whose stored rows are replaced.
+        schema (list): Optional list of bigquery.SchemaField for the DataFrame columns.
+
+    Returns:
+        None
+    """
+    staging_table_id = f"{table_id}_staging_{uuid.uuid4().hex[:12]}"
+    columns = list(df.columns)
+    query = f"""
+        MERGE `{table_id}` T
+        USING (
+            SELECT * FROM `{staging_table_id}`
+            WHERE TRUE
+            QUALIFY ROW_NUMBER() OVER (PARTITION BY ticker, date) = 1
+        ) S
+        ON FALSE
+        WHEN NOT MATCHED THEN
+            INSERT ({", ".join(columns)}) VALUES ({", ".join(f"S.{col}" for col in columns)})
+        WHEN NOT MATCHED BY SOURCE
+            AND T.ticker IN UNNEST(@tickers)
+            AND T.date BETWEEN @min_date AND @max_date THEN
+            DELETE
+    """
+    job_config = bigquery.QueryJobConfig(query_parameters=[
+        bigquery.ArrayQueryParameter("tickers", "STRING", list(tickers)),
+        date_param("min_date", df['date'].min(), date_type(schema)),
+        date_param("max_date", df['date'].max(), date_type(schema)),
+    ])
+    staging_schema = [
+        bigquery.SchemaField(field.name, field.field_type) for field in schema if field.name in columns
+    ] if schema else None
+    try:
+        load_parquet_to_bigquery(payload, staging_table_id, client, write_disposition="WRITE_TRUNCATE", schema=staging_schema)
+        with track('load.replace', rows_in=len(df)) as m:
+            job = run_merge(client, query, table_id, job_config)
+            m['rows_out'] = getattr(job, 'num_dml_affected_rows', None)
+    finally:
+        client.delete_table(staging_table_id, not_found_ok=True)
+
+def refresh_aggregates_in_bigquery(
+    client: bigquery.Client,
+    table_id: str,
+    stocks_table_id: str,
+    derived_table_id: str,
+    sectors_table_id: str,
+    start: datetime,
+    end: datetime,
+    market_caps: dict = None,
+    date_types: dict = None
+):
+    """
+    Recomputes the per-sector daily aggregates of the dates between start and end (both included) from
+    the stored daily returns, volumes and sectors of every ticker, with the columns of
+    etl.aggregate.compute_sector_aggregates. A single MERGE updates or inserts the recomputed rows and
+    deletes the stored rows of these dates left without a match (a sector without tickers anymore).
+    The statement reads and writes one snapshot, so a date recomputed after each of the batches or tasks
+    loading its rows ends up with the aggregates of all of them, and recomputing it again changes nothing.
+
+    Args:
+        client (bigquery.Client): An authenticated BigQuery client instance.
+        table_id (str): Full ID of the aggregates table.
+        stocks_table_id (str): Full ID of the stocks table, for the volumes.
+        derived_table_id (str): Full ID of the derived metrics table, for the daily returns.
+        sectors_table_id (str): Full ID of the sectors table.
+        start (datetime): First date to recompute.
+        end (datetime): Last date to recompute.
+        market_caps (dict): Mapping of ticker to market cap, the weights of the cap-weighted return.
+            Default is None (not computed).
+        date_types (dict): Mapping of table ID to the type of its date column (see ensure_table), for
+            tables created with DATETIME dates. Default is None (every table has TIMESTAMP dates).
+
+    Returns:
+        bigquery.QueryJob: The finished MERGE job.
+    """
+    date_types = date_types or {}
+    aggregates_type = date_types.get(table_id, 'TIMESTAMP')
+    stocks_type = date_types.get(stocks_table_id, 'TIMESTAMP')
+    derived_type = date_types.get(derived_table_id, 'TIMESTAMP')
+    columns = ", ".join(AGGREGATE_COLUMNS)
+    updates = ", ".join(f"{col} = S.{col}" for col in AGGREGATE_COLUMNS if col not in ('date', 'sector'))
+    query = f"""
+        MERGE `{table_id}` T
+        USING (
+            SELECT
+                date,
+                sector,
+                COUNT(*) AS tickers,
+                COUNTIF(daily_return > 0) AS advancers,
+                COUNTIF(daily_return < 0) AS decliners,
+                IFNULL(SUM(volume), 0) AS volume,
+                SAFE_DIVIDE(SUM(daily_return), COUNT(daily_return)) AS equal_weighted_return,
+                SAFE_DIVIDE(SUM(weight * daily_return), SUM(weight)) AS cap_weighted_return,
+                COUNT(daily_return) AS return_count,
+                IFNULL(SUM(daily_return), 0) AS return_sum,
+                IFNULL(SUM(weight), 0) AS cap_weight_sum,
+                IFNULL(SUM(weight * daily_return), 0) AS cap_return_sum
+            FROM (
+                SELECT
+                    {_cast_date('d.date', derived_type, aggregates_type)} AS date,
+                    IFNULL(c.sector, '{UNKNOWN_SECTOR}') AS sector,
+                    d.daily_return,
+                    s.volume,
+                    IF(d.daily_return IS NOT NULL AND caps.market_cap > 0, caps.market_cap, NULL) AS weight
+                FROM `{derived_table_id}` d
+                LEFT JOIN `{stocks_table_id}` s
+                    ON s.ticker = d.ticker
+                    AND {_cast_date('s.date', stocks_type, derived_type)} = d.date
+                    AND s.date BETWEEN @stocks_start AND @stocks_end
+                LEFT JOIN `{sectors_table_id}` c ON c.ticker = d.ticker
+                LEFT JOIN (
+                    SELECT ticker, market_cap
+                    FROM UNNEST(@cap_tickers) AS ticker WITH OFFSET i
+                    JOIN UNNEST(@caps) AS market_cap WITH OFFSET j ON i = j
+                ) caps ON caps.ticker = d.ticker
+                WHERE d.date BETWEEN @derived_start AND @derived_end
+            )
+            GROUP BY date, sector
+        ) S
+        ON T.date = S.date AND T.sector = S.sector AND T.date BETWEEN @start AND @end
+        WHEN MATCHED THEN
+            UPDATE SET {updates}
+        WHEN NOT MATCHED THEN
+            INSERT ({columns}) VALUES ({", ".join(f"S.{col}" for col in AGGREGATE_COLUMNS)})
+        WHEN NOT MATCHED BY SOURCE AND T.date BETWEEN @start AND @end THEN
+            DELETE
+    """
+    market_caps = {ticker: cap for ticker, cap in (market_caps or {}).items() if cap}
+    job_config = bigquery.QueryJobConfig(query_parameters=[
+        date_param("start", start, aggregates_type),
+        date_param("end", end, aggregates_type),
+        date_param("stocks_start", start, stocks_type),
+        date_param("stocks_end", end, stocks_type),
+        date_param("derived_start", start, derived_type),
+        date_param("derived_end", end, derived_type),
+        bigquery.ArrayQueryParameter("cap_tickers", "STRING", list(market_caps)),
+        bigquery.ArrayQueryParameter("caps", "FLOAT64", [float(cap) for cap in market_caps.values()]),
+    ])
+    with track('load.aggregates') as m:
+        job = run_merge(client, query, table_id, job_config)
+        m['rows_out'] = getattr(job, 'num_dml_affected_rows', None)
+    return job
+
+def _cast_date(expression: str, field_type: str, to_type: str) -> str:
+    """ Returns the SQL casting a TIMESTAMP or DATETIME date expression to the other type (UTC), if they differ. """
+    return expression if field_type == to_type else f"{to_type}({expression})"
+
+def run_merge(client: bigquery.Client, query: str, table_id: str, job_config: bigquery.QueryJobConfig = None):
+    """ Runs a MERGE statement, retrying it when it conflicts with a concurrent update of the same partitions. """
+    for attempt in range(1, MERGE_CONFLICT_ATTEMPTS + 1):
+        try:
+            job = client.query(query, job_config=job_config)
+            job.result()
+            return job
+        except Exception as e:
+            if attempt == MERGE_CONFLICT_ATTEMPTS or 'concurrent update' not in str(e):
+                raise
+            delay = random.uniform(1, 2 ** attempt)
+            logger.warning(f"MERGE into {table_id} conflicted with a concurrent update, retrying in {delay:.1f}s...")
+            time.sleep(delay)
 
 def create_dataset(client: bigquery.Client, dataset_id: str) -> None:
     """
@@ -73,13 +561,16 @@ def create_dataset(client: bigquery.Client, dataset_id: str) -> None:
     Returns:
         None
     """
-    datasets = list(client.list_datasets())
-    if any(dataset.dataset_id == dataset_id for dataset in datasets):
-        return
-    
-    try:
-        dataset_ref = client.dataset(dataset_id)
-        client.create_dataset(dataset_ref)
-        logger.info(f"Dataset {dataset_id} created.")
-    except Exception as e:
-        logger.error(f"Error creating dataset {dataset_id}: {e}")
\ No newline at end of file
+    with _ensured_lock:
+        if dataset_id in _ensured_datasets:
+            return
+        try:
+            client.get_dataset(dataset_id)
+        except NotFound:
+            try:
+                client.create_dataset(dataset_id, exists_ok=True)
+                logger.info(f"Dataset {dataset_id} created.")
+            except Exception as e:
+                logger.error(f"Error creating dataset {dataset_id}: {e}")
+                return
+        _ensured_datasets.add(dataset_id)
@@ -0,0 +1,391 @@
+import logging
+import queue
+import threading
+import time
+from typing import Iterable
+import pandas as pd
+from etl.corporate_actions import refresh_adjusted_history, get_replaced_tickers
+from etl.extract import extract_data
+from etl.transform import transform_data
+from etl.validate import validate_data
+from etl.derived import derive_data
+from etl.aggregate import aggregate_data
+from etl.sinks import BigQuerySink
+from utils.manifest import FETCHED, TRANSFORMED, LOADED, EMPTY, FAILED
+
+logger = logging.getLogger(__name__)
+
+# Extract stage outputs checkpointed by resumable runs
+CHECKPOINT_FRAMES = ('raw_stock_df', 'sector_df', 'actions_df')
+
+def split_into_batches(ticker_buckets: dict, missing_tickers: list = None, batch_size: int = 100) -> list[dict]:
+    """
+    Splits the tickers to extract into batches of at most batch_size tickers.
+    Tickers are kept in bucket order so most batches share a single start date.
+
+    Args:
+        ticker_buckets (dict): Mapping of start date to tickers sharing it (None for full extraction).
+        missing_tickers (list): Tickers missing from the sector table.
+        batch_size (int): Maximum number of tickers per batch. Default is 100.
+
+    Returns:
+        list[dict]: List of batches, each one with the 'ticker_buckets' and 'missing_tickers'
+            keyword arguments for extract_data.
+    """
+    if batch_size <= 0:
+        raise ValueError("Batch size must be a positive integer.")
+
+    missing_tickers = missing_tickers or []
+    missing_set = set(missing_tickers)
+
+    # (start date, ticker, fetch prices) entries; sector-only tickers go last
+    entries = [(start, ticker, True) for start, tickers in ticker_buckets.items() for ticker in tickers]
+    with_prices = {ticker for _, ticker, _ in entries}
+    entries += [(None, ticker, False) for ticker in missing_tickers if ticker not in with_prices]
+
+    batches = []
+    for i in range(0, len(entries), batch_size):
+        buckets = {}
+        for start, ticker, fetch_prices in entries[i:i + batch_size]:
+            if fetch_prices:
+                buckets.setdefault(start, []).append(ticker)
+        batches.append({
+            'ticker_buckets': buckets,
+            'missing_tickers': [t for _, t, _ in entries[i:i + batch_size] if t in missing_set],
+        })
+    return batches
+
+def extract_batch(ctx: dict, interval: str = '1d', corporate_actions: bool = False, **kwargs) -> dict:
+    """ Extract stage: downloads stock and sector data for the batch in ctx['batch'], and with
+    corporate_actions, the full history of the tickers with a dividend or split since their last update
+    (listed in ctx['actions_df']). Extra keyword arguments are forwarded to extract_data. """
+    try:
+        ctx['raw_stock_df'], ctx['sector_df'] = extract_data(
+            missing_tickers=ctx['batch']['missing_tickers'],
+            period='max',
+            interval=interval,
+            ticker_buckets=ctx['batch']['ticker_buckets'],
+            actions=corporate_actions,
+            **kwargs
+        )
+        ctx['raw_stock_df'], ctx['actions_df'] = refresh_adjusted_history(ctx['raw_stock_df'], interval, kwargs.get('cache_dir'))
+        if ctx['raw_stock_df'].empty and ctx['sector_df'].empty:
+            logger.warning(f"No data extracted for batch {ctx['index']}.")
+            ctx['status'] = 'empty'
+    except Exception as e:
+        logger.error(f"Error during data extraction of batch {ctx['index']}: {e}")
+        ctx['status'] = 'failure'
+    return ctx
+
+def resume_batch(ctx: dict, manifest, interval: str = '1d', corporate_actions: bool = False, **kwargs) -> dict:
+    """ Extract stage of a run with a manifest: reuses the checkpointed extraction of the batch if a
+    previous attempt fetched it, otherwise extracts it and checkpoints the result. """
+    frames = manifest.load_checkpoint(ctx['index'], CHECKPOINT_FRAMES)
+    if frames is not None:
+        logger.info(f"Reusing the checkpointed extraction of batch {ctx['index']}.")
+        ctx.update(frames)
+        return ctx
+
+    ctx = extract_batch(ctx, interval=interval, corporate_actions=corporate_actions, **kwargs)
+    if ctx['status'] is None:
+        raw_df = ctx['raw_stock_df']
+        date_range = (raw_df['date'].min(), raw_df['date'].max()) if not raw_df.empty else None
+        manifest.save_checkpoint(ctx['index'], **{name: ctx[name] for name in CHECKPOINT_FRAMES})
+        manifest.mark(ctx['index'], FETCHED, rows=len(raw_df), date_range=date_range)
+    return ctx
+
+def transform_batch(ctx: dict) -> dict:
+    """ Transform stage: transforms the raw stock data of the batch. """
+    try:
+        ctx['stock_df'] = transform_data(ctx.pop('raw_stock_df'))
+        if ctx['stock_df'].empty and ctx['sector_df'].empty:
+            logger.warning(f"No data to transform for batch {ctx['index']}.")
+            ctx['status'] = 'empty'
+    except Exception as e:
+        logger.error(f"Error during data transformation of batch {ctx['index']}: {e}")
+        ctx['status'] = 'failure'
+    return ctx
+
+def validate_batch(ctx: dict, **kwargs) -> dict:
+    """ Validation stage: moves the rows of the batch failing the data-quality checks to ctx['quarantine_df'].
+    Extra keyword arguments are forwarded to validate_data. """
+    try:
+        ctx['stock_df'], ctx['quarantine_df'] = validate_data(ctx['stock_df'], **kwargs)
+    except Exception as e:
+        # Unvalidated rows are still loaded, as they were before this stage existed
+        logger.error(f"Error validating batch {ctx['index']}: {e}")
+    return ctx
+
+def derive_batch(ctx: dict, sink) -> dict:
+    """ Derived-metrics stage: computes the returns, moving averages and volatility of the batch. """
+    try:
+        # Tickers with a refreshed history are computed from it, their stored closes are on the old basis
+        replaced = set(get_replaced_tickers(ctx.get('actions_df')))
+        ticker_buckets = {
+            start: [t for t in tickers if t not in replaced] for start, tickers in ctx['batch']['ticker_buckets'].items()
+        } if replaced else ctx['batch']['ticker_buckets']
+        ctx['derived_df'] = derive_data(ctx['stock_df'], ticker_buckets, sink)
+    except Exception as e:
+        # Without the trailing closes the metrics of the new rows would be wrong and never computed again,
+        # so the batch is not loaded and its range is extracted again by the next run
+        logger.error(f"Error computing derived metrics of batch {ctx['index']}: {e}")
+        ctx['status'] = 'failure'
+    return ctx
+
+def load_batch(ctx: dict, sink) -> dict:
+    """ Load stage: loads the transformed stock, sector, derived and quarantined data of the batch into the
+    storage sink. The stored history of the tickers with a corporate action is replaced instead of upserted. """
+    try:
+        stock_df, sector_df, derived_df = ctx.pop('stock_df'), ctx.pop('sector_df'), ctx.pop('derived_df', None)
+        ctx['status'] = sink.load_batch(
+            stock_df, sector_df, derived_df, ctx.pop('quarantine_df', None),
+            replace_tickers=get_replaced_tickers(ctx.pop('actions_df', None))
+        )
+        ctx['rows'] = len(stock_df)
+        ctx['sectors'] = len(sector_df)
+        if derived_df is not None and not derived_df.empty:
+            ctx['aggregate_range'] = get_added_range(derived_df, ctx['batch']['ticker_buckets'])
+    except Exception as e:
+        logger.error(f"Error during data loading of batch {ctx['index']}: {e}")
+        ctx['status'] = 'failure'
+    return ctx
+
+def get_added_range(derived_df: pd.DataFrame, ticker_buckets: dict) -> tuple | None:
+    """ Returns the first and last dates a batch adds to the derived metrics: rows of incrementally extracted tickers
+    dated before their start date (the re-adjusted history of a ticker with a corporate action) are stored again,
+    not added. Returns None if the batch adds no row. """
+    starts = {ticker: start for start, tickers in ticker_buckets.items() if start for ticker in tickers}
+    dates = derived_df['date']
+    if starts:
+        start_dates = pd.to_datetime(derived_df['ticker'].astype(str).map(starts))
+        dates = dates[start_dates.isna().to_numpy() | (dates >= start_dates).to_numpy()]
+    return (dates.min(), dates.max()) if not dates.empty else None
+
+def widen_range(date_range: tuple | None, other: tuple | None) -> tuple | None:
+    """ Returns the smallest (first, last) range holding two date ranges, either of them possibly None. """
+    if not date_range or not other:
+        return date_range or other
+    return min(date_range[0], other[0]), max(date_range[1], other[1])
+
+def run_stages(items: Iterable, stages: list[tuple], queue_size: int = 1, on_result=None) -> None:
+    """
+    Runs items through a chain of stages, each one executed by its own pool of threads
+    and connected to the next one by a bounded queue. Stages therefore overlap
+    (item N+1 is processed by a stage while item N is in the next one), and a slow
+    stage blocks the ones before it once its input queue is full (backpressure).
+
+    Args:
+        items (Iterable): Items to feed into the first stage.
+        stages (list[tuple]): List of (function, number of workers) tuples. Each function
+            receives an item and returns the item passed to the next stage.
+        queue_size (int): Maximum number of items waiting between two stages. Default is 1.
+        on_result (callable): Optional callback called with each item leaving the last stage.
+            Dict items are forwarded with status 'failure' and the 'error' when a stage raises,
+            other items are dropped.
+    """
+    done = object()
+    queues = [queue.Queue(maxsize=queue_size) for _ in range(len(stages) + 1)]
+
+    def feed():
+        for item in items:
+            queues[0].put(item)
+        queues[0].put(done)
+
+    def work(fn, in_q, out_q, remaining):
+        while True:
+            item = in_q.get()
+            if item is done:
+                # Let sibling workers see the sentinel, last one to exit forwards it
+                in_q.put(done)
+                with remaining['lock']:
+                    remaining['count'] -= 1
+                    if remaining['count'] == 0:
+                        out_q.put(done)
+                return
+            try:
+                item = fn(item)
+            except Exception as e:
+                logger.error(f"Unexpected error in pipeline stage {getattr(fn, '__name__', fn)}: {e}")
+                if not isinstance(item, dict):
+                    continue
+                # Batch contexts go on as failed, so that the next stages skip them and the failure is counted
+                item['status'] = 'failure'
+                item['error'] = e
+            out_q.put(item)
+
+    threads = [threading.Thread(target=feed, daemon=True)]
+    for (fn, workers), in_q, out_q in zip(stages, queues, queues[1:]):
+        workers = max(1, workers)
+        remaining = {'count': workers, 'lock': threading.Lock()}
+        threads += [
+            threading.Thread(target=work, args=(fn, in_q, out_q, remaining), daemon=True)
+            for _ in range(workers)
+        ]
+    for thread in threads:
+        thread.start()
+
+    while True:
+        item = queues[-1].get()
+        if item is done:
+            break
+        if on_result:
+            on_result(item)
+
+    for thread in threads:
+        thread.join()
+
+def run_batches(
+    batches: list[dict],
+    credentials_dict: dict = None,
+    project_id: str = None,
+    dataset_id: str = None,
+    table_ids: list = None,
+    interval: str = '1d',
+    extract_workers: int = 1,
+    transform_workers: int = 1,
+    load_workers: int = 1,
+    queue_size: int = 1,
+    extract_kwargs: dict = None,
+    client=None,
+    sink=None,
+    derive_metrics: bool = False,
+    manifest=None,
+    validate: bool = False,
+    validate_kwargs: dict = None,
+    corporate_actions: bool = False,
+    aggregate_sectors: bool = False,
+    market_caps: dict = None
+) -> dict:
+    """
+    Streams batches through overlapping extract -> transform -> load stages: batch N+1
+    downloads while batch N is transformed and batch N-1 loads. Optional validate and derive
+    stages run between transform and load. Bounded queues between stages keep the number
+    of batches held in memory limited. Progress is logged per batch.
+    The sector aggregates of the dates added by the loaded batches are recomputed once, after every load.
+
+    Args:
+        batches (list[dict]): Batches as returned by split_into_batches.
+        credentials_dict (dict): Dictionary containing service account credentials.
+        project_id (str): Google Cloud project ID.
+        dataset_id (str): The ID of the dataset in BigQuery.
+        table_ids (list): Stock and sector table IDs.
+        interval (str): Interval for stock data. Default is '1d'.
+        extract_workers (int): Number of batches extracted concurrently. Default is 1.
+        transform_workers (int): Number of batches transformed concurrently. Default is 1.
+        load_workers (int): Number of batches loaded concurrently. Default is 1.
+        queue_size (int): Maximum number of batches waiting between two stages. Default is 1.
+        extract_kwargs (dict): Extra keyword arguments for extract_data (e.g. cache settings).
+        client (bigquery.Client): Optional authenticated client reused by all loads.
+        sink (BigQuerySink | ParquetSink): Storage sink the batches are loaded into. Defaults to a
+            BigQuerySink built from the credentials, project, dataset and table IDs.
+        derive_metrics (bool): Whether to compute the derived metrics of each batch, in a stage
+            between transform and load. Default is False.
+        manifest (RunManifest): Optional manifest recording the state of each batch. Batches it
+            reports as done are skipped, and checkpointed extractions are reused instead of downloaded.
+        validate (bool): Whether to run the data-quality checks of each batch, in a stage between
+            transform and load. Failing rows are loaded into the sink's quarantine. Default is False.
+        validate_kwargs (dict): Extra keyword arguments for validate_data (e.g. max_jump).
+        corporate_actions (bool): Whether to detect the dividends and splits of the incrementally
+            extracted tickers, and replace their stored history with the re-adjusted one. Default is False.
+        aggregate_sectors (bool): Whether to recompute the stored per-sector daily aggregates of the dates
+            added by the batches once they are all loaded (requires derive_metrics). With a manifest, the
+            dates added by the batches of an interrupted attempt are recomputed by the resumed run. Default is False.
+        market_caps (dict): Mapping of ticker to market cap, the weights of the cap-weighted sector returns. Default is None.
+
+    Returns:
+        dict: Run summary with the number of 'batches', 'failed_batches', 'skipped_batches'
+            (done by a previous attempt), 'rows' and 'sectors', and whether the recompute of the
+            sector aggregates failed ('aggregates_failed').
+    """
+    if sink is None:
+        sink = BigQuerySink(credentials_dict, project_id, dataset_id, *table_ids, client=client)
+    pending = [(i, batch) for i, batch in enumerate(batches, start=1) if not (manifest and manifest.is_done(i))]
+    totals = {
+        'batches': len(batches), 'failed_batches': 0, 'skipped_batches': len(batches) - len(pending),
+        'rows': 0, 'sectors': 0, 'aggregates_failed': False, 'completed': 0
+    }
+    if totals['skipped_batches']:
+        logger.info(f"Skipping {totals['skipped_batches']} batch(es) already loaded by a previous attempt.")
+    start_time = time.monotonic()
+
+    aggregate_sectors = aggregate_sectors and derive_metrics
+    aggregate_range = None
+
+    def skip_if_done(fn, **kwargs):
+        def stage(ctx):
+            return ctx if ctx['status'] else fn(ctx, **kwargs)
+        stage.__name__ = fn.__name__
+        return stage
+
+    def checkpoint(fn, state):
+        def stage(ctx):
+            ctx = fn(ctx)
+            if manifest and ctx['status'] is None and 'stock_df' in ctx:
+                manifest.mark(ctx['index'], state, rows=len(ctx['stock_df']))
+            return ctx
+        stage.__name__ = fn.__name__
+        return stage
+
+    def report(ctx):
+        nonlocal aggregate_range
+        if aggregate_sectors and ctx['status'] == 'success' and ctx.get('aggregate_range'):
+            # Recorded before the batch is marked loaded, so that a resumed run recomputes these dates
+            aggregate_range = widen_range(aggregate_range, ctx['aggregate_range'])
+            if manifest:
+                manifest.add_aggregate_range(*ctx['aggregate_range'])
+        if manifest:
+            state = {'failure': FAILED, 'empty': EMPTY}.get(ctx['status'], LOADED)
+            manifest.mark(ctx['index'], state, rows=ctx['rows'] if state == LOADED else None, error=ctx.get('error'))
+        totals['completed'] += 1
+        totals['rows'] += ctx['rows']
+        totals['sectors'] += ctx['sectors']
+        if ctx['status'] == 'failure':
+            totals['failed_batches'] += 1
+
+        elapsed = time.monotonic() - start_time
+        eta = elapsed / totals['completed'] * (len(pending) - totals['completed'])
+        n_tickers = sum(len(t) for t in ctx['batch']['ticker_buckets'].values())
+        logger.info(
+            f"Batch {ctx['index']}/{len(batches)} {ctx['status']}: {n_tickers} tickers, "
+            f"{ctx['rows']} rows in {time.monotonic() - ctx['started']:.1f}s "
+            f"({totals['completed']}/{len(pending)} done, total {totals['rows']} rows, "
+            f"elapsed {elapsed:.0f}s, ETA {eta:.0f}s)"
+        )
+
+    def start(ctx):
+        ctx['started'] = time.monotonic()
+        if manifest:
+            return resume_batch(ctx, manifest, interval=interval, corporate_actions=corporate_actions, **(extract_kwargs or {}))
+        return extract_batch(ctx, interval=interval, corporate_actions=corporate_actions, **(extract_kwargs or {}))
+
+    contexts = (
+        {'index': i, 'batch': batch, 'status': None, 'rows': 0, 'sectors': 0}
+        for i, batch in pending
+    )
+    run_stages(
+        contexts,
+        [
+            (start, extract_workers),
+            (checkpoint(skip_if_done(transform_batch), TRANSFORMED), transform_workers),
+            *([(skip_if_done(validate_batch, **(validate_kwargs or {})), transform_workers)] if validate else []),
+            *([(skip_if_done(derive_batch, sink=sink), transform_workers)] if derive_metrics else []),
+            (skip_if_done(load_batch, sink=sink), load_workers),
+        ],
+        queue_size=queue_size,
+        on_result=report
+    )
+
+    if manifest:
+        aggregate_range = manifest.aggregate_range
+    if aggregate_sectors and aggregate_range:
+        try:
+            aggregate_data(sink, *aggregate_range, market_caps)
+            if manifest:
+                manifest.clear_aggregate_range()
+        except Exception as e:
+            # With a manifest, the range is kept for the next run to recompute
+            logger.error(f"Error computing sector aggregates from {aggregate_range[0]} to {aggregate_range[1]}: {e}")
+            totals['aggregates_failed'] = True
+
+    totals.pop('completed')
+    return totals
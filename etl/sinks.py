@@ -0,0 +1,506 @@
+"""
+Storage sinks: where the ETL reads its watermarks and known tickers from, and where it loads
+batches of prices and sectors into. Every sink implements the same five operations:
+
+    load_batch(stock_df, sector_df=None, derived_df=None, quarantine_df=None, replace_tickers=None)
+                                    -> str    loads (upserts) the data of a batch, replacing the
+                                              stored history of replace_tickers
+    get_watermarks(tickers=None) -> dict      latest stored date per ticker
+    get_known_tickers(tickers=None) -> list   tickers present in the sectors table
+    refresh_aggregates(start, end, market_caps=None)
+                                    -> int    recomputes the stored sector aggregates of some dates
+                                              from the stored metrics, prices and sectors, once per run
+    upsert_sectors(sector_df) -> None         inserts or replaces sectors
+
+plus get_trailing_closes(tickers, before, rows), the state of the incremental derived metrics,
+and prepare(), the idempotent creation of the dataset and tables, run by every task before its first load.
+
+Heavy libraries are imported lazily, so that reading watermarks stays cheap at startup.
+"""
+import glob
+import json
+import logging
+import os
+import threading
+import uuid
+from contextlib import contextmanager
+from datetime import date, datetime
+from utils.metrics import track
+try:
+    import fcntl
+except ImportError:  # Windows: local writes are only serialized within the process
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+class BigQuerySink:
+    """ Sink backed by the BigQuery stocks and sectors tables, loaded through staging tables and MERGE. """
+
+    def __init__(self, credentials_dict: dict, project_id: str, dataset_id: str, stocks_table_id: str, sectors_table_id: str, derived_table_id: str = None, client=None, query_client=None, quarantine_table_id: str = None, aggregates_table_id: str = None):
+        """
+        Args:
+            credentials_dict (dict): Dictionary containing service account credentials.
+            project_id (str): Google Cloud project ID.
+            dataset_id (str): The ID of the dataset in BigQuery.
+            stocks_table_id (str): ID of the stocks table.
+            sectors_table_id (str): ID of the sectors table.
+            derived_table_id (str): ID of the derived metrics table. Default is None (not loaded).
+            client (bigquery.Client): Optional client used for loads, created on first load otherwise.
+            query_client (BigQueryRestClient): Optional client used for the watermark and ticker
+                queries. Defaults to a lightweight REST client.
+            quarantine_table_id (str): ID of the table of rows failing validation. Default is None (not loaded).
+            aggregates_table_id (str): ID of the table of per-sector daily aggregates. Default is None (not computed).
+        """
+        self.credentials_dict = credentials_dict
+        self.project_id = project_id
+        self.dataset_id = dataset_id
+        self.table_ids = [stocks_table_id, sectors_table_id]
+        self.derived_table_id = derived_table_id
+        self.quarantine_table_id = quarantine_table_id
+        self.aggregates_table_id = aggregates_table_id
+        self._client = client
+        self._query_client = query_client
+        self._lock = threading.Lock()
+
+    def _table(self, table_id: str) -> str:
+        return f"{self.project_id}.{self.dataset_id}.{table_id}"
+
+    @property
+    def client(self):
+        with self._lock:
+            if self._client is None:
+                from utils.google_cloud import get_bigquery_client
+                self._client = get_bigquery_client(self.credentials_dict, self.project_id)
+            return self._client
+
+    @property
+    def query_client(self):
+        with self._lock:
+            if self._query_client is None:
+                if self._client is not None:
+                    self._query_client = self._client
+                else:
+                    from utils.google_cloud import get_bigquery_rest_client
+                    self._query_client = get_bigquery_rest_client(self.credentials_dict, self.project_id)
+            return self._query_client
+
+    def get_watermarks(self, tickers: list = None) -> dict:
+        from utils.bigquery import get_latest_dates_by_ticker
+        return get_latest_dates_by_ticker(self._table(self.table_ids[0]), self.query_client, tickers=tickers)
+
+    def get_known_tickers(self, tickers: list = None) -> list:
+        from utils.validations import check_existing_tickers
+        return check_existing_tickers(self._table(self.table_ids[1]), self.query_client, tickers)
+
+    def get_trailing_closes(self, tickers: list, before: date, rows: int):
+        import pandas as pd
+        from etl.derived import get_state_start
+        from etl.load import ensure_table, date_type, STOCKS_TABLE_CONFIG
+        from utils.bigquery import get_trailing_rows
+        table_id = self._table(self.table_ids[0])
+        state = get_trailing_rows(
+            table_id, self.query_client, tickers, get_state_start(before, rows), before, rows,
+            date_type=date_type(ensure_table(self.client, table_id, STOCKS_TABLE_CONFIG))
+        )
+        return pd.DataFrame(state, columns=['ticker', 'date', 'close'])
+
+    def load_batch(self, stock_df, sector_df=None, derived_df=None, quarantine_df=None, replace_tickers=None) -> str:
+        import pandas as pd
+        from etl.load import (
+            load_data, STOCKS_TABLE_CONFIG, SECTORS_TABLE_CONFIG, DERIVED_TABLE_CONFIG, QUARANTINE_TABLE_CONFIG,
+        )
+        dataframes = [stock_df, sector_df if sector_df is not None else pd.DataFrame()]
+        table_ids = list(self.table_ids)
+        table_configs = [STOCKS_TABLE_CONFIG, SECTORS_TABLE_CONFIG]
+        if self.derived_table_id and derived_df is not None:
+            dataframes.append(derived_df)
+            table_ids.append(self.derived_table_id)
+            table_configs.append(DERIVED_TABLE_CONFIG)
+        if self.quarantine_table_id and quarantine_df is not None:
+            dataframes.append(quarantine_df)
+            table_ids.append(self.quarantine_table_id)
+            table_configs.append(QUARANTINE_TABLE_CONFIG)
+
+        # Rows of the replaced tickers are loaded after the others, by a separate replace of their history
+        replaced = []
+        if replace_tickers:
+            for i, (df, table_id, config) in enumerate(zip(dataframes, table_ids, table_configs)):
+                if {'ticker', 'date'} <= set(config['merge_keys']) and not df.empty:
+                    is_replaced = df['ticker'].isin(replace_tickers).to_numpy()
+                    replaced.append((df[is_replaced], table_id, config))
+                    dataframes[i] = df[~is_replaced]
+
+        status = load_data(
+            dataframes,
+            self.credentials_dict, self.project_id, self.dataset_id,
+            table_ids,
+            table_configs=table_configs,
+            client=self.client
+        )
+        replaced = [entry for entry in replaced if not entry[0].empty]
+        if replaced:
+            frames, replaced_table_ids, replaced_configs = zip(*replaced)
+            replace_status = load_data(
+                list(frames),
+                self.credentials_dict, self.project_id, self.dataset_id,
+                list(replaced_table_ids),
+                table_configs=list(replaced_configs),
+                client=self.client,
+                replace_tickers=list(replace_tickers)
+            )
+            if replace_status == 'failure':
+                status = 'failure'
+        return status
+
+    def refresh_aggregates(self, start, end, market_caps: dict = None) -> int:
+        """ Recomputes the stored sector aggregates of the dates between start and end in a single MERGE
+        (see etl.load.refresh_aggregates_in_bigquery). """
+        from etl.load import (
+            refresh_aggregates_in_bigquery, ensure_table, date_type, AGGREGATES_TABLE_CONFIG, STOCKS_TABLE_CONFIG,
+            DERIVED_TABLE_CONFIG,
+        )
+        table_id = self._table(self.aggregates_table_id)
+        stocks_table_id = self._table(self.table_ids[0])
+        derived_table_id = self._table(self.derived_table_id)
+        date_types = {
+            table: date_type(ensure_table(self.client, table, config))
+            for table, config in (
+                (table_id, AGGREGATES_TABLE_CONFIG), (stocks_table_id, STOCKS_TABLE_CONFIG),
+                (derived_table_id, DERIVED_TABLE_CONFIG),
+            )
+        }
+        job = refresh_aggregates_in_bigquery(
+            self.client, table_id, stocks_table_id, derived_table_id,
+            self._table(self.table_ids[1]), start, end, market_caps, date_types
+        )
+        return getattr(job, 'num_dml_affected_rows', None)
+
+    def prepare(self) -> None:
+        """ Creates the dataset and the tables of the sink that don't exist yet. """
+        from etl.load import (
+            create_dataset, ensure_table, STOCKS_TABLE_CONFIG, SECTORS_TABLE_CONFIG, DERIVED_TABLE_CONFIG,
+            QUARANTINE_TABLE_CONFIG, AGGREGATES_TABLE_CONFIG,
+        )
+        create_dataset(self.client, self.dataset_id)
+        tables = [
+            (self.table_ids[0], STOCKS_TABLE_CONFIG),
+            (self.table_ids[1], SECTORS_TABLE_CONFIG),
+            (self.derived_table_id, DERIVED_TABLE_CONFIG),
+            (self.quarantine_table_id, QUARANTINE_TABLE_CONFIG),
+            (self.aggregates_table_id, AGGREGATES_TABLE_CONFIG),
+        ]
+        for table_id, config in tables:
+            if table_id:
+                ensure_table(self.client, self._table(table_id), config)
+
+    def upsert_sectors(self, sector_df) -> None:
+        from etl.load import load_data, SECTORS_TABLE_CONFIG
+        load_data(
+            [sector_df], self.credentials_dict, self.project_id, self.dataset_id,
+            self.table_ids[1:], table_configs=[SECTORS_TABLE_CONFIG], client=self.client
+        )
+
+class ParquetSink:
+    """
+    Local sink storing the stocks (and derived metrics) tables as Hive-partitioned Parquet datasets
+    (<root>/<table>/year=YYYY/part-*.parquet) and the sectors and sector aggregates tables as single Parquet files.
+    Per-ticker watermarks are kept in a JSON manifest next to each dataset, so lookups don't scan the data.
+
+    Batches that don't overlap the stored data are plain appends of one file per year. Rows already
+    stored for the same (ticker, date) are replaced, which rewrites the affected year partitions.
+    Writes hold a lock file in the root directory, so that the tasks of a sharded run can share it.
+    """
+
+    WATERMARKS_FILE = '_watermarks.json'
+
+    def __init__(self, root: str, stocks_table_id: str = 'stocks', sectors_table_id: str = 'sectors', derived_table_id: str = None, compact_threshold: int = 32, quarantine_table_id: str = None, aggregates_table_id: str = None):
+        """
+        Args:
+            root (str): Root directory of the local storage.
+            stocks_table_id (str): Directory name of the stocks table. Default is 'stocks'.
+            sectors_table_id (str): Directory name of the sectors table. Default is 'sectors'.
+            derived_table_id (str): Directory name of the derived metrics table. Default is None.
+            compact_threshold (int): Number of files in a year partition above which it is
+                compacted into a single file by compact(). Default is 32.
+            quarantine_table_id (str): Directory name of the table of rows failing validation. Default is None.
+            aggregates_table_id (str): Directory name of the table of per-sector daily aggregates. Default is None.
+        """
+        self.root = root
+        self.stocks_path = os.path.join(root, stocks_table_id)
+        self.sectors_path = os.path.join(root, sectors_table_id, 'data.parquet')
+        self.derived_path = os.path.join(root, derived_table_id) if derived_table_id else None
+        self.quarantine_path = os.path.join(root, quarantine_table_id) if quarantine_table_id else None
+        self.aggregates_path = os.path.join(root, aggregates_table_id, 'data.parquet') if aggregates_table_id else None
+        self.compact_threshold = compact_threshold
+        self._lock = threading.Lock()
+        self._watermarks = {}
+        self._watermark_versions = {}
+
+    @contextmanager
+    def _write_lock(self):
+        """ Serializes writes across the threads of this process and the other processes sharing the root. """
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            os.makedirs(self.root, exist_ok=True)
+            with open(os.path.join(self.root, '.lock'), 'w') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _file_version(path: str) -> tuple | None:
+        """ Identifies the current version of an atomically replaced file. """
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns
+
+    def _load_watermarks(self, table_path: str) -> dict:
+        """ Returns the watermark manifest of a table, reloaded when another process replaced it and
+        rebuilt from the dataset if missing. Caller holds _lock. """
+        path = os.path.join(table_path, self.WATERMARKS_FILE)
+        version = self._file_version(path)
+        if table_path not in self._watermarks or (version is not None and version != self._watermark_versions.get(table_path)):
+            try:
+                with open(path) as f:
+                    self._watermarks[table_path] = json.load(f)
+            except (OSError, ValueError):
+                self._watermarks[table_path] = self._scan_watermarks(table_path)
+            self._watermark_versions[table_path] = version
+        return self._watermarks[table_path]
+
+    def _scan_watermarks(self, table_path: str) -> dict:
+        """ Computes the watermarks of a table from the stored data. """
+        if not glob.glob(os.path.join(table_path, 'year=*', '*.parquet')):
+            return {}
+        import pandas as pd
+        df = pd.read_parquet(table_path, columns=['ticker', 'date'])
+        logger.info(f"Rebuilt local watermarks of {table_path} from {len(df)} stored rows.")
+        return {ticker: ts.isoformat() for ticker, ts in df.groupby('ticker', observed=True)['date'].max().items()}
+
+    def _save_watermarks(self, table_path: str) -> None:
+        """ Atomically writes the watermark manifest of a table. Caller holds _lock. """
+        os.makedirs(table_path, exist_ok=True)
+        path = os.path.join(table_path, self.WATERMARKS_FILE)
+        with open(f"{path}.tmp", 'w') as f:
+            json.dump(self._watermarks[table_path], f)
+        os.replace(f"{path}.tmp", path)
+        self._watermark_versions[table_path] = self._file_version(path)
+
+    def get_watermarks(self, tickers: list = None) -> dict:
+        with self._lock:
+            watermarks = self._load_watermarks(self.stocks_path)
+            selected = watermarks if tickers is None else {t: watermarks[t] for t in tickers if t in watermarks}
+            return {ticker: datetime.fromisoformat(value) for ticker, value in selected.items()}
+
+    def get_known_tickers(self, tickers: list = None) -> list:
+        if not os.path.exists(self.sectors_path):
+            return []
+        import pyarrow.parquet as pq
+        known = set(pq.read_table(self.sectors_path, columns=['ticker']).column('ticker').to_pylist())
+        return [t for t in tickers if t in known] if tickers is not None else sorted(known)
+
+    def get_trailing_closes(self, tickers: list, before: date, rows: int):
+        """ Returns the last `rows` stored closes of each ticker before a date, reading only the partitions in range. """
+        import pandas as pd
+        from etl.derived import get_state_start
+        start = get_state_start(before, rows)
+        if not glob.glob(os.path.join(self.stocks_path, 'year=*', '*.parquet')):
+            return pd.DataFrame(columns=['ticker', 'date', 'close'])
+        df = pd.read_parquet(
+            self.stocks_path,
+            columns=['ticker', 'date', 'close'],
+            filters=[
+                ('year', '>=', start.year), ('year', '<=', before.year), ('ticker', 'in', list(tickers)),
+                ('date', '>=', pd.Timestamp(start)), ('date', '<', pd.Timestamp(before)),
+            ],
+        )
+        return df.sort_values(['ticker', 'date']).groupby('ticker', observed=True).tail(rows)
+
+    @staticmethod
+    def _write(df, path: str) -> None:
+        """ Writes a frame as zstd Parquet, with categoricals as plain strings so all files share a schema. """
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        table = table.cast(pa.schema([
+            pa.field(f.name, f.type.value_type if pa.types.is_dictionary(f.type) else f.type) for f in table.schema
+        ]))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        pq.write_table(table, f"{path}.tmp", compression='zstd')
+        os.replace(f"{path}.tmp", path)
+
+    def _new_file(self, table_path: str, year: int) -> str:
+        return os.path.join(table_path, f"year={year}", f"part-{uuid.uuid4().hex}.parquet")
+
+    def _replace_keys(self, table_path: str, year: int, df, replace_tickers: set = None, replace_range: tuple = None) -> None:
+        """ Removes from a year partition the (ticker, date) rows present in df and the rows of replace_tickers
+        dated in replace_range (first, last). Only the files holding rows of these tickers are read in full and
+        rewritten, the other files are left untouched. Caller holds the write lock. """
+        import pandas as pd
+        import pyarrow as pa
+        import pyarrow.compute as pc
+        import pyarrow.parquet as pq
+        tickers = set(df['ticker'].astype(str)) | set(replace_tickers or ())
+        if not tickers:
+            return
+        value_set = pa.array(sorted(tickers), type=pa.string())
+        new_keys = pd.MultiIndex.from_arrays([df['ticker'].astype(str), df['date']])
+        for f in glob.glob(os.path.join(table_path, f"year={year}", '*.parquet')):
+            if not pc.any(pc.is_in(pq.read_table(f, columns=['ticker']).column('ticker'), value_set=value_set)).as_py():
+                continue
+            stored = pd.read_parquet(f)
+            stored_tickers = stored['ticker'].astype(str)
+            removed = pd.MultiIndex.from_arrays([stored_tickers, stored['date']]).isin(new_keys)
+            if replace_tickers:
+                removed |= (stored_tickers.isin(replace_tickers) & stored['date'].between(*replace_range)).to_numpy()
+            if not removed.any():
+                continue
+            self._write(stored[~removed], self._new_file(table_path, year))
+            os.remove(f)
+
+    def _upsert_partitioned(self, table_path: str, df, replace_tickers: list = None) -> None:
+        """ Appends rows to a year-partitioned table, replacing the stored rows with the same (ticker, date).
+        Stored rows of replace_tickers in the date range of their new rows are all removed. """
+        df = df.drop_duplicates(subset=['ticker', 'date'], keep='last')
+        date_range = df.groupby('ticker', observed=True)['date'].agg(['min', 'max'])
+        years = df['date'].dt.year
+
+        with self._write_lock(), track('load.local_write', rows_in=len(df)):
+            watermarks = self._load_watermarks(table_path)
+            overlapping = [
+                ticker for ticker, first in date_range['min'].items()
+                if ticker in watermarks and first.isoformat() <= watermarks[ticker]
+            ]
+            replace_tickers = set(replace_tickers or ()) & set(date_range.index.astype(str))
+            replace_range = None
+            if replace_tickers:
+                replaced = date_range[date_range.index.astype(str).isin(replace_tickers)]
+                replace_range = (replaced['min'].min(), replaced['max'].max())
+            # Only the rows of overlapping tickers can have stored keys to replace
+            is_overlapping = df['ticker'].isin(overlapping)
+            rewritten_years = set(years[is_overlapping].unique())
+            if replace_range:
+                rewritten_years.update(range(replace_range[0].year, replace_range[1].year + 1))
+            for year in rewritten_years:
+                self._replace_keys(table_path, int(year), df[is_overlapping & (years == year)], replace_tickers, replace_range)
+
+            for year, year_df in df.groupby(years):
+                self._write(year_df, self._new_file(table_path, int(year)))
+
+            for ticker, last in date_range['max'].items():
+                if ticker not in watermarks or last.isoformat() > watermarks[ticker]:
+                    watermarks[ticker] = last.isoformat()
+            self._save_watermarks(table_path)
+
+    def _read_range(self, table_path: str, columns: list, start, end):
+        """ Returns the stored rows of a year-partitioned table dated between start and end, reading only the partitions in range. """
+        import pandas as pd
+        if not glob.glob(os.path.join(table_path, 'year=*', '*.parquet')):
+            return pd.DataFrame(columns=columns)
+        return pd.read_parquet(
+            table_path,
+            columns=columns,
+            filters=[('year', '>=', start.year), ('year', '<=', end.year), ('date', '>=', start), ('date', '<=', end)],
+        )
+
+    def refresh_aggregates(self, start, end, market_caps: dict = None) -> int:
+        """ Recomputes the stored sector aggregates of the dates between start and end from the stored metrics,
+        prices and sectors (see etl.aggregate.compute_sector_aggregates), replacing the stored rows of these dates.
+        Dates are recomputed one year partition at a time, so that only a year of rows is held in memory.
+        Holds the write lock, so that the rows loaded meanwhile by other batches or tasks are not missed. """
+        import pandas as pd
+        import pyarrow.parquet as pq
+        from etl.aggregate import compute_sector_aggregates
+        start, end = pd.Timestamp(start), pd.Timestamp(end)
+        with self._write_lock(), track('load.local_write') as m:
+            sectors = {}
+            if os.path.exists(self.sectors_path):
+                table = pq.read_table(self.sectors_path, columns=['ticker', 'sector'])
+                sectors = dict(zip(table.column('ticker').to_pylist(), table.column('sector').to_pylist()))
+            frames = []
+            for year in range(start.year, end.year + 1):
+                first, last = max(start, pd.Timestamp(year, 1, 1)), min(end, pd.Timestamp(year + 1, 1, 1) - pd.Timedelta(1, 'ns'))
+                frames.append(compute_sector_aggregates(
+                    self._read_range(self.stocks_path, ['ticker', 'date', 'volume'], first, last),
+                    self._read_range(self.derived_path, ['ticker', 'date', 'daily_return'], first, last),
+                    sectors, market_caps
+                ))
+            aggregates_df = pd.concat([df for df in frames if not df.empty] or frames[:1], ignore_index=True)
+            m['rows_out'] = rows = len(aggregates_df)
+            if os.path.exists(self.aggregates_path):
+                stored = pd.read_parquet(self.aggregates_path)
+                stored = stored[~stored['date'].between(start, end)]
+                aggregates_df = pd.concat([stored, aggregates_df], ignore_index=True).sort_values(['date', 'sector'], ignore_index=True)
+            self._write(aggregates_df, self.aggregates_path)
+        return rows
+
+    def load_batch(self, stock_df, sector_df=None, derived_df=None, quarantine_df=None, replace_tickers=None) -> str:
+        if sector_df is not None and not sector_df.empty:
+            self.upsert_sectors(sector_df)
+        if stock_df is not None and not stock_df.empty:
+            self._upsert_partitioned(self.stocks_path, stock_df, replace_tickers)
+        if self.derived_path and derived_df is not None and not derived_df.empty:
+            self._upsert_partitioned(self.derived_path, derived_df, replace_tickers)
+        if self.quarantine_path and quarantine_df is not None and not quarantine_df.empty:
+            self._upsert_partitioned(self.quarantine_path, quarantine_df, replace_tickers)
+        return 'success'
+
+    def prepare(self) -> None:
+        os.makedirs(self.root, exist_ok=True)
+
+    def upsert_sectors(self, sector_df) -> None:
+        import pandas as pd
+        with self._write_lock():
+            if os.path.exists(self.sectors_path):
+                sector_df = pd.concat([pd.read_parquet(self.sectors_path), sector_df], ignore_index=True)
+            self._write(sector_df.drop_duplicates(subset=['ticker'], keep='last'), self.sectors_path)
+
+    def compact(self) -> int:
+        """
+        Merges the files of every year partition holding more than compact_threshold files.
+
+        Returns:
+            int: Number of compacted partitions.
+        """
+        import pandas as pd
+        compacted = 0
+        with self._write_lock():
+            for table_path in filter(None, (self.stocks_path, self.derived_path, self.quarantine_path)):
+                for partition in glob.glob(os.path.join(table_path, 'year=*')):
+                    files = glob.glob(os.path.join(partition, '*.parquet'))
+                    if len(files) <= self.compact_threshold:
+                        continue
+                    df = pd.concat([pd.read_parquet(f) for f in files], ignore_index=True)
+                    self._write(df.sort_values(['ticker', 'date']), os.path.join(partition, f"part-{uuid.uuid4().hex}.parquet"))
+                    for f in files:
+                        os.remove(f)
+                    compacted += 1
+        if compacted:
+            logger.info(f"Compacted {compacted} local partition(s).")
+        return compacted
+
+def create_sink(backend: str, **kwargs):
+    """
+    Creates the storage sink of a backend.
+
+    Args:
+        backend (str): 'bigquery' or 'local'.
+        **kwargs: Arguments of BigQuerySink or ParquetSink.
+
+    Returns:
+        BigQuerySink | ParquetSink: The storage sink.
+
+    Raises:
+        ValueError: If the backend is unknown.
+    """
+    if backend == 'bigquery':
+        return BigQuerySink(**kwargs)
+    if backend == 'local':
+        return ParquetSink(**kwargs)
+    raise ValueError(f"Unknown storage backend '{backend}', expected 'bigquery' or 'local'.")
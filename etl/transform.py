@@ -1,37 +1,59 @@
 import pandas as pd
 import logging
+from utils.metrics import track
 
 logger = logging.getLogger(__name__)
 
+PRICE_COLUMNS = ['open', 'high', 'low', 'close']
+
 def transform_data(raw_df: pd.DataFrame) -> pd.DataFrame:
     """
     Transforms the raw stock data by renaming columns to lowercase, 
     converting types, and handling potential null values.
+    Columns are cast to compact types (float32 prices, integer volume and
+    categorical ticker) on a shallow copy, so the caller's frame is left
+    untouched and unchanged columns are shared instead of copied.
     """
+    with track('transform', rows_in=len(raw_df)) as m:
+        transformed_df = _transform(raw_df)
+        m['rows_out'] = len(transformed_df)
+    return transformed_df
+
+def _transform(raw_df: pd.DataFrame) -> pd.DataFrame:
     try:
         logger.info("Starting data transformation...")
         if raw_df.empty:
             logger.warning("Received empty DataFrame for transformation.")
             return pd.DataFrame()
 
-        # Convert columns to lowercase
-        transformed_df = raw_df.rename(columns=str.lower)
+        # Convert columns to lowercase (on a shallow copy, copy-on-write keeps raw_df unchanged)
+        transformed_df = raw_df.copy(deep=False)
+        transformed_df.columns = transformed_df.columns.str.lower()
         
         # Cast to appropriate types
-        if 'date' in transformed_df.columns:
+        if 'date' in transformed_df.columns and not pd.api.types.is_datetime64_any_dtype(transformed_df['date']):
             transformed_df['date'] = pd.to_datetime(transformed_df['date'])
 
-        num_cols = ['open', 'high', 'low', 'close', 'volume']
-        existing_num_cols = [col for col in num_cols if col in transformed_df.columns]
-        
-        if existing_num_cols:
-            transformed_df[existing_num_cols] = transformed_df[existing_num_cols].apply(
-                pd.to_numeric, errors='coerce'
-            )
+        for col in PRICE_COLUMNS:
+            if col in transformed_df.columns:
+                transformed_df[col] = to_numeric(transformed_df[col]).astype('float32')
+
+        if 'volume' in transformed_df.columns:
+            volume = to_numeric(transformed_df['volume'])
+            transformed_df['volume'] = volume.round().astype('Int64' if volume.isna().any() else 'int64')
+
+        if 'ticker' in transformed_df.columns and not isinstance(transformed_df['ticker'].dtype, pd.CategoricalDtype):
+            transformed_df['ticker'] = transformed_df['ticker'].astype('category')
         
         logger.info("Data transformation completed successfully.")
         return transformed_df
 
     except Exception as e:
         logger.error(f"Error during data transformation: {e}")
-        return pd.DataFrame()
\ No newline at end of file
+        return pd.DataFrame()
+
+def to_numeric(series: pd.Series) -> pd.Series:
+    """ Converts a column to a numeric type, skipping the conversion when it already is numeric. """
+    if pd.api.types.is_numeric_dtype(series):
+        return series
+    return pd.to_numeric(series, errors='coerce')
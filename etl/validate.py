@@ -0,0 +1,151 @@
+import logging
+import numpy as np
+import pandas as pd
+from utils.metrics import track, add_counts
+from utils.trading_calendar import is_trading_day
+
+logger = logging.getLogger(__name__)
+
+# Row checks in evaluation order, a row failing several of them is quarantined with the first one
+CHECKS = ['missing_close', 'ohlc_inconsistent', 'negative_volume', 'duplicate', 'off_calendar', 'outlier_jump']
+# Relative slack of the OHLC consistency checks (float32 prices, rounding of adjusted prices)
+OHLC_TOLERANCE = 1e-3
+# Daily move above which a price that reverts on the next row is considered a bad print
+DEFAULT_MAX_JUMP = 0.5
+
+def _sessions(days: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Maps days (datetime64[D]) to whether they are trading days and to their trading session number,
+    evaluating the calendar once per calendar day of the covered range.
+    """
+    first = days.min()
+    calendar = np.arange(first, days.max() + np.timedelta64(1, 'D'))
+    is_session = np.fromiter((is_trading_day(d) for d in calendar.astype(object)), dtype=bool, count=len(calendar))
+    offsets = (days - first).astype('int64')
+    return is_session[offsets], np.cumsum(is_session)[offsets]
+
+def check_prices(stock_df: pd.DataFrame, max_jump: float = DEFAULT_MAX_JUMP) -> tuple[np.ndarray, dict]:
+    """
+    Runs the row checks on transformed stock data, on whole columns at once:
+    - missing_close: NaN or non-positive close (e.g. coerced by pd.to_numeric).
+    - ohlc_inconsistent: high below low, or open/close outside the [low, high] range.
+    - negative_volume: volume below zero.
+    - duplicate: repeated (ticker, date), the last occurrence is kept.
+    - off_calendar: rows dated on a day the exchange was closed.
+    - outlier_jump: a close moving more than max_jump from the previous row of the ticker and
+      reverting on the next one (a bad print). Level shifts such as unadjusted splits are kept.
+
+    Missing trading sessions between consecutive rows of a ticker (calendar gaps) have no row
+    to quarantine, they are only counted.
+
+    Args:
+        stock_df (pd.DataFrame): Transformed stock data with 'date', 'ticker' and OHLCV columns.
+        max_jump (float): Relative daily move of the outlier check. Default is 0.5 (50%).
+
+    Returns:
+        tuple[np.ndarray, dict]: Tuple containing:
+            - reasons: Index in CHECKS of the first failed check of each row, -1 for valid rows.
+            - counts: Number of rows failing each check, plus 'calendar_gaps' (missing sessions)
+              and 'tickers_with_gaps'.
+    """
+    n_rows = len(stock_df)
+    reasons = np.full(n_rows, -1, dtype='int8')
+    counts = dict.fromkeys(CHECKS + ['calendar_gaps', 'tickers_with_gaps'], 0)
+    if n_rows == 0:
+        return reasons, counts
+
+    def column(name):
+        if name not in stock_df.columns:
+            return np.full(n_rows, np.nan)
+        return stock_df[name].to_numpy(dtype='float64', na_value=np.nan)
+
+    def flag(check, mask):
+        mask = mask & (reasons < 0)
+        reasons[mask] = CHECKS.index(check)
+        counts[check] += int(mask.sum())
+
+    open_, high, low, close, volume = (column(c) for c in ('open', 'high', 'low', 'close', 'volume'))
+    upper, lower = high * (1 + OHLC_TOLERANCE), low * (1 - OHLC_TOLERANCE)
+    flag('missing_close', ~(close > 0))
+    flag('ohlc_inconsistent', (high < lower) | (open_ > upper) | (open_ < lower) | (close > upper) | (close < lower))
+    flag('negative_volume', volume < 0)
+
+    # Per-ticker checks run on the rows sorted by ticker and date (stable, so the last duplicate stays last)
+    ticker = stock_df['ticker']
+    codes = ticker.cat.codes.to_numpy() if isinstance(ticker.dtype, pd.CategoricalDtype) else pd.factorize(ticker)[0]
+    dates = stock_df['date']
+    if getattr(dates.dt, 'tz', None) is not None:
+        # Intraday bars: sessions are New York days, keys and order are UTC timestamps
+        days = dates.dt.tz_convert('America/New_York').dt.tz_localize(None).to_numpy(dtype='datetime64[ns]')
+        dates = dates.dt.tz_convert(None).to_numpy(dtype='datetime64[ns]')
+    else:
+        dates = days = dates.to_numpy(dtype='datetime64[ns]')
+    order = np.lexsort((dates, codes))
+    sorted_codes, sorted_dates = codes[order], dates[order]
+
+    same_key_as_next = np.r_[(sorted_codes[1:] == sorted_codes[:-1]) & (sorted_dates[1:] == sorted_dates[:-1]), False]
+    duplicate = np.zeros(n_rows, dtype=bool)
+    duplicate[order] = same_key_as_next
+    flag('duplicate', duplicate)
+
+    is_session, session_number = _sessions(days.astype('datetime64[D]'))
+    flag('off_calendar', ~is_session)
+
+    # Gaps and jumps are measured between the remaining rows of each ticker
+    kept = order[reasons[order] < 0]
+    kept_codes, kept_close, kept_sessions = codes[kept], close[kept], session_number[kept]
+    same_ticker = kept_codes[1:] == kept_codes[:-1]
+    gaps = np.where(same_ticker, np.maximum(kept_sessions[1:] - kept_sessions[:-1] - 1, 0), 0)
+    counts['calendar_gaps'] = int(gaps.sum())
+    counts['tickers_with_gaps'] = len(np.unique(kept_codes[1:][gaps > 0]))
+
+    if len(kept) > 2:
+        threshold = np.log1p(max_jump)
+        log_close = np.log(kept_close)
+        jump = np.abs(log_close[1:-1] - log_close[:-2])
+        revert = np.abs(log_close[2:] - log_close[:-2])
+        spike = same_ticker[:-1] & same_ticker[1:] & (jump > threshold) & (revert < threshold / 2)
+        outlier = np.zeros(n_rows, dtype=bool)
+        outlier[kept[1:-1][spike]] = True
+        flag('outlier_jump', outlier)
+
+    return reasons, counts
+
+def validate_data(stock_df: pd.DataFrame, max_jump: float = DEFAULT_MAX_JUMP) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Validation stage: splits transformed stock data into the rows to load and the quarantined ones.
+    Check counts are added to the run report under 'validation'.
+
+    Args:
+        stock_df (pd.DataFrame): Transformed stock data of a batch.
+        max_jump (float): Relative daily move of the outlier check. Default is 0.5 (50%).
+
+    Returns:
+        tuple[pd.DataFrame, pd.DataFrame]: Tuple containing:
+            - valid_df: Rows passing every check (stock_df itself when all rows pass).
+            - quarantine_df: Failing rows with the name of their first failed check in 'reason',
+              one row per (ticker, date).
+    """
+    with track('validate', rows_in=len(stock_df)) as m:
+        if stock_df.empty:
+            return stock_df, pd.DataFrame()
+        reasons, counts = check_prices(stock_df, max_jump)
+        bad = reasons >= 0
+        n_bad = int(bad.sum())
+        add_counts('validation', {'rows': len(stock_df), 'quarantined': n_bad, **counts})
+        if counts['calendar_gaps']:
+            logger.info(f"{counts['calendar_gaps']} missing trading session(s) in {counts['tickers_with_gaps']} ticker(s).")
+
+        if not n_bad:
+            m['rows_out'] = len(stock_df)
+            return stock_df, pd.DataFrame()
+
+        logger.warning(
+            f"Quarantined {n_bad} of {len(stock_df)} rows: "
+            f"{ {check: counts[check] for check in CHECKS if counts[check]} }"
+        )
+        quarantine_df = stock_df[bad].assign(reason=pd.Categorical.from_codes(reasons[bad], categories=CHECKS))
+        quarantine_df = quarantine_df.drop_duplicates(subset=['ticker', 'date'], keep='last').reset_index(drop=True)
+        valid_df = stock_df[~bad].reset_index(drop=True)
+        m['rows_out'] = len(valid_df)
+    return valid_df, quarantine_df
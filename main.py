@@ -1,102 +1,225 @@
 import logging
-from config.assets import TICKERS
+import time
+_imports_start = time.perf_counter()
+from config.assets import TICKERS, UNIVERSE_INDEX
 from config.settings import (
-    CREDENTIALS_DICT, PROJECT_ID, DATASET_ID, STOCKS_TABLE_ID, SECTORS_TABLE_ID,
-    REQUIRED_ENV_VARS,
+    CREDENTIALS_DICT, PROJECT_ID, DATASET_ID, STOCKS_TABLE_ID, SECTORS_TABLE_ID, DERIVED_TABLE_ID,
+    REQUIRED_ENV_VARS, BATCH_SIZE, EXTRACT_WORKERS, TRANSFORM_WORKERS, LOAD_WORKERS,
+    PIPELINE_QUEUE_SIZE, PRICE_CACHE_DIR, PRICE_CACHE_MAX_BYTES,
+    SECTOR_CACHE_PATH, SECTOR_CACHE_TTL_DAYS, FETCH_RATE_PER_SECOND, FETCH_BURST,
+    FETCH_MAX_CONCURRENCY, FETCH_MAX_RETRIES, LOAD_MAX_JOBS_IN_FLIGHT, UNIVERSE,
+    UNIVERSE_STATE_PATH, RUN_REPORT_PATH, METRICS_SINKS, STORAGE_BACKEND, LOCAL_STORAGE_DIR,
+    RUN_MANIFEST_PATH, RUN_CHECKPOINT_DIR, QUARANTINE_TABLE_ID, VALIDATE_DATA, VALIDATION_MAX_JUMP,
+    INTERVAL, TASK_INDEX, TASK_COUNT, REFRESH_CORPORATE_ACTIONS, SECTOR_AGGREGATES_TABLE_ID,
 )
-from etl.extract import extract_data
-from etl.transform import transform_data
-from etl.load import load_data
-from utils.bigquery import get_latest_data_date
-from utils.extract_helpers import get_extraction_params
-from utils.google_cloud import get_bigquery_client
-from utils.validations import check_existing_tickers, check_env_variables
+from config.universe import diff_universe, save_universe, get_ipo_years, get_market_caps
+from etl.sinks import create_sink
+from utils.extract_helpers import get_ticker_buckets
+from utils.intervals import is_intraday, get_interval_table_id
+from utils.manifest import RunManifest, get_run_key
+from utils.metrics import track, set_value, configure_sinks, build_report, write_report, publish_report
+from utils.profiling import timed_import, record_import_time, log_import_report, get_import_report
+from utils.rate_limit import configure_scheduler, get_scheduler
+from utils.sharding import get_shard, get_task_path
+from utils.time import get_last_market_close_date
+from utils.google_cloud import get_bigquery_rest_client
+from utils.validations import check_env_variables
+# Heavy libraries (pandas, pyarrow, yfinance, google-cloud-bigquery) are only imported
+# by the ETL modules, which are loaded once an update is actually needed
+record_import_time("main (startup)", time.perf_counter() - _imports_start)
 
 # Logger configuration
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
+def report_run(status: str, **extra) -> None:
+    """ Writes the JSON run report and pushes it to the configured metrics sinks. """
+    set_value("fetch", get_scheduler().stats())
+    set_value("import_seconds", get_import_report())
+    report = build_report(
+        status=status, universe=UNIVERSE, tickers=len(TICKERS), task_index=TASK_INDEX, task_count=TASK_COUNT, **extra
+    )
+    report_path = get_task_path(RUN_REPORT_PATH, TASK_INDEX, TASK_COUNT)
+    if report_path:
+        try:
+            write_report(report, report_path)
+        except OSError as e:
+            logging.error(f"Could not write the run report to {report_path}: {e}")
+    publish_report(report)
+
+def plan_run(sink, tickers: list, sector_tickers: list) -> tuple[dict, list]:
+    """ Returns the tickers to extract grouped by start date, and the sector_tickers missing from the sector table. """
+    # Validate tickers
+    missing_tickers = []
+    if sector_tickers:
+        logging.info("Checking tickers in sector table...")
+        try:
+            with track("plan.sectors_check", rows_in=len(sector_tickers)) as m:
+                existing_tickers = set(sink.get_known_tickers(sector_tickers))
+                m["rows_out"] = len(existing_tickers)
+            missing_tickers = [t for t in sector_tickers if t not in existing_tickers]
+        except Exception as e:
+            logging.error(f"Error validating tickers: {e}")
+            missing_tickers = list(sector_tickers)
+
+    # Determine extraction start date per ticker (full vs incremental)
+    with track("plan.watermarks", rows_in=len(tickers)) as m:
+        latest_dates = sink.get_watermarks(tickers)
+        m["rows_out"] = len(latest_dates)
+    ticker_buckets = get_ticker_buckets(tickers, latest_dates, interval=INTERVAL)
+    return ticker_buckets, missing_tickers
+
 def main():
     logging.info("Starting ETL process...")
+    configure_sinks(METRICS_SINKS)
 
-    # Validate environment variables
-    missing_env_vars = check_env_variables(REQUIRED_ENV_VARS)
-    if missing_env_vars:
-        raise EnvironmentError(f"Missing required environment variables: {', '.join(missing_env_vars)}")
+    # Validate environment variables (Google Cloud credentials are only needed for BigQuery)
+    if STORAGE_BACKEND == "bigquery":
+        missing_env_vars = check_env_variables(REQUIRED_ENV_VARS)
+        if missing_env_vars:
+            raise EnvironmentError(f"Missing required environment variables: {', '.join(missing_env_vars)}")
 
-    client = get_bigquery_client(CREDENTIALS_DICT, PROJECT_ID)
+    logging.info(f"Universe '{UNIVERSE}' resolved to {len(TICKERS)} tickers.")
 
-    # Validate tickers
-    logging.info("Checking tickers in sector table...")
-    try:
-        existing_tickers = check_existing_tickers(
-            f"{PROJECT_ID}.{DATASET_ID}.{SECTORS_TABLE_ID}",
-            client,
-            TICKERS
+    # Sharded runs: each task processes its own share of the universe, balanced by history length.
+    # Every task creates the missing tables before its first load (creation is idempotent, so tasks don't
+    # wait on each other), the universe state and the cache eviction are handled by task 0 only. Each task
+    # resolves the sectors of its own tickers, so that they are known to the sector aggregates of its batches.
+    is_primary = TASK_INDEX == 0
+    tickers = get_shard(TICKERS, get_ipo_years(UNIVERSE_INDEX), get_last_market_close_date().year, TASK_INDEX, TASK_COUNT)
+    if TASK_COUNT > 1:
+        logging.info(f"Task {TASK_INDEX + 1}/{TASK_COUNT} processes {len(tickers)} tickers.")
+        set_value("shard", {"task_index": TASK_INDEX, "task_count": TASK_COUNT, "tickers": len(tickers)})
+    if is_primary:
+        added, removed = diff_universe(TICKERS, UNIVERSE_STATE_PATH)
+        set_value("universe", {"tickers": len(TICKERS), "added": added, "removed": removed})
+
+    # Intraday prices go to interval-specific tables, derived metrics (and the sector aggregates
+    # of their returns) are only computed on daily prices
+    derived_table_id = None if is_intraday(INTERVAL) else DERIVED_TABLE_ID
+    aggregates_table_id = SECTOR_AGGREGATES_TABLE_ID if derived_table_id else None
+    quarantine_table_id = get_interval_table_id(QUARANTINE_TABLE_ID, INTERVAL)
+    if STORAGE_BACKEND == "local":
+        logging.info(f"Using local storage in {LOCAL_STORAGE_DIR}.")
+        stocks_table_id = get_interval_table_id(STOCKS_TABLE_ID or "stocks", INTERVAL)
+        sink = create_sink(
+            "local",
+            root=LOCAL_STORAGE_DIR,
+            stocks_table_id=stocks_table_id,
+            sectors_table_id=SECTORS_TABLE_ID or "sectors",
+            derived_table_id=derived_table_id,
+            quarantine_table_id=quarantine_table_id,
+            aggregates_table_id=aggregates_table_id
         )
-        missing_tickers = [t for t in TICKERS if t not in existing_tickers]
-    except Exception as e:
-        logging.error(f"Error validating tickers: {e}")
-        missing_tickers = TICKERS
-        existing_tickers = []
-
-    # Determine extraction parameters for define update strategy (full vs incremental)
-    latest_date = get_latest_data_date(
-            f"{PROJECT_ID}.{DATASET_ID}.{STOCKS_TABLE_ID}",
-            client,
-            date_column="date"
+    else:
+        # Lightweight REST client for the startup checks, the full client is created on the first load
+        stocks_table_id = get_interval_table_id(STOCKS_TABLE_ID, INTERVAL)
+        sink = create_sink(
+            STORAGE_BACKEND,
+            credentials_dict=CREDENTIALS_DICT,
+            project_id=PROJECT_ID,
+            dataset_id=DATASET_ID,
+            stocks_table_id=stocks_table_id,
+            sectors_table_id=SECTORS_TABLE_ID,
+            derived_table_id=derived_table_id,
+            quarantine_table_id=quarantine_table_id,
+            aggregates_table_id=aggregates_table_id,
+            query_client=get_bigquery_rest_client(CREDENTIALS_DICT, PROJECT_ID)
         )
-    start_date, period, should_update = get_extraction_params(latest_date)
 
-    # Decide whether to execute the ETL process
-    # Run if there are new tickers OR if existing ones need updating
-    if not should_update and not missing_tickers:
-        logging.info("Everything is up to date. No execution needed.")
-        return
+    # Resume an interrupted run with the same plan, otherwise plan a new one
+    target = f"{LOCAL_STORAGE_DIR}/{stocks_table_id}" if STORAGE_BACKEND == "local" else f"{PROJECT_ID}.{DATASET_ID}.{stocks_table_id}"
+    run_key = get_run_key(tickers, get_last_market_close_date(), f"{STORAGE_BACKEND}:{target}")
+    manifest_path = get_task_path(RUN_MANIFEST_PATH, TASK_INDEX, TASK_COUNT)
+    checkpoint_dir = get_task_path(RUN_CHECKPOINT_DIR, TASK_INDEX, TASK_COUNT)
+    manifest = RunManifest.resume(manifest_path, run_key, checkpoint_dir) if manifest_path else None
+    if manifest:
+        logging.info(f"Resuming interrupted run (attempt {manifest.attempts}), batch states: {manifest.summary()}")
+        set_value("resumed_batches", manifest.summary())
+    else:
+        ticker_buckets, missing_tickers = plan_run(sink, tickers, tickers)
 
-    # If no update is needed for existing tickers, clear them for extract_data
-    tickers_to_update = existing_tickers if should_update else []
-
-    # Extract Phase
-    try:
-        raw_stock_df, sector_df = extract_data(
-            existing_tickers=tickers_to_update,
-            missing_tickers=missing_tickers,
-            period=period,
-            interval='1d',
-            start_date=start_date
-        )
-        
-        if raw_stock_df.empty and sector_df.empty:
-            logging.warning("No data extracted.")
+        # Decide whether to execute the ETL process
+        # Run if there are new tickers OR if existing ones need updating
+        if not ticker_buckets and not missing_tickers:
+            logging.info("Everything is up to date. No execution needed.")
+            if is_primary:
+                save_universe(TICKERS, UNIVERSE_STATE_PATH)
+            log_import_report()
+            report_run("up_to_date")
             return
-            
-    except Exception as e:
-        logging.error(f"Error during data extraction: {e}")
-        return
 
-    # Transform Phase
-    try:
-        transformed_stock_df = transform_data(raw_stock_df)
-        if transformed_stock_df.empty and not sector_df.empty:
-             logging.info("Only sector data to load.")
-        elif transformed_stock_df.empty:
-            logging.warning("No data to transform.")
-            return
-    except Exception as e:
-        logging.error(f"Error during data transformation: {e}")
-        return
+    # Load the ETL modules and their dependencies only now that they are needed
+    pipeline = timed_import("etl.pipeline")
+    extract = timed_import("etl.extract")
+    price_cache = timed_import("utils.price_cache")
+    if STORAGE_BACKEND == "bigquery":
+        timed_import("etl.load").configure_load_jobs(LOAD_MAX_JOBS_IN_FLIGHT)
+    log_import_report()
+
+    scheduler = configure_scheduler(
+        rate_per_second=FETCH_RATE_PER_SECOND,
+        burst=FETCH_BURST,
+        max_concurrency=FETCH_MAX_CONCURRENCY,
+        max_retries=FETCH_MAX_RETRIES
+    )
+    with track("setup"):
+        sink.prepare()
+
+    # Extract, transform and load tickers in bounded-size batches with overlapping stages
+    if manifest:
+        batches = manifest.batches
+    else:
+        batches = pipeline.split_into_batches(ticker_buckets, missing_tickers, BATCH_SIZE)
+        if manifest_path:
+            manifest = RunManifest.create(manifest_path, batches, run_key, checkpoint_dir)
+    # Cached sectors past their TTL are fetched again while the batches run, and written after them
+    extract.schedule_sector_refresh(tickers, SECTOR_CACHE_PATH, SECTOR_CACHE_TTL_DAYS)
+    logging.info(f"Processing {len(batches)} batch(es) of up to {BATCH_SIZE} tickers...")
+    totals = pipeline.run_batches(
+        batches,
+        interval=INTERVAL,
+        extract_workers=EXTRACT_WORKERS,
+        transform_workers=TRANSFORM_WORKERS,
+        load_workers=LOAD_WORKERS,
+        queue_size=PIPELINE_QUEUE_SIZE,
+        sink=sink,
+        derive_metrics=bool(derived_table_id),
+        manifest=manifest,
+        validate=VALIDATE_DATA,
+        validate_kwargs={'max_jump': VALIDATION_MAX_JUMP},
+        corporate_actions=REFRESH_CORPORATE_ACTIONS and not is_intraday(INTERVAL),
+        aggregate_sectors=bool(aggregates_table_id),
+        market_caps=get_market_caps(UNIVERSE_INDEX),
+        extract_kwargs={
+            'cache_dir': PRICE_CACHE_DIR,
+            'sector_cache_path': SECTOR_CACHE_PATH,
+            'sector_cache_ttl_days': SECTOR_CACHE_TTL_DAYS,
+        }
+    )
 
-    # Load Phase
     try:
-        status = load_data(
-            [transformed_stock_df, sector_df], 
-            CREDENTIALS_DICT, PROJECT_ID, DATASET_ID, 
-            [STOCKS_TABLE_ID, SECTORS_TABLE_ID]
-        )
-        if status == 'success':
-            logging.info("ETL process completed successfully.")
+        extract.upsert_refreshed_sectors(sink)
     except Exception as e:
-        logging.error(f"Error during data loading: {e}")
+        logging.error(f"Could not write the refreshed sectors: {e}")
+    logging.info(f"Yahoo Finance fetch stats: {scheduler.stats()}")
+    if PRICE_CACHE_DIR and is_primary:
+        with track("cache.evict"):
+            price_cache.evict_cache(PRICE_CACHE_DIR, PRICE_CACHE_MAX_BYTES)
+    if STORAGE_BACKEND == "local":
+        with track("load.compact"):
+            sink.compact()
+
+    if manifest and not manifest.finish():
+        logging.info(f"Unfinished batches are kept in {manifest_path} and resumed by the next run.")
+    if is_primary:
+        save_universe(TICKERS, UNIVERSE_STATE_PATH)
+    if totals['failed_batches']:
+        logging.error(f"ETL process finished with {totals['failed_batches']} failed batch(es) out of {totals['batches']}.")
+    elif totals['aggregates_failed']:
+        logging.error("ETL process finished without recomputing the sector aggregates of the loaded dates.")
+    else:
+        logging.info(f"ETL process completed successfully. Loaded {totals['rows']} rows and {totals['sectors']} sectors.")
+    report_run("failure" if totals['failed_batches'] or totals['aggregates_failed'] else "success", totals=totals)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,14 +1,91 @@
-from datetime import datetime
-from google.cloud import bigquery
+from __future__ import annotations
+import logging
+from datetime import date, datetime
+from typing import TYPE_CHECKING
+from utils.google_cloud import run_query, is_not_found
 
-def get_latest_data_date(table_id: str, client: bigquery.Client, date_column: str) -> str | datetime:
-    """ Retrieves the latest date from a specified date column in a BigQuery table."""
+if TYPE_CHECKING:
+    from google.cloud import bigquery
+
+logger = logging.getLogger(__name__)
+
+def get_latest_dates_by_ticker(
+    table_id: str,
+    client: bigquery.Client,
+    tickers: list = None,
+    date_column: str = "date",
+    ticker_column: str = "ticker"
+) -> dict:
+    """
+    Retrieves the latest date per ticker from a BigQuery table in a single query.
+
+    Args:
+        table_id (str): Full table ID in BigQuery (e.g., `project.dataset.table`).
+        client (bigquery.Client): Authenticated BigQuery client (or BigQueryRestClient).
+        tickers (list): Optional list of tickers to restrict the lookup to.
+        date_column (str): Name of the date column. Default is 'date'.
+        ticker_column (str): Name of the ticker column. Default is 'ticker'.
+
+    Returns:
+        dict: Mapping of ticker to its latest date. Tickers without rows are not included.
+              Returns an empty dict if the table does not exist yet.
+
+    Raises:
+        Exception: Any other query error, so that a transient failure doesn't make every
+            ticker look new and trigger a full-history download of the universe.
+    """
     try:
-        query = f"SELECT MAX({date_column}) AS max_date FROM `{table_id}`"
-        query_job = client.query(query)
-        result = query_job.result()
-        for row in result:
-            return row.max_date
-        return None
-    except Exception:
-        return None
\ No newline at end of file
+        query = f"""
+            SELECT {ticker_column} AS ticker, MAX({date_column}) AS max_date
+            FROM `{table_id}`
+            {f"WHERE {ticker_column} IN UNNEST(@tickers)" if tickers else ""}
+            GROUP BY {ticker_column}
+        """
+        params = {"tickers": ("STRING", tickers)} if tickers else None
+        return {row['ticker']: row['max_date'] for row in run_query(client, query, params)}
+    except Exception as e:
+        if not is_not_found(e):
+            raise
+        logger.info(f"Table {table_id} not found, every ticker is extracted in full.")
+        return {}
+
+def get_trailing_rows(
+    table_id: str,
+    client: bigquery.Client,
+    tickers: list,
+    start: date,
+    before: date,
+    rows: int,
+    columns: list = ("ticker", "date", "close"),
+    date_type: str = "TIMESTAMP"
+) -> list[dict]:
+    """
+    Retrieves the last rows of each ticker before a date, e.g. the state needed to extend
+    rolling metrics incrementally. The [start, before) date range lets BigQuery prune partitions.
+
+    Args:
+        table_id (str): Full table ID in BigQuery (e.g., `project.dataset.table`).
+        client (bigquery.Client): Authenticated BigQuery client (or BigQueryRestClient).
+        tickers (list): Tickers to retrieve.
+        start (date): Earliest date to scan.
+        before (date): Rows on or after this date are excluded.
+        rows (int): Maximum number of rows per ticker.
+        columns (list): Columns to retrieve. Default is ticker, date and close.
+        date_type (str): Type of the table's date column, TIMESTAMP or DATETIME. Default is TIMESTAMP.
+
+    Returns:
+        list[dict]: Rows as dictionaries of column name to value.
+    """
+    query = f"""
+        SELECT {", ".join(columns)}
+        FROM `{table_id}`
+        WHERE ticker IN UNNEST(@tickers) AND date >= @start AND date < @before
+        QUALIFY ROW_NUMBER() OVER (PARTITION BY ticker ORDER BY date DESC) <= @rows
+    """
+    params = {
+        "tickers": ("STRING", tickers),
+        "start": (date_type, datetime.combine(start, datetime.min.time())),
+        "before": (date_type, datetime.combine(before, datetime.min.time())),
+        "rows": ("INT64", rows),
+    }
+    return run_query(client, query, params)
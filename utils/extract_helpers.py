@@ -1,28 +1,60 @@
-from datetime import datetime, date, timedelta
+from datetime import datetime, date
+from utils.intervals import is_intraday, get_intraday_start
 from utils.time import get_last_market_close_date
+from utils.trading_calendar import next_trading_day
 import logging
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
-def get_extraction_params(latest_date: str |datetime | date) -> tuple[date | None, str | None, bool]:
-    """ Define start date, period, and whether to update existing tickers
-    based on the latest date in the table and current date. """
+def to_date(value: str | datetime | date | None) -> date | None:
+    """ Normalizes a string, datetime or date value into a date object. """
+    if isinstance(value, str):
+        value = date.fromisoformat(value[:10])
+    if isinstance(value, datetime):
+        value = value.date()
+    return value
 
-    # Ensure latest_date is a date object
-    if isinstance(latest_date, str):
-        latest_date = date.fromisoformat(latest_date)
-    if isinstance(latest_date, datetime):
-        latest_date = latest_date.date()
-    
-    if not latest_date:
-        logging.info("No existing data found. Full extraction will be performed.")
-        return None, 'max', False
+def get_ticker_buckets(tickers: list, latest_dates: dict, interval: str = '1d') -> dict[date | None, list]:
+    """
+    Groups tickers into buckets that share the same extraction start date,
+    based on the latest date stored for each ticker. Start dates are always trading
+    days, and tickers are only extracted when a trading session has closed since their latest date.
+    For intraday intervals the latest stored timestamp is used, so an incomplete session is extracted again.
 
+    Args:
+        tickers (list): List of tickers to extract.
+        latest_dates (dict): Mapping of ticker to its latest stored date (or timestamp).
+        interval (str): Interval of the stored data. Default is '1d'.
+
+    Returns:
+        dict[date | None, list]: Mapping of start date to the tickers that need data from it.
+            Tickers without stored data are grouped under None (full extraction).
+            Tickers that are already up to date are not included.
+    """
     last_market_close_date = get_last_market_close_date()
-    if latest_date < last_market_close_date:
-        start_date = latest_date + timedelta(days=1)
-        logging.info(f"Update needed: {latest_date} < {last_market_close_date}. Start: {start_date}")
-        return start_date, None, True
-    
-    logging.info(f"Data is up to date. Latest date: {latest_date}, Last market close date: {last_market_close_date}.")
-    return None, None, False
\ No newline at end of file
+    buckets = {}
+    up_to_date = 0
+
+    for ticker in tickers:
+        latest_date = to_date(latest_dates.get(ticker))
+        if latest_date is None:
+            start_date = None
+        elif is_intraday(interval):
+            start_date = get_intraday_start(latest_dates[ticker], interval)
+            if start_date is None:
+                up_to_date += 1
+                continue
+        elif latest_date < last_market_close_date:
+            start_date = next_trading_day(latest_date)
+        else:
+            up_to_date += 1
+            continue
+        buckets.setdefault(start_date, []).append(ticker)
+
+    full = len(buckets.get(None, []))
+    incremental = sum(len(t) for start, t in buckets.items() if start is not None)
+    logging.info(
+        f"Tickers to extract: {full} full, {incremental} incremental "
+        f"in {len(buckets) - (1 if full else 0)} start date bucket(s), {up_to_date} up to date."
+    )
+    return buckets
@@ -1,5 +1,13 @@
-from google.cloud import bigquery
-from google.oauth2 import service_account
+from __future__ import annotations
+import time
+from datetime import date, datetime, timezone
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from google.cloud import bigquery
+
+BIGQUERY_API_URL = "https://bigquery.googleapis.com/bigquery/v2"
+BIGQUERY_SCOPE = "https://www.googleapis.com/auth/bigquery"
 
 def get_bigquery_client(credentials_dict: dict, project_id: str) -> bigquery.Client:
     """
@@ -13,8 +21,162 @@ def get_bigquery_client(credentials_dict: dict, project_id: str) -> bigquery.Cli
         bigquery.Client: An authenticated BigQuery client instance.
     """
     try:
+        from google.cloud import bigquery
+        from google.oauth2 import service_account
+
         credentials = service_account.Credentials.from_service_account_info(credentials_dict)
         client = bigquery.Client(credentials=credentials, project=project_id)
         return client
     except Exception as e:
-        raise RuntimeError(f"Failed to create BigQuery client: {e}")
\ No newline at end of file
+        raise RuntimeError(f"Failed to create BigQuery client: {e}")
+
+def get_bigquery_rest_client(credentials_dict: dict, project_id: str) -> BigQueryRestClient:
+    """
+    Creates a lightweight BigQuery client that runs queries through the REST API.
+    It only depends on google-auth, so startup checks don't pay for importing
+    google-cloud-bigquery, pandas and pyarrow.
+
+    Args:
+        credentials_dict (dict): Dictionary containing service account credentials.
+        project_id (str): Google Cloud project ID to run the queries in.
+
+    Returns:
+        BigQueryRestClient: An authenticated REST client instance.
+    """
+    try:
+        from google.auth.transport.requests import AuthorizedSession
+        from google.oauth2 import service_account
+
+        credentials = service_account.Credentials.from_service_account_info(
+            credentials_dict, scopes=[BIGQUERY_SCOPE]
+        )
+        return BigQueryRestClient(AuthorizedSession(credentials), project_id)
+    except Exception as e:
+        raise RuntimeError(f"Failed to create BigQuery REST client: {e}")
+
+class BigQueryApiError(RuntimeError):
+    """ Error response of the BigQuery REST API, with its HTTP status code. """
+
+    def __init__(self, code: int, message: str):
+        super().__init__(f"BigQuery API error {code}: {message}")
+        self.code = code
+
+def is_not_found(error: Exception) -> bool:
+    """ Returns True for the 404 errors of both clients (missing table or dataset). """
+    return getattr(error, "code", None) == 404
+
+class BigQueryRestClient:
+    """ Minimal BigQuery client running parameterized queries through the jobs.query REST API. """
+
+    def __init__(self, session, project_id: str, timeout: float = 60):
+        self.session = session
+        self.project = project_id
+        self.timeout = timeout
+
+    def query_rows(self, query: str, params: dict = None) -> list[dict]:
+        """
+        Runs a query and returns all its rows.
+
+        Args:
+            query (str): Standard SQL query, with named parameters (e.g., @tickers).
+            params (dict): Mapping of parameter name to a (type, value) tuple. Array parameters
+                use a list value and the type of their elements (e.g., ('STRING', ['AAPL'])).
+
+        Returns:
+            list[dict]: Rows as dictionaries of column name to Python value.
+        """
+        body = {
+            "query": query,
+            "useLegacySql": False,
+            "timeoutMs": int(self.timeout * 1000),
+            "formatOptions": {"useInt64Timestamp": True},
+        }
+        if params:
+            body["parameterMode"] = "NAMED"
+            body["queryParameters"] = [_to_query_parameter(name, *param) for name, param in params.items()]
+
+        response = self._request("POST", f"{BIGQUERY_API_URL}/projects/{self.project}/queries", json=body)
+        job = response["jobReference"]
+        deadline = time.monotonic() + self.timeout
+        rows = []
+        while True:
+            if response.get("jobComplete"):
+                fields = response["schema"]["fields"]
+                rows += [_parse_row(row, fields) for row in response.get("rows", [])]
+                if not response.get("pageToken"):
+                    return rows
+                page_params = {"pageToken": response["pageToken"]}
+            elif time.monotonic() > deadline:
+                raise TimeoutError(f"Query {job['jobId']} did not complete in {self.timeout}s")
+            else:
+                page_params = {}
+            response = self._request(
+                "GET",
+                f"{BIGQUERY_API_URL}/projects/{job['projectId']}/queries/{job['jobId']}",
+                params={"location": job.get("location"), "timeoutMs": 10000, "formatOptions.useInt64Timestamp": "true", **page_params},
+            )
+
+    def _request(self, method: str, url: str, **kwargs) -> dict:
+        response = self.session.request(method, url, timeout=self.timeout, **kwargs)
+        if response.status_code >= 400:
+            try:
+                message = response.json()["error"]["message"]
+            except Exception:
+                message = response.text
+            raise BigQueryApiError(response.status_code, message)
+        return response.json()
+
+def _to_query_parameter(name: str, param_type: str, value) -> dict:
+    if isinstance(value, (list, tuple)):
+        return {
+            "name": name,
+            "parameterType": {"type": "ARRAY", "arrayType": {"type": param_type}},
+            "parameterValue": {"arrayValues": [{"value": str(v)} for v in value]},
+        }
+    return {"name": name, "parameterType": {"type": param_type}, "parameterValue": {"value": str(value)}}
+
+def _parse_value(value, field_type: str):
+    if value is None:
+        return None
+    if field_type == "TIMESTAMP":
+        return datetime.fromtimestamp(int(value) / 1e6, tz=timezone.utc)
+    if field_type == "DATE":
+        return date.fromisoformat(value)
+    if field_type == "DATETIME":
+        return datetime.fromisoformat(value)
+    if field_type in ("INTEGER", "INT64"):
+        return int(value)
+    if field_type in ("FLOAT", "FLOAT64"):
+        return float(value)
+    if field_type in ("BOOLEAN", "BOOL"):
+        return value == "true"
+    return value
+
+def _parse_row(row: dict, fields: list) -> dict:
+    return {field["name"]: _parse_value(cell["v"], field["type"]) for cell, field in zip(row["f"], fields)}
+
+def run_query(client, query: str, params: dict = None) -> list[dict]:
+    """
+    Runs a parameterized query with either a bigquery.Client or a BigQueryRestClient.
+
+    Args:
+        client (bigquery.Client | BigQueryRestClient): Authenticated client.
+        query (str): Standard SQL query, with named parameters (e.g., @tickers).
+        params (dict): Mapping of parameter name to a (type, value) tuple, see BigQueryRestClient.query_rows.
+
+    Returns:
+        list[dict]: Rows as dictionaries of column name to Python value.
+    """
+    if isinstance(client, BigQueryRestClient):
+        return client.query_rows(query, params)
+
+    from google.cloud import bigquery
+
+    query_parameters = []
+    for name, (param_type, value) in (params or {}).items():
+        if isinstance(value, (list, tuple)):
+            query_parameters.append(bigquery.ArrayQueryParameter(name, param_type, list(value)))
+        else:
+            query_parameters.append(bigquery.ScalarQueryParameter(name, param_type, value))
+    job_config = bigquery.QueryJobConfig(query_parameters=query_parameters)
+    return [dict(row.items()) for row in client.query(query, job_config=job_config).result()]
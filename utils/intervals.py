@@ -0,0 +1,89 @@
+from datetime import date, datetime, time, timedelta, timezone
+import pytz
+from utils.time import get_current_time_in_new_york, get_last_market_close_date
+from utils.trading_calendar import get_close_time, next_trading_day
+
+NEW_YORK = pytz.timezone("America/New_York")
+
+# Yahoo Finance limits of the intraday intervals: (days back from today that can be requested,
+# days per download window). Windows are kept below the per-request caps, so that a long range
+# is downloaded as several smaller requests in parallel.
+INTRADAY_LIMITS = {
+    '1m': (29, 7),
+    '2m': (59, 15),
+    '5m': (59, 15),
+    '15m': (59, 30),
+    '30m': (59, 30),
+    '90m': (59, 30),
+    '60m': (729, 180),
+    '1h': (729, 180),
+}
+
+INTERVAL_MINUTES = {'1m': 1, '2m': 2, '5m': 5, '15m': 15, '30m': 30, '60m': 60, '90m': 90, '1h': 60}
+
+def is_intraday(interval: str) -> bool:
+    """ Returns True for the intervals shorter than a day (e.g., '5m', '1h'). """
+    return interval in INTRADAY_LIMITS
+
+def get_interval_table_id(table_id: str, interval: str) -> str:
+    """ Returns the table of an interval: daily data keeps the table ID, intraday data gets its own table (e.g., 'stocks_5m'). """
+    if not table_id or not is_intraday(interval):
+        return table_id
+    return f"{table_id}_{interval}"
+
+def get_earliest_start(interval: str, today: date = None) -> date:
+    """ Returns the first day Yahoo Finance serves data of an intraday interval for. """
+    today = today or get_current_time_in_new_york().date()
+    return today - timedelta(days=INTRADAY_LIMITS[interval][0])
+
+def get_download_windows(interval: str, start: date = None, end: date = None, today: date = None) -> list[tuple[date, date]]:
+    """
+    Splits the requested range of an intraday interval into download windows that fit the Yahoo limits.
+
+    Args:
+        interval (str): Intraday interval (e.g., '5m').
+        start (date): First day of the range, clamped to the earliest available day. None requests
+            all the available history.
+        end (date): Day after the last day of the range (exclusive). Default is None (up to today).
+        today (date): Current day in New York. Default is None (now).
+
+    Returns:
+        list[tuple[date, date]]: Consecutive [start, end) windows covering the range.
+    """
+    today = today or get_current_time_in_new_york().date()
+    end = end or today + timedelta(days=1)
+    start = max(start or date.min, get_earliest_start(interval, today))
+    window = timedelta(days=INTRADAY_LIMITS[interval][1])
+
+    windows = []
+    while start < end:
+        windows.append((start, min(start + window, end)))
+        start = windows[-1][1]
+    return windows
+
+def get_intraday_start(latest: datetime, interval: str) -> date | None:
+    """
+    Returns the day to resume the extraction of an intraday interval from, given the latest
+    stored bar, or None if the ticker is up to date. The day of a bar is resumed from the
+    start (its bars are upserted again) unless the bar closes the session.
+
+    Args:
+        latest (datetime): Timestamp of the latest stored bar (naive timestamps are UTC).
+        interval (str): Intraday interval (e.g., '5m').
+    """
+    if isinstance(latest, str):
+        latest = datetime.fromisoformat(latest)
+    elif not isinstance(latest, datetime):
+        latest = datetime.combine(latest, time())
+    if latest.tzinfo is None:
+        latest = latest.replace(tzinfo=timezone.utc)
+    latest = latest.astimezone(NEW_YORK)
+    latest_day = latest.date()
+    close_time = get_close_time(latest_day)
+    bar_end = latest + timedelta(minutes=INTERVAL_MINUTES[interval])
+    session_complete = close_time is not None and (bar_end.date() > latest_day or bar_end.time() >= close_time)
+
+    last_market_close_date = get_last_market_close_date()
+    if latest_day > last_market_close_date or (latest_day == last_market_close_date and session_complete):
+        return None
+    return next_trading_day(latest_day) if session_complete else latest_day
@@ -0,0 +1,236 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+from datetime import date, datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+# Batch states, in pipeline order. 'loaded' and 'empty' batches are not processed again on resume.
+PENDING, FETCHED, TRANSFORMED, LOADED, EMPTY, FAILED = 'pending', 'fetched', 'transformed', 'loaded', 'empty', 'failed'
+DONE_STATES = (LOADED, EMPTY)
+
+def get_run_key(tickers: list, plan_date: date, target: str) -> str:
+    """
+    Identifies the plan of a run: an interrupted run is only resumed by a run with the same
+    ticker universe, last market close date and storage target, so that its batches are still valid.
+    """
+    payload = json.dumps([sorted(tickers), plan_date.isoformat(), target])
+    return hashlib.sha1(payload.encode()).hexdigest()
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+def _encode_batch(batch: dict) -> dict:
+    return {
+        'ticker_buckets': [[start.isoformat() if start else None, tickers] for start, tickers in batch['ticker_buckets'].items()],
+        'missing_tickers': batch['missing_tickers'],
+    }
+
+def _decode_batch(entry: dict) -> dict:
+    return {
+        'ticker_buckets': {date.fromisoformat(start) if start else None: tickers for start, tickers in entry['ticker_buckets']},
+        'missing_tickers': entry['missing_tickers'],
+    }
+
+class RunManifest:
+    """
+    Persistent record of the batches of a run and of the state each one reached
+    (fetched, transformed, loaded), with the date range of its extracted rows.
+
+    The extracted data of a batch is checkpointed to disk until the batch is loaded, so a run
+    interrupted by an exception, a container timeout or a Yahoo outage is resumed from the
+    batches that were not loaded yet, without downloading the fetched ones again.
+    The manifest is rewritten atomically on every state change.
+    """
+
+    def __init__(self, path: str, data: dict, checkpoint_dir: str = None):
+        self.path = path
+        self.checkpoint_dir = checkpoint_dir
+        self._data = data
+        self._lock = threading.Lock()
+
+    @classmethod
+    def create(cls, path: str, batches: list[dict], run_key: str, checkpoint_dir: str = None) -> 'RunManifest':
+        """
+        Starts the manifest of a new run, replacing the one of the previous run.
+
+        Args:
+            path (str): Path of the JSON manifest file.
+            batches (list[dict]): Batches as returned by split_into_batches.
+            run_key (str): Plan identifier, see get_run_key.
+            checkpoint_dir (str): Directory of the checkpointed batch data, disabled when None.
+
+        Returns:
+            RunManifest: Manifest with every batch pending.
+        """
+        if checkpoint_dir:
+            shutil.rmtree(checkpoint_dir, ignore_errors=True)
+        manifest = cls(path, {
+            'run_key': run_key,
+            'status': 'running',
+            'created_at': _now(),
+            'updated_at': _now(),
+            'attempts': 1,
+            'batches': [
+                {'index': i, **_encode_batch(batch), 'state': PENDING, 'rows': None, 'range': None, 'error': None}
+                for i, batch in enumerate(batches, start=1)
+            ],
+        }, checkpoint_dir)
+        with manifest._lock:
+            manifest._save()
+        return manifest
+
+    @classmethod
+    def resume(cls, path: str, run_key: str, checkpoint_dir: str = None) -> 'RunManifest | None':
+        """
+        Loads the manifest of an unfinished run with the same plan.
+
+        Returns:
+            RunManifest | None: The manifest to resume, or None if the previous run finished,
+                was planned for another universe, market close or target, or has no readable manifest.
+        """
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if data.get('status') == 'complete' or data.get('run_key') != run_key:
+            return None
+        manifest = cls(path, data, checkpoint_dir)
+        with manifest._lock:
+            data['status'] = 'running'
+            data['attempts'] = data.get('attempts', 1) + 1
+            manifest._save()
+        return manifest
+
+    def _save(self) -> None:
+        """ Atomically writes the manifest. Caller holds _lock. """
+        self._data['updated_at'] = _now()
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self._data, f, indent=1)
+        os.replace(tmp_path, self.path)
+
+    @property
+    def batches(self) -> list[dict]:
+        """ All batches of the run, in the format of split_into_batches. """
+        return [_decode_batch(entry) for entry in self._data['batches']]
+
+    @property
+    def attempts(self) -> int:
+        return self._data['attempts']
+
+    def is_done(self, index: int) -> bool:
+        """ Whether a batch (1-based index) was loaded, or had nothing to load, in a previous attempt. """
+        return self._data['batches'][index - 1]['state'] in DONE_STATES
+
+    def summary(self) -> dict:
+        """ Returns the number of batches in each state. """
+        with self._lock:
+            counts = {}
+            for entry in self._data['batches']:
+                counts[entry['state']] = counts.get(entry['state'], 0) + 1
+            return counts
+
+    @property
+    def aggregate_range(self) -> tuple | None:
+        """ First and last dates added by the loaded batches whose sector aggregates were not recomputed yet. """
+        with self._lock:
+            date_range = self._data.get('aggregate_range')
+        return tuple(datetime.fromisoformat(d) for d in date_range) if date_range else None
+
+    def add_aggregate_range(self, first, last) -> None:
+        """ Widens the range of dates whose sector aggregates are to be recomputed. """
+        with self._lock:
+            current = self._data.get('aggregate_range')
+            if current:
+                first = min(first, datetime.fromisoformat(current[0]))
+                last = max(last, datetime.fromisoformat(current[1]))
+            self._data['aggregate_range'] = [first.isoformat(), last.isoformat()]
+            self._save()
+
+    def clear_aggregate_range(self) -> None:
+        """ Records that the sector aggregates of the added dates were recomputed. """
+        with self._lock:
+            self._data['aggregate_range'] = None
+            self._save()
+
+    def mark(self, index: int, state: str, rows: int = None, date_range: tuple = None, error=None) -> None:
+        """
+        Records the state reached by a batch.
+
+        Args:
+            index (int): 1-based index of the batch.
+            state (str): New state of the batch.
+            rows (int): Rows of the batch at this state, if known.
+            date_range (tuple): First and last dates of the extracted rows, if known.
+            error: Error that made the batch fail, if any.
+        """
+        with self._lock:
+            entry = self._data['batches'][index - 1]
+            entry['state'] = state
+            if rows is not None:
+                entry['rows'] = rows
+            if date_range is not None:
+                entry['range'] = [str(d)[:10] if d is not None else None for d in date_range]
+            entry['error'] = str(error)[:200] if error else None
+            self._save()
+        if state in DONE_STATES:
+            self.drop_checkpoint(index)
+
+    def _checkpoint_path(self, index: int, name: str) -> str:
+        return os.path.join(self.checkpoint_dir, f"batch-{index:05d}", f"{name}.parquet")
+
+    def save_checkpoint(self, index: int, **frames) -> None:
+        """ Stores the DataFrames of a batch (e.g. raw_stock_df, sector_df) until it is loaded. """
+        if not self.checkpoint_dir:
+            return
+        try:
+            os.makedirs(os.path.dirname(self._checkpoint_path(index, '')), exist_ok=True)
+            for name, df in frames.items():
+                path = self._checkpoint_path(index, name)
+                df.to_parquet(f"{path}.tmp", index=False, compression='zstd')
+                os.replace(f"{path}.tmp", path)
+        except Exception as e:
+            logger.warning(f"Could not checkpoint batch {index}: {e}")
+            self.drop_checkpoint(index)
+
+    def load_checkpoint(self, index: int, names: tuple) -> dict | None:
+        """ Returns the checkpointed DataFrames of a batch, or None if any of them is missing or unreadable. """
+        if not self.checkpoint_dir:
+            return None
+        import pandas as pd
+        try:
+            return {name: pd.read_parquet(self._checkpoint_path(index, name)) for name in names}
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"Unreadable checkpoint of batch {index}, extracting it again: {e}")
+            return None
+
+    def drop_checkpoint(self, index: int) -> None:
+        """ Deletes the checkpointed data of a batch. """
+        if self.checkpoint_dir:
+            shutil.rmtree(os.path.dirname(self._checkpoint_path(index, '')), ignore_errors=True)
+
+    def finish(self) -> bool:
+        """
+        Closes the run: the manifest is marked complete when every batch is done and the sector aggregates
+        are recomputed, otherwise it is kept incomplete (with the checkpoints of the unfinished batches)
+        for the next run to resume.
+
+        Returns:
+            bool: Whether every batch is done and the sector aggregates are recomputed.
+        """
+        with self._lock:
+            complete = all(entry['state'] in DONE_STATES for entry in self._data['batches']) \
+                and not self._data.get('aggregate_range')
+            self._data['status'] = 'complete' if complete else 'incomplete'
+            self._save()
+        if complete and self.checkpoint_dir:
+            shutil.rmtree(self.checkpoint_dir, ignore_errors=True)
+        return complete
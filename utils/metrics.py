@@ -0,0 +1,190 @@
+import importlib
+import json
+import logging
+import os
+import resource
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_stages = {}
+_failures = []
+_values = {}
+_sinks = []
+_started_at = datetime.now(timezone.utc)
+
+def peak_rss_mb() -> float:
+    """ Returns the peak resident set size of the process so far, in MB. """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return round((peak if sys.platform == 'darwin' else peak * 1024) / 1e6, 1)
+
+def record_stage(stage: str, seconds: float, rows_in: int = None, rows_out: int = None, bytes_out: int = None, error: bool = False) -> None:
+    """
+    Adds one execution of a stage to its aggregated metrics.
+
+    Args:
+        stage (str): Dotted stage name (e.g., 'extract.download').
+        seconds (float): Duration of the execution.
+        rows_in (int): Rows received by the stage, if known.
+        rows_out (int): Rows produced by the stage, if known.
+        bytes_out (int): Bytes serialized or transferred by the stage, if known.
+        error (bool): Whether the execution raised an exception.
+    """
+    peak = peak_rss_mb()
+    with _lock:
+        metrics = _stages.setdefault(stage, {
+            'calls': 0, 'errors': 0, 'seconds': 0.0, 'max_seconds': 0.0,
+            'rows_in': 0, 'rows_out': 0, 'bytes_out': 0, 'peak_rss_mb': 0.0,
+        })
+        metrics['calls'] += 1
+        metrics['errors'] += int(error)
+        metrics['seconds'] += seconds
+        metrics['max_seconds'] = max(metrics['max_seconds'], seconds)
+        metrics['rows_in'] += rows_in or 0
+        metrics['rows_out'] += rows_out or 0
+        metrics['bytes_out'] += bytes_out or 0
+        # Process-wide high-water mark when the stage finished (stages may overlap)
+        metrics['peak_rss_mb'] = max(metrics['peak_rss_mb'], peak)
+
+@contextmanager
+def track(stage: str, rows_in: int = None):
+    """
+    Times the enclosed block as one execution of a stage. The yielded dictionary can be
+    used to report 'rows_in', 'rows_out' and 'bytes_out' once they are known.
+
+    Example:
+        with track('transform', rows_in=len(raw_df)) as m:
+            df = transform(raw_df)
+            m['rows_out'] = len(df)
+    """
+    measures = {'rows_in': rows_in, 'rows_out': None, 'bytes_out': None}
+    start = time.perf_counter()
+    error = False
+    try:
+        yield measures
+    except BaseException:
+        error = True
+        raise
+    finally:
+        record_stage(stage, time.perf_counter() - start, error=error, **measures)
+
+def record_failure(ticker: str, stage: str, error) -> None:
+    """ Records a ticker that could not be processed by a stage. """
+    with _lock:
+        _failures.append({'ticker': ticker, 'stage': stage, 'error': str(error)[:200]})
+
+def set_value(name: str, value) -> None:
+    """ Records a run-level value (e.g., the fetch scheduler stats) to include in the report. """
+    with _lock:
+        _values[name] = value
+
+def add_counts(name: str, counts: dict) -> None:
+    """ Adds counts to a run-level dictionary value, summing them across calls (e.g., across batches). """
+    with _lock:
+        totals = _values.setdefault(name, {})
+        for key, count in counts.items():
+            totals[key] = totals.get(key, 0) + count
+
+def reset_metrics() -> None:
+    """ Clears all recorded metrics. """
+    global _started_at
+    with _lock:
+        _stages.clear()
+        _failures.clear()
+        _values.clear()
+        _started_at = datetime.now(timezone.utc)
+
+def build_report(**extra) -> dict:
+    """
+    Builds the run report from the recorded metrics.
+
+    Args:
+        **extra: Additional top-level entries (e.g., status, totals).
+
+    Returns:
+        dict: JSON-serializable report with the run duration, per-stage metrics
+            (slowest first), per-ticker failures and recorded values.
+    """
+    finished_at = datetime.now(timezone.utc)
+    with _lock:
+        stages = {
+            name: {
+                **metrics,
+                'seconds': round(metrics['seconds'], 3),
+                'max_seconds': round(metrics['max_seconds'], 3),
+                'rows_per_sec': int(metrics['rows_out'] / metrics['seconds']) if metrics['seconds'] else None,
+            }
+            for name, metrics in sorted(_stages.items(), key=lambda x: -x[1]['seconds'])
+        }
+        failures = list(_failures)
+        values = dict(_values)
+
+    failures_by_stage = {}
+    for failure in failures:
+        failures_by_stage[failure['stage']] = failures_by_stage.get(failure['stage'], 0) + 1
+    return {
+        'started_at': _started_at.isoformat(),
+        'finished_at': finished_at.isoformat(),
+        'duration_s': round((finished_at - _started_at).total_seconds(), 3),
+        'peak_rss_mb': peak_rss_mb(),
+        **extra,
+        'stages': stages,
+        'failures': {'count': len(failures), 'by_stage': failures_by_stage, 'tickers': failures},
+        'values': values,
+    }
+
+def write_report(report: dict, path: str) -> None:
+    """ Atomically writes a run report as JSON. """
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(report, f, indent=2, default=str)
+    os.replace(tmp_path, path)
+    logger.info(f"Run report written to {path}.")
+
+def log_sink(report: dict) -> None:
+    """ Metrics sink logging a one-line summary per stage. """
+    for name, metrics in report['stages'].items():
+        logger.info(
+            f"[metrics] {name}: {metrics['calls']} call(s), {metrics['seconds']}s, "
+            f"{metrics['rows_in']} -> {metrics['rows_out']} rows, {metrics['bytes_out']} bytes"
+        )
+    logger.info(f"[metrics] {report['failures']['count']} ticker failure(s): {report['failures']['by_stage']}")
+
+def load_sink(spec: str):
+    """
+    Resolves a metrics sink from its spec: 'log' for the built-in log sink, or
+    'package.module:function' for a callable receiving the report dictionary.
+    """
+    if spec == 'log':
+        return log_sink
+    module_name, _, attribute = spec.partition(':')
+    if not attribute:
+        raise ValueError(f"Invalid metrics sink '{spec}', expected 'module:function'.")
+    return getattr(importlib.import_module(module_name), attribute)
+
+def add_sink(sink) -> None:
+    """ Registers a callable that receives the run report when it is published. """
+    _sinks.append(sink)
+
+def configure_sinks(specs: str) -> None:
+    """ Registers the sinks of a comma-separated list of sink specs (see load_sink). """
+    for spec in filter(None, (s.strip() for s in (specs or '').split(','))):
+        try:
+            add_sink(load_sink(spec))
+        except Exception as e:
+            logger.error(f"Could not load metrics sink '{spec}': {e}")
+
+def publish_report(report: dict) -> None:
+    """ Pushes the run report to every registered sink. A failing sink doesn't affect the others. """
+    for sink in _sinks:
+        try:
+            sink(report)
+        except Exception as e:
+            logger.error(f"Metrics sink {getattr(sink, '__name__', sink)} failed: {e}")
@@ -0,0 +1,183 @@
+import json
+import logging
+import os
+import shutil
+from datetime import date, timedelta
+import pandas as pd
+from utils.extract_helpers import to_date
+from utils.time import get_last_market_close_date
+from utils.trading_calendar import next_trading_day
+
+logger = logging.getLogger(__name__)
+
+META_FILE = 'meta.json'
+DATA_FILE = 'data.parquet'
+
+def get_ticker_cache_path(cache_dir: str, ticker: str, interval: str) -> str:
+    """ Returns the Hive-style partition directory of a ticker and interval in the cache. """
+    return os.path.join(cache_dir, f"interval={interval}", f"ticker={ticker}")
+
+def read_cache_meta(cache_dir: str, ticker: str, interval: str) -> dict | None:
+    """
+    Reads the metadata of a cached ticker.
+
+    Returns:
+        dict | None: Dictionary with the cached 'start' and 'end' dates and whether the cache
+            holds the 'full_history' of the ticker. None if the ticker is not cached.
+    """
+    meta_path = os.path.join(get_ticker_cache_path(cache_dir, ticker, interval), META_FILE)
+    try:
+        with open(meta_path) as f:
+            meta = json.load(f)
+        meta['start'] = date.fromisoformat(meta['start'])
+        meta['end'] = date.fromisoformat(meta['end'])
+        return meta
+    except (OSError, ValueError, KeyError):
+        return None
+
+def read_cached_prices(cache_dir: str, ticker: str, interval: str, start: date = None, end: date = None) -> pd.DataFrame:
+    """
+    Reads the cached raw stock data of a ticker, optionally restricted to [start, end).
+    Marks the ticker as recently used for cache eviction.
+    """
+    path = get_ticker_cache_path(cache_dir, ticker, interval)
+    filters = []
+    if start:
+        filters.append(('date', '>=', pd.Timestamp(start)))
+    if end:
+        filters.append(('date', '<', pd.Timestamp(end)))
+    df = pd.read_parquet(os.path.join(path, DATA_FILE), filters=filters or None)
+    os.utime(os.path.join(path, META_FILE))
+    return df
+
+def split_cached_buckets(ticker_buckets: dict, interval: str, cache_dir: str, period: str = 'max', end: str = None) -> tuple[list[pd.DataFrame], dict]:
+    """
+    Serves the overlapping range of each requested ticker from the cache and
+    computes the remaining ranges that have to be downloaded.
+
+    Args:
+        ticker_buckets (dict): Mapping of start date to tickers sharing it (None for full extraction).
+        interval (str): Interval for stock data (e.g., '1d').
+        cache_dir (str): Root directory of the cache.
+        period (str): Period used for the None bucket. Only 'max' can be served from the cache.
+        end (str): End date of the requested data in 'YYYY-MM-DD' format. Default is None.
+
+    Returns:
+        tuple[list[pd.DataFrame], dict]: Tuple containing:
+            - cached_frames: List of DataFrames served from the cache.
+            - network_buckets: Mapping of start date to tickers still to be downloaded.
+    """
+    last_market_close_date = get_last_market_close_date()
+    end = to_date(end)
+    cached_frames = []
+    network_buckets = {}
+    hits = 0
+
+    for start, tickers in ticker_buckets.items():
+        start = to_date(start)
+        for ticker in tickers:
+            meta = read_cache_meta(cache_dir, ticker, interval)
+            covers_start = meta and (
+                meta['full_history'] if start is None
+                else (meta['full_history'] or meta['start'] <= start) and meta['end'] >= start
+            )
+            if not covers_start or (start is None and period != 'max'):
+                network_buckets.setdefault(start, []).append(ticker)
+                continue
+
+            try:
+                cached_frames.append(read_cached_prices(cache_dir, ticker, interval, start, end))
+            except Exception as e:
+                logger.warning(f"Unreadable cache entry for {ticker}, downloading instead: {e}")
+                network_buckets.setdefault(start, []).append(ticker)
+                continue
+            hits += 1
+
+            # Only the missing tail goes to the network
+            tail_start = next_trading_day(meta['end'])
+            if tail_start <= last_market_close_date and (end is None or tail_start < end):
+                network_buckets.setdefault(tail_start, []).append(ticker)
+
+    if hits:
+        logger.info(f"Served {hits} ticker(s) from the price cache.")
+    return cached_frames, network_buckets
+
+def update_cache(df: pd.DataFrame, interval: str, cache_dir: str, requested_start: date = None) -> None:
+    """
+    Merges freshly downloaded raw stock data into the cache, one partition per ticker.
+    Rows after the last market close (e.g. bars of a session still in progress) are not cached.
+
+    Args:
+        df (pd.DataFrame): Raw stock data with 'date' and 'Ticker' columns.
+        interval (str): Interval of the stock data (e.g., '1d').
+        cache_dir (str): Root directory of the cache.
+        requested_start (date): Start date of the download, None for a full history download.
+    """
+    if df.empty:
+        return
+    requested_start = to_date(requested_start)
+    cutoff = pd.Timestamp(get_last_market_close_date() + timedelta(days=1))
+    df = df[df['date'] < cutoff]
+
+    for ticker, ticker_df in df.groupby('Ticker', observed=True, sort=False):
+        ticker_df = ticker_df.dropna(subset=['Close'])
+        if ticker_df.empty:
+            continue
+        try:
+            path = get_ticker_cache_path(cache_dir, ticker, interval)
+            meta = read_cache_meta(cache_dir, ticker, interval)
+            new_start = requested_start or ticker_df['date'].min().date()
+
+            # Merge only contiguous ranges, otherwise the new download replaces the entry
+            if meta and new_start <= next_trading_day(meta['end']) and (meta['full_history'] or requested_start is None or meta['start'] <= new_start):
+                cached_df = pd.read_parquet(os.path.join(path, DATA_FILE))
+                ticker_df = pd.concat([cached_df, ticker_df], ignore_index=True)
+                ticker_df = ticker_df.drop_duplicates(subset=['date'], keep='last').sort_values('date')
+                full_history = meta['full_history'] or requested_start is None
+                start = min(meta['start'], new_start)
+            else:
+                full_history = requested_start is None
+                start = new_start
+
+            os.makedirs(path, exist_ok=True)
+            ticker_df.to_parquet(os.path.join(path, DATA_FILE), index=False, compression='zstd')
+            with open(os.path.join(path, META_FILE), 'w') as f:
+                json.dump({
+                    'start': start.isoformat(),
+                    'end': ticker_df['date'].max().date().isoformat(),
+                    'full_history': full_history,
+                }, f)
+        except Exception as e:
+            logger.warning(f"Could not cache data for {ticker}: {e}")
+
+def evict_cache(cache_dir: str, max_bytes: int) -> int:
+    """
+    Evicts the least recently used tickers until the cache fits in max_bytes.
+
+    Args:
+        cache_dir (str): Root directory of the cache.
+        max_bytes (int): Maximum size of the cache in bytes.
+
+    Returns:
+        int: Number of evicted ticker entries.
+    """
+    entries = []
+    total_size = 0
+    for root, _, files in os.walk(cache_dir):
+        if META_FILE not in files:
+            continue
+        size = sum(os.path.getsize(os.path.join(root, f)) for f in files)
+        entries.append((os.path.getmtime(os.path.join(root, META_FILE)), size, root))
+        total_size += size
+
+    evicted = 0
+    for _, size, path in sorted(entries):
+        if total_size <= max_bytes:
+            break
+        shutil.rmtree(path, ignore_errors=True)
+        total_size -= size
+        evicted += 1
+
+    if evicted:
+        logger.info(f"Evicted {evicted} ticker(s) from the price cache ({total_size / 1e6:.1f} MB kept).")
+    return evicted
@@ -0,0 +1,35 @@
+import importlib
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+_import_times = {}
+
+def timed_import(module_name: str):
+    """
+    Imports a module and records how long the import took, for the import-time report.
+
+    Args:
+        module_name (str): Dotted module name (e.g., 'etl.pipeline').
+
+    Returns:
+        module: The imported module.
+    """
+    start = time.perf_counter()
+    module = importlib.import_module(module_name)
+    _import_times[module_name] = _import_times.get(module_name, 0) + time.perf_counter() - start
+    return module
+
+def record_import_time(label: str, seconds: float) -> None:
+    """ Records the time spent on a group of imports (e.g. the eager imports of main.py). """
+    _import_times[label] = _import_times.get(label, 0) + seconds
+
+def get_import_report() -> dict:
+    """ Returns the recorded import times in seconds, slowest first. """
+    return {name: round(seconds, 3) for name, seconds in sorted(_import_times.items(), key=lambda x: -x[1])}
+
+def log_import_report() -> None:
+    """ Logs the recorded import times. Use `python -X importtime main.py` for a per-module breakdown. """
+    report = get_import_report()
+    logger.info(f"Import times (total {sum(report.values()):.3f}s): {report}")
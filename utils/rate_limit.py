@@ -0,0 +1,150 @@
+import logging
+import random
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+THROTTLE_MARKERS = ('ratelimit', 'rate limit', 'too many requests', '429')
+TRANSIENT_MARKERS = ('timed out', 'timeout', 'connection', 'temporarily', '502', '503', '504')
+
+def is_throttle_error(error: Exception | str) -> bool:
+    """ Returns True if an error (or error message) means the provider is throttling us. """
+    text = f"{type(error).__name__} {error}".lower() if isinstance(error, Exception) else str(error).lower()
+    return any(marker in text for marker in THROTTLE_MARKERS)
+
+def is_retryable_error(error: Exception | str) -> bool:
+    """ Returns True if an error is worth retrying (throttling or a transient network failure). """
+    text = f"{type(error).__name__} {error}".lower() if isinstance(error, Exception) else str(error).lower()
+    return is_throttle_error(error) or any(marker in text for marker in TRANSIENT_MARKERS)
+
+class FetchScheduler:
+    """
+    Schedules calls to a rate-limited provider. Combines a token bucket rate limit,
+    retries with exponential backoff and jitter, and an adaptive concurrency limit
+    that halves on throttling or errors and grows back by one after a run of successes.
+    """
+
+    def __init__(
+        self,
+        rate_per_second: float = 2.0,
+        burst: int = 5,
+        max_concurrency: int = 8,
+        min_concurrency: int = 1,
+        max_retries: int = 4,
+        base_delay: float = 1.0,
+        max_delay: float = 60.0,
+        ramp_up_after: int = 10
+    ):
+        self.max_rate = rate_per_second
+        self.rate = rate_per_second
+        self.burst = burst
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.ramp_up_after = ramp_up_after
+
+        self._tokens = float(burst)
+        self._last_refill = time.monotonic()
+        self._in_flight = 0
+        self._streak = 0
+        self._cond = threading.Condition()
+        self.counters = {'calls': 0, 'successes': 0, 'retries': 0, 'throttles': 0, 'errors': 0, 'failures': 0}
+
+    def _acquire(self) -> None:
+        """ Blocks until a concurrency slot and a rate limit token are available. """
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._last_refill) * self.rate)
+                self._last_refill = now
+                if self._in_flight < self.concurrency and self._tokens >= 1:
+                    self._tokens -= 1
+                    self._in_flight += 1
+                    self.counters['calls'] += 1
+                    return
+                wait = (1 - self._tokens) / self.rate if self._tokens < 1 else None
+                self._cond.wait(timeout=wait)
+
+    def _release(self) -> None:
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify_all()
+
+    def record_success(self) -> None:
+        """ Ramps concurrency and rate back up after a run of successful calls. """
+        with self._cond:
+            self.counters['successes'] += 1
+            self._streak += 1
+            if self._streak >= self.ramp_up_after:
+                self._streak = 0
+                self.concurrency = min(self.max_concurrency, self.concurrency + 1)
+                self.rate = min(self.max_rate, self.rate * 1.25)
+                self._cond.notify_all()
+
+    def record_failure(self, throttled: bool) -> None:
+        """ Backs off after an error: halves concurrency, and also the rate when throttled. """
+        with self._cond:
+            self._streak = 0
+            self.counters['throttles' if throttled else 'errors'] += 1
+            self.concurrency = max(self.min_concurrency, self.concurrency // 2)
+            if throttled:
+                self.rate = max(self.max_rate / 16, self.rate / 2)
+
+    def backoff(self, attempt: int) -> None:
+        """ Sleeps before a retry, using exponential backoff with full jitter. """
+        with self._cond:
+            self.counters['retries'] += 1
+        time.sleep(random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt)))
+
+    def call(self, fn, *args, **kwargs):
+        """
+        Calls fn under the rate and concurrency limits, retrying retryable errors.
+
+        Args:
+            fn (callable): Function to call.
+            *args, **kwargs: Arguments for fn.
+
+        Returns:
+            The result of fn.
+
+        Raises:
+            Exception: The last error raised by fn, if it is not retryable or retries are exhausted.
+        """
+        for attempt in range(self.max_retries + 1):
+            self._acquire()
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                self._release()
+                self.record_failure(is_throttle_error(e))
+                if attempt == self.max_retries or not is_retryable_error(e):
+                    with self._cond:
+                        self.counters['failures'] += 1
+                    raise
+                logger.warning(f"Retrying {getattr(fn, '__name__', 'call')} after error (attempt {attempt + 1}): {e}")
+                self.backoff(attempt)
+                continue
+            self._release()
+            self.record_success()
+            return result
+
+    def stats(self) -> dict:
+        """ Returns a snapshot of the counters and the current limits. """
+        with self._cond:
+            return {**self.counters, 'concurrency': self.concurrency, 'rate_per_second': round(self.rate, 3)}
+
+_scheduler = FetchScheduler()
+
+def configure_scheduler(**kwargs) -> FetchScheduler:
+    """ Replaces the shared scheduler with one built from the given FetchScheduler arguments. """
+    global _scheduler
+    _scheduler = FetchScheduler(**kwargs)
+    return _scheduler
+
+def get_scheduler() -> FetchScheduler:
+    """ Returns the scheduler shared by all Yahoo Finance fetches. """
+    return _scheduler
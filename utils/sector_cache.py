@@ -0,0 +1,217 @@
+import csv
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
+from config.build_universe import normalize_symbol
+from utils.metrics import record_failure
+
+logger = logging.getLogger(__name__)
+
+SYMBOLS_CSV_PATH = 'config/nasdaq_symbols.csv'
+
+_lock = threading.Lock()
+_caches = {}
+_csv_sectors = {}
+_refresh_executor = None
+_refresh_futures = []
+_refreshing = set()
+# Sectors refreshed in the background and not yet written to the sectors table
+_refreshed = {}
+
+def load_csv_sectors(csv_path: str = SYMBOLS_CSV_PATH) -> dict:
+    """
+    Loads the sectors available in the NASDAQ symbols file.
+
+    Args:
+        csv_path (str): Path to the symbols CSV file with 'Symbol' and 'Sector' columns.
+
+    Returns:
+        dict: Mapping of ticker to sector for the symbols with a known sector.
+    """
+    with _lock:
+        if csv_path not in _csv_sectors:
+            sectors = {}
+            try:
+                with open(csv_path, newline='') as f:
+                    for row in csv.DictReader(f):
+                        if row.get('Symbol') and row.get('Sector'):
+                            sectors[normalize_symbol(row['Symbol'])] = row['Sector'].strip()
+            except OSError as e:
+                logger.warning(f"Could not read sectors from {csv_path}: {e}")
+            _csv_sectors[csv_path] = sectors
+        return _csv_sectors[csv_path]
+
+def _load_cache(cache_path: str) -> dict:
+    """ Returns the in-memory copy of a persistent sector cache, reading it on first use. Caller holds _lock. """
+    if cache_path not in _caches:
+        try:
+            with open(cache_path) as f:
+                _caches[cache_path] = json.load(f)
+        except (OSError, ValueError):
+            _caches[cache_path] = {}
+    return _caches[cache_path]
+
+def _save_cache(cache_path: str) -> None:
+    """ Atomically writes a persistent sector cache to disk. Caller holds _lock. """
+    os.makedirs(os.path.dirname(cache_path) or '.', exist_ok=True)
+    tmp_path = f"{cache_path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(_caches[cache_path], f)
+    os.replace(tmp_path, cache_path)
+
+def _store(cache_path: str, results: dict) -> None:
+    """ Stores fetched sectors in the persistent cache. """
+    if not results:
+        return
+    now = time.time()
+    with _lock:
+        cache = _load_cache(cache_path)
+        for ticker, sector in results.items():
+            cache[ticker] = {'sector': sector, 'updated_at': now}
+        _save_cache(cache_path)
+
+def _fetch_many(tickers: list, fetch_fn, max_workers: int) -> dict:
+    """ Fetches sectors concurrently, skipping the tickers whose lookup fails. """
+    results = {}
+    if not tickers:
+        return results
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(tickers))) as executor:
+        future_to_ticker = {executor.submit(fetch_fn, ticker): ticker for ticker in tickers}
+        for future in as_completed(future_to_ticker):
+            ticker = future_to_ticker[future]
+            try:
+                results[ticker] = future.result() or 'N/A'
+            except Exception as e:
+                logger.error(f"Error fetching sector data for {ticker}: {e}")
+                record_failure(ticker, 'extract.sectors', e)
+    return results
+
+def _refresh_in_background(tickers: list, fetch_fn, cache_path: str, max_workers: int) -> None:
+    """ Schedules the refresh of stale cache entries without blocking the caller. """
+    global _refresh_executor
+    with _lock:
+        tickers = [t for t in tickers if t not in _refreshing]
+        if not tickers:
+            return
+        _refreshing.update(tickers)
+        if _refresh_executor is None:
+            _refresh_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='sector-refresh')
+
+    def refresh():
+        try:
+            results = _fetch_many(tickers, fetch_fn, max_workers)
+            _store(cache_path, results)
+            with _lock:
+                _refreshed.update(results)
+        finally:
+            with _lock:
+                _refreshing.difference_update(tickers)
+
+    _refresh_futures.append(_refresh_executor.submit(refresh))
+
+def wait_for_sector_refresh(timeout: float = None) -> None:
+    """ Waits for the background refresh of stale sector cache entries to finish. """
+    if _refresh_futures:
+        wait(list(_refresh_futures), timeout=timeout)
+
+def pop_refreshed_sectors() -> dict:
+    """ Returns the sectors refreshed in the background since the last call, to be written to the sectors table. """
+    with _lock:
+        refreshed = dict(_refreshed)
+        _refreshed.clear()
+    return refreshed
+
+def _is_stale(cache: dict, ticker: str, ttl_days: float) -> bool:
+    return ticker in cache and cache[ticker]['updated_at'] < time.time() - ttl_days * 86400
+
+def refresh_stale_sectors(
+    tickers: list,
+    fetch_fn,
+    cache_path: str,
+    ttl_days: float = 30,
+    csv_path: str = SYMBOLS_CSV_PATH,
+    max_workers: int = 15
+) -> int:
+    """
+    Refreshes in the background the cache entries of tickers older than the TTL, including the
+    tickers already in the sectors table (which resolve_sectors never sees). Tickers of the symbols
+    file are not cached and never refreshed. See pop_refreshed_sectors for the results.
+
+    Args:
+        tickers (list): Tickers to check.
+        fetch_fn (callable): Function returning the sector of a ticker. Raises on failure.
+        cache_path (str): Path to the persistent JSON cache.
+        ttl_days (float): Days after which a cache entry is refreshed. Default is 30.
+        csv_path (str): Path to the NASDAQ symbols file. Default is 'config/nasdaq_symbols.csv'.
+        max_workers (int): Maximum number of concurrent fetches. Default is 15.
+
+    Returns:
+        int: Number of stale entries scheduled for refresh.
+    """
+    csv_sectors = load_csv_sectors(csv_path) if csv_path else {}
+    with _lock:
+        cache = _load_cache(cache_path)
+        stale = [t for t in tickers if t not in csv_sectors and _is_stale(cache, t, ttl_days)]
+    if stale:
+        logger.info(f"Refreshing {len(stale)} stale cached sector(s) in the background.")
+        _refresh_in_background(stale, fetch_fn, cache_path, max_workers)
+    return len(stale)
+
+def resolve_sectors(
+    tickers: list,
+    fetch_fn,
+    cache_path: str = None,
+    ttl_days: float = 30,
+    csv_path: str = SYMBOLS_CSV_PATH,
+    max_workers: int = 15
+) -> list[dict]:
+    """
+    Resolves the sector of each ticker from the cheapest source available:
+    the NASDAQ symbols file first, then the persistent local cache, and only then
+    the (slow) fetch function. Stale cache entries are returned as they are and
+    refreshed in the background (see pop_refreshed_sectors).
+
+    Args:
+        tickers (list): List of tickers to resolve.
+        fetch_fn (callable): Function returning the sector of a ticker. Raises on failure.
+        cache_path (str): Path to the persistent JSON cache. Default is None (no cache).
+        ttl_days (float): Days after which a cache entry is refreshed. Default is 30.
+        csv_path (str): Path to the NASDAQ symbols file. Default is 'config/nasdaq_symbols.csv'.
+        max_workers (int): Maximum number of concurrent fetches. Default is 15.
+
+    Returns:
+        list[dict]: List of {'ticker', 'sector'} dictionaries. Tickers whose lookup fails get 'N/A'.
+    """
+    csv_sectors = load_csv_sectors(csv_path) if csv_path else {}
+    resolved = {}
+    stale = []
+    unresolved = []
+
+    with _lock:
+        cache = _load_cache(cache_path) if cache_path else {}
+        for ticker in tickers:
+            if ticker in csv_sectors:
+                resolved[ticker] = csv_sectors[ticker]
+            elif ticker in cache:
+                resolved[ticker] = cache[ticker]['sector']
+                if _is_stale(cache, ticker, ttl_days):
+                    stale.append(ticker)
+            else:
+                unresolved.append(ticker)
+
+    logger.info(
+        f"Sectors resolved: {len(resolved) - len(stale)} fresh, {len(stale)} stale, "
+        f"{len(unresolved)} to fetch."
+    )
+
+    fetched = _fetch_many(unresolved, fetch_fn, max_workers)
+    if cache_path:
+        _store(cache_path, fetched)
+        if stale:
+            _refresh_in_background(stale, fetch_fn, cache_path, max_workers)
+    resolved.update(fetched)
+
+    return [{'ticker': ticker, 'sector': resolved.get(ticker, 'N/A')} for ticker in tickers]
@@ -0,0 +1,83 @@
+import heapq
+import os
+
+# First year of the daily history served by Yahoo Finance: listings older than it, or with an
+# unknown IPO year, are weighted with the whole history
+HISTORY_START_YEAR = 1962
+
+def get_history_weights(tickers: list, ipo_years: dict, current_year: int) -> list[int]:
+    """
+    Estimates the extraction cost of each ticker from the length of its history, in years since
+    its IPO, plus one for the request itself (so that young listings don't count as free).
+
+    Args:
+        tickers (list): Tickers to weigh.
+        ipo_years (dict): Mapping of ticker to IPO year, see config.universe.get_ipo_years.
+        current_year (int): Year the history ends in.
+
+    Returns:
+        list[int]: Weight of each ticker.
+    """
+    return [
+        1 + max(current_year - max(ipo_years.get(ticker) or HISTORY_START_YEAR, HISTORY_START_YEAR), 0)
+        for ticker in tickers
+    ]
+
+def split_into_shards(tickers: list, weights: list, count: int) -> list[list]:
+    """
+    Splits tickers into `count` shards of similar total weight: tickers are assigned from the
+    heaviest to the lightest, each one to the shard with the lowest weight so far. Ties are broken
+    by ticker and shard index, so every task computes the same split from the same inputs.
+
+    Args:
+        tickers (list): Tickers to split, without duplicates.
+        weights (list): Weight of each ticker, see get_history_weights.
+        count (int): Number of shards.
+
+    Returns:
+        list[list]: Tickers of each shard, in their order in `tickers`.
+    """
+    if count <= 0:
+        raise ValueError("Shard count must be a positive integer.")
+
+    loads = [(0, shard) for shard in range(count)]
+    assignment = [0] * len(tickers)
+    for position in sorted(range(len(tickers)), key=lambda p: (-weights[p], tickers[p])):
+        load, shard = heapq.heappop(loads)
+        assignment[position] = shard
+        heapq.heappush(loads, (load + weights[position], shard))
+
+    shards = [[] for _ in range(count)]
+    for ticker, shard in zip(tickers, assignment):
+        shards[shard].append(ticker)
+    return shards
+
+def get_shard(tickers: list, ipo_years: dict, current_year: int, task_index: int, task_count: int) -> list:
+    """
+    Returns the tickers processed by one task of a sharded run.
+
+    Args:
+        tickers (list): Tickers of the whole universe.
+        ipo_years (dict): Mapping of ticker to IPO year.
+        current_year (int): Year the history ends in.
+        task_index (int): Index of the task (CLOUD_RUN_TASK_INDEX).
+        task_count (int): Number of tasks (CLOUD_RUN_TASK_COUNT).
+
+    Returns:
+        list: Tickers of the task's shard, all of them when there is a single task.
+
+    Raises:
+        ValueError: If the task index is not in [0, task_count).
+    """
+    if not 0 <= task_index < task_count:
+        raise ValueError(f"Task index {task_index} is out of range for {task_count} task(s).")
+    if task_count == 1:
+        return list(tickers)
+    return split_into_shards(tickers, get_history_weights(tickers, ipo_years, current_year), task_count)[task_index]
+
+def get_task_path(path: str, task_index: int, task_count: int) -> str:
+    """ Returns the per-task variant of a state path (e.g. 'run_manifest.task-2.json'), the path itself for a single task. """
+    if not path or task_count == 1:
+        return path
+    root, ext = os.path.splitext(path)
+    return f"{root}.task-{task_index}{ext}"
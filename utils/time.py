@@ -1,6 +1,6 @@
 from datetime import datetime, date, timedelta
-from google.cloud import bigquery
 import pytz
+from utils.trading_calendar import get_close_time, previous_trading_day
 
 def get_current_time_in_new_york() -> datetime:
     TIMEZONE = "America/New_York"
@@ -15,15 +15,13 @@ def adjust_to_business_day(date: date) -> date:
         return date - timedelta(days=2)
     return date
 
-def get_last_market_close_date() -> date:
-    """ Returns the last market close date based on the current time in New York timezone."""
-    now = get_current_time_in_new_york()
+def get_last_market_close_date(now: datetime = None) -> date:
+    """ Returns the last market close date based on the current time in New York timezone.
+    Holidays and early closes are taken from the exchange trading calendar. """
+    now = now or get_current_time_in_new_york()
     today = now.date()
 
-    if now.time() < datetime.strptime("16:00:00", "%H:%M:%S").time():
-        reference_date = today - timedelta(days=1)
-    else:
-        reference_date = today
-
-    return adjust_to_business_day(reference_date)
-    
\ No newline at end of file
+    close_time = get_close_time(today)
+    if close_time and now.time() >= close_time:
+        return today
+    return previous_trading_day(today)
@@ -0,0 +1,100 @@
+from datetime import date, time, timedelta
+from functools import lru_cache
+
+# NYSE/NASDAQ regular and early close times (America/New_York)
+REGULAR_CLOSE = time(16, 0)
+EARLY_CLOSE = time(13, 0)
+
+# Unscheduled closures (national days of mourning, weather and other emergencies)
+SPECIAL_CLOSURES = {
+    date(2001, 9, 11), date(2001, 9, 12), date(2001, 9, 13), date(2001, 9, 14),
+    date(2004, 6, 11),
+    date(2007, 1, 2),
+    date(2012, 10, 29), date(2012, 10, 30),
+    date(2018, 12, 5),
+    date(2025, 1, 9),
+}
+
+def _easter_sunday(year: int) -> date:
+    """ Computes Easter Sunday with the anonymous Gregorian algorithm. """
+    a = year % 19
+    b, c = divmod(year, 100)
+    d, e = divmod(b, 4)
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    month, day = divmod(h + l - 7 * m + 114, 31)
+    return date(year, month, day + 1)
+
+def _nth_weekday(year: int, month: int, weekday: int, n: int) -> date:
+    """ Returns the n-th given weekday (0 = Monday) of a month, or the last one if n is -1. """
+    if n > 0:
+        first = date(year, month, 1)
+        return first + timedelta(days=(weekday - first.weekday()) % 7 + 7 * (n - 1))
+    last = date(year + month // 12, month % 12 + 1, 1) - timedelta(days=1)
+    return last - timedelta(days=(last.weekday() - weekday) % 7)
+
+def _observed(holiday: date) -> date:
+    """ Moves a holiday falling on a weekend to the closest weekday. """
+    if holiday.weekday() == 5:
+        return holiday - timedelta(days=1)
+    if holiday.weekday() == 6:
+        return holiday + timedelta(days=1)
+    return holiday
+
+@lru_cache(maxsize=None)
+def get_holidays(year: int) -> frozenset:
+    """ Returns the full-day market holidays of a year. """
+    holidays = {
+        _nth_weekday(year, 2, 0, 3),                 # Washington's Birthday
+        _easter_sunday(year) - timedelta(days=2),    # Good Friday
+        _nth_weekday(year, 5, 0, -1),                # Memorial Day
+        _observed(date(year, 7, 4)),                 # Independence Day
+        _nth_weekday(year, 9, 0, 1),                 # Labor Day
+        _nth_weekday(year, 11, 3, 4),                # Thanksgiving Day
+        _observed(date(year, 12, 25)),               # Christmas Day
+    }
+    # New Year's Day is not moved back to Friday when it falls on a Saturday
+    if date(year, 1, 1).weekday() != 5:
+        holidays.add(_observed(date(year, 1, 1)))
+    if year >= 1998:
+        holidays.add(_nth_weekday(year, 1, 0, 3))    # Martin Luther King Jr. Day
+    if year >= 2022:
+        holidays.add(_observed(date(year, 6, 19)))   # Juneteenth
+    holidays.update(d for d in SPECIAL_CLOSURES if d.year == year)
+    return frozenset(holidays)
+
+@lru_cache(maxsize=None)
+def get_early_closes(year: int) -> frozenset:
+    """ Returns the days of a year on which the market closes at 13:00. """
+    early_closes = {_nth_weekday(year, 11, 3, 4) + timedelta(days=1)}  # Day after Thanksgiving
+    # Day before Independence Day and Christmas Eve, when they fall Monday to Thursday
+    early_closes.update(d for d in (date(year, 7, 3), date(year, 12, 24)) if d.weekday() < 4)
+    return frozenset(early_closes - get_holidays(year))
+
+def is_trading_day(day: date) -> bool:
+    """ Returns True if the market is open on the given day. """
+    return day.weekday() < 5 and day not in get_holidays(day.year)
+
+def get_close_time(day: date) -> time | None:
+    """ Returns the market close time of a day, or None if the market is closed. """
+    if not is_trading_day(day):
+        return None
+    return EARLY_CLOSE if day in get_early_closes(day.year) else REGULAR_CLOSE
+
+def next_trading_day(day: date) -> date:
+    """ Returns the first trading day strictly after the given day. """
+    day += timedelta(days=1)
+    while not is_trading_day(day):
+        day += timedelta(days=1)
+    return day
+
+def previous_trading_day(day: date) -> date:
+    """ Returns the last trading day strictly before the given day. """
+    day -= timedelta(days=1)
+    while not is_trading_day(day):
+        day -= timedelta(days=1)
+    return day
@@ -1,5 +1,10 @@
+from __future__ import annotations
 import os
-from google.cloud import bigquery
+from typing import TYPE_CHECKING
+from utils.google_cloud import run_query
+
+if TYPE_CHECKING:
+    from google.cloud import bigquery
 
 def check_existing_tickers(table_id: str, client: bigquery.Client, tickers: list) -> list:
     """
@@ -7,7 +12,7 @@ def check_existing_tickers(table_id: str, client: bigquery.Client, tickers: list
 
     Args:
         table_id (str): Full table ID in BigQuery (e.g., `project.dataset.table`).
-        client (bigquery.Client): Authenticated BigQuery client.
+        client (bigquery.Client): Authenticated BigQuery client (or BigQueryRestClient).
         tickers (list): List of tickers to check.
 
     Returns:
@@ -19,14 +24,8 @@ def check_existing_tickers(table_id: str, client: bigquery.Client, tickers: list
             FROM `{table_id}`
             WHERE ticker IN UNNEST(@tickers)
         """
-        job_config = bigquery.QueryJobConfig(
-            query_parameters=[
-                bigquery.ArrayQueryParameter("tickers", "STRING", tickers)
-            ]
-        )
-        query_job = client.query(query, job_config=job_config)
-        results = query_job.result()
-        return [row.ticker for row in results]
+        results = run_query(client, query, {"tickers": ("STRING", tickers)})
+        return [row['ticker'] for row in results]
     except Exception:
         return []
     